@@ -13,15 +13,40 @@ echo "Creating directories..."
 sudo mkdir -p /etc/wyoming
 sudo mkdir -p /usr/local/bin/wyoming
 sudo mkdir -p /var/log/wyoming
+sudo mkdir -p /var/lib/wyoming
+# Benchmark results are written by the admin user
+sudo install -d -o admin -g admin /var/lib/wyoming/bench
 
 # Copy files to system locations
 echo "Copying files..."
 sudo cp config/config.yaml /usr/local/bin/wyoming/
 sudo cp scripts/setup.py /usr/local/bin/wyoming/
+sudo cp scripts/system_packages.py /usr/local/bin/wyoming/
+sudo cp scripts/step_graph.py /usr/local/bin/wyoming/
+sudo cp scripts/venv_snapshot.py /usr/local/bin/wyoming/
+sudo cp scripts/repo_fetch.py /usr/local/bin/wyoming/
+sudo cp scripts/venv_dedup.py /usr/local/bin/wyoming/
+sudo cp scripts/precompile.py /usr/local/bin/wyoming/
+sudo cp scripts/audio_devices.py /usr/local/bin/wyoming/
+sudo cp scripts/audio_watch.py /usr/local/bin/wyoming/
+sudo cp scripts/mic_ring.py /usr/local/bin/wyoming/
 sudo cp scripts/configure.py /usr/local/bin/wyoming/
+sudo cp scripts/reload_config.py /usr/local/bin/wyoming/
 sudo cp scripts/service_setup.sh /usr/local/bin/wyoming/
 sudo cp scripts/run-wakeword.py /usr/local/bin/wyoming/
+sudo cp scripts/wakeword_service.py /usr/local/bin/wyoming/
 sudo cp scripts/run-satellite.py /usr/local/bin/wyoming/
+sudo cp scripts/liveness.py /usr/local/bin/wyoming/
+sudo cp scripts/log_buffer.py /usr/local/bin/wyoming/
+sudo cp scripts/thermal_governor.py /usr/local/bin/wyoming/
+sudo cp scripts/metrics_exporter.py /usr/local/bin/wyoming/
+sudo cp scripts/wyoming_commands.py /usr/local/bin/wyoming/
+sudo cp scripts/supervisor.py /usr/local/bin/wyoming/
+sudo cp scripts/wyoming_tap.py /usr/local/bin/wyoming/
+sudo cp scripts/vad_gate.py /usr/local/bin/wyoming/
+sudo cp scripts/playback_sink.py /usr/local/bin/wyoming/
+sudo cp scripts/service_profile.py /usr/local/bin/wyoming/
+sudo cp scripts/benchmark.py /usr/local/bin/wyoming/
 
 # Make scripts executable
 echo "Making scripts executable..."
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""Enumerate ALSA capture/playback devices straight from /proc/asound.
+
+Reading procfs replaces forking ``arecord -l``/``aplay -l`` and parsing
+their human-readable output. USB cards also expose their supported
+formats, channel counts and rates through ``stream*`` files, which are
+returned as structured capabilities. ``asound_root`` can point at a fake
+tree for testing.
+
+Devices are ranked by how well their native hardware parameters match the
+stream the satellite needs, so the generated arecord/aplay commands can
+open the raw ``hw:`` device and skip the plug layer's CPU resampling
+whenever the hardware allows it. Successful probes are kept in
+/var/lib/wyoming/hw-params.json, so a device that is busy later (held by the
+running satellite when audio_watch rescans) is still scored on its own
+parameters instead of losing to whatever is free.
+"""
+import argparse
+import json
+import logging
+import re
+import subprocess
+import threading
+from pathlib import Path
+
+logger = logging.getLogger('wyoming-setup.audio')
+
+ASOUND_ROOT = Path('/proc/asound')
+PROBE_CACHE = Path('/var/lib/wyoming/hw-params.json')
+# aplay/arecord print the hw params between two of these lines
+DUMP_SEPARATOR = '--------------------'
+
+# What the satellite reads from the mic command and writes to the speaker command
+MIC_TARGET = {'rate': 16000, 'format': 'S16_LE', 'channels': 1}
+SPEAKER_TARGET = {'rate': 22050, 'format': 'S16_LE', 'channels': 1}
+
+# Name preference used to break ties: M-Audio > Focusrite > Other USB > Built-in
+PRIORITY_KEYWORDS = ['M-Track', 'Scarlett', 'USB']
+
+CARD_LINE = re.compile(r'^\s*(\d+)\s+\[(.*?)\s*\]:\s*(\S+)\s+-\s+(.*)$')
+PCM_DIR = re.compile(r'^pcm(\d+)([cp])$')
+
+def read_text(path):
+    try:
+        with open(path) as f:
+            return f.read()
+    except OSError:
+        return ''
+
+def parse_cards(text):
+    """Parse /proc/asound/cards into {card_number: {'id', 'driver', 'name', 'longname'}}"""
+    cards = {}
+    lines = text.splitlines()
+    for index, line in enumerate(lines):
+        match = CARD_LINE.match(line)
+        if not match:
+            continue
+        number, card_id, driver, name = match.groups()
+        longname = lines[index + 1].strip() if index + 1 < len(lines) else ''
+        cards[int(number)] = {'id': card_id, 'driver': driver, 'name': name.strip(), 'longname': longname}
+    return cards
+
+def parse_info(text):
+    """Parse a pcm*/info file into a dict"""
+    info = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(':')
+        if sep:
+            info[key.strip()] = value.strip()
+    return info
+
+def parse_rates(value):
+    """Parse a stream file 'Rates:' value into (list_of_rates, continuous_range_or_None)"""
+    match = re.match(r'(\d+)\s*-\s*(\d+)\s*\(continuous\)', value)
+    if match:
+        low, high = int(match.group(1)), int(match.group(2))
+        return [], (low, high)
+    return [int(rate) for rate in re.findall(r'\d+', value)], None
+
+def parse_stream(text):
+    """Parse a USB stream* file into {'playback': [altset...], 'capture': [altset...]}
+
+    Each altset is a dict with 'formats', 'channels', 'rates', 'rate_range'
+    and 'bits' as reported by the USB audio driver.
+    """
+    streams = {'playback': [], 'capture': []}
+    direction = None
+    current = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if stripped in ('Playback:', 'Capture:'):
+            direction = stripped[:-1].lower()
+            current = None
+            continue
+        if direction is None:
+            continue
+        key, sep, value = stripped.partition(':')
+        if not sep:
+            continue
+        value = value.strip()
+        if key == 'Altset':
+            current = None
+        if key == 'Format':
+            current = {'formats': value.split(), 'channels': None, 'rates': [],
+                       'rate_range': None, 'bits': None}
+            streams[direction].append(current)
+        elif current is not None and key == 'Channels':
+            current['channels'] = int(value.split()[0])
+        elif current is not None and key == 'Rates':
+            current['rates'], current['rate_range'] = parse_rates(value)
+        elif current is not None and key == 'Bits':
+            current['bits'] = int(value.split()[0])
+    return streams
+
+def enumerate_devices(asound_root=ASOUND_ROOT):
+    """Return every PCM device as a list of dicts
+
+    Each entry has 'hw' (e.g. 'hw:1,0'), 'direction' ('capture' or
+    'playback'), card/device numbers, ids and names, and 'capabilities'
+    (the USB stream altsets for that direction, empty for non-USB cards).
+    """
+    asound_root = Path(asound_root)
+    cards = parse_cards(read_text(asound_root / 'cards'))
+    devices = []
+    for number, card in sorted(cards.items()):
+        card_dir = asound_root / f"card{number}"
+        streams = {'playback': [], 'capture': []}
+        for stream_file in sorted(card_dir.glob('stream*')):
+            parsed = parse_stream(read_text(stream_file))
+            for direction in streams:
+                streams[direction] += parsed[direction]
+        try:
+            entries = sorted(card_dir.iterdir())
+        except OSError:
+            continue
+        for entry in entries:
+            match = PCM_DIR.match(entry.name)
+            if not match:
+                continue
+            device_number = int(match.group(1))
+            direction = 'capture' if match.group(2) == 'c' else 'playback'
+            info = parse_info(read_text(entry / 'info'))
+            devices.append({
+                'hw': f"hw:{number},{device_number}",
+                'direction': direction,
+                'card': number,
+                'device': device_number,
+                'card_id': card['id'],
+                'card_name': card['name'],
+                'driver': card['driver'],
+                'pcm_id': info.get('id', ''),
+                'pcm_name': info.get('name', ''),
+                'usb': card['driver'] == 'USB-Audio',
+                'capabilities': streams[direction],
+            })
+    return devices
+
+def describe(device):
+    """Describe a device the same way ``arecord -l`` does"""
+    return f"{device['card_id']} [{device['card_name']}]: {device['pcm_id']} [{device['pcm_name']}]"
+
+def device_maps(devices):
+    """Split devices into ({hw: description} for capture, ... for playback)"""
+    mic_devices = {d['hw']: describe(d) for d in devices if d['direction'] == 'capture'}
+    speaker_devices = {d['hw']: describe(d) for d in devices if d['direction'] == 'playback'}
+    return mic_devices, speaker_devices
+
+def parse_hw_params(text):
+    """Parse ``--dump-hw-params`` output into formats and (min, max) ranges"""
+    params = {}
+    for line in text.splitlines():
+        key, sep, value = line.partition(':')
+        if not sep:
+            continue
+        key, value = key.strip(), value.strip()
+        if key == 'FORMAT':
+            params['formats'] = value.split()
+        elif key in ('CHANNELS', 'RATE', 'PERIOD_SIZE'):
+            numbers = [int(n) for n in re.findall(r'\d+', value)]
+            if numbers:
+                params[key.lower()] = (min(numbers), max(numbers))
+    return params
+
+def probe_hw_params(device, timeout=5):
+    """Ask ALSA for a device's hardware parameter space
+
+    Opens the raw hw device with --dump-hw-params and stops the tool as soon
+    as the dump is printed, before it streams any audio. Returns None if the
+    device is busy (e.g. held by the running satellite), {} if it can't be
+    probed otherwise.
+    """
+    tool = 'arecord' if device['direction'] == 'capture' else 'aplay'
+    command = [tool, '-D', f"hw:{device['card']},{device['device']}", '--dump-hw-params',
+               '-t', 'raw', '/dev/null']
+    try:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, universal_newlines=True)
+    except OSError:
+        return {}
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    lines = []
+    separators = 0
+    try:
+        for line in process.stderr:
+            lines.append(line)
+            if line.strip() == DUMP_SEPARATOR:
+                separators += 1
+                if separators == 2:
+                    break
+    finally:
+        timer.cancel()
+        process.kill()
+        process.wait()
+        process.stderr.close()
+    output = ''.join(lines)
+    if 'Device or resource busy' in output:
+        return None
+    return parse_hw_params(output)
+
+def probe_key(device):
+    """Cache key for a device's probe, stable across card renumbering"""
+    return f"{device['card_id']},{device['device']},{device['direction']}"
+
+def load_probes(path=PROBE_CACHE):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_probes(probes, path=PROBE_CACHE):
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps(probes, indent=2, sort_keys=True))
+    except OSError as e:
+        logger.warning(f"Cannot save hw params to {path}: {e}")
+
+def capabilities(device, hw_params=None):
+    """Merge the procfs stream altsets and probed hw params for a device"""
+    caps = {'rates': set(), 'rate_ranges': [], 'formats': set(), 'channels': set(),
+            'hw_params': hw_params or {}}
+    for altset in device['capabilities']:
+        caps['rates'].update(altset['rates'])
+        if altset['rate_range']:
+            caps['rate_ranges'].append(tuple(altset['rate_range']))
+        caps['formats'].update(altset['formats'])
+        if altset['channels']:
+            caps['channels'].add(altset['channels'])
+    return caps
+
+def _in_range(value, bounds):
+    return bounds[0] <= value <= bounds[1]
+
+def supports(caps, key, value):
+    """True/False if the hardware natively supports value, None if unknown"""
+    hw = caps['hw_params']
+    if key == 'rate':
+        if caps['rates'] or caps['rate_ranges']:
+            return value in caps['rates'] or any(_in_range(value, r) for r in caps['rate_ranges'])
+        return _in_range(value, hw['rate']) if 'rate' in hw else None
+    if key == 'format':
+        if caps['formats']:
+            return value in caps['formats']
+        return value in hw['formats'] if 'formats' in hw else None
+    if key == 'channels':
+        if caps['channels']:
+            return value in caps['channels']
+        return _in_range(value, hw['channels']) if 'channels' in hw else None
+    raise ValueError(key)
+
+def native_rates(caps):
+    """Return the discrete native rates known for a device"""
+    rates = set(caps['rates'])
+    for low, high in caps['rate_ranges'] + ([caps['hw_params']['rate']] if 'rate' in caps['hw_params'] else []):
+        rates.update(rate for rate in (8000, 16000, 22050, 32000, 44100, 48000, 96000) if low <= rate <= high)
+    return sorted(rates)
+
+def plan_device(device, target, caps):
+    """Score a device for a target stream and decide how to open it
+
+    Returns a plan dict with the ALSA device string to use, the stream
+    parameters, a score and a human-readable rationale.
+    """
+    name = describe(device)
+    native = {key: supports(caps, key, target[key]) for key in ('rate', 'format', 'channels')}
+    score = 0
+    reasons = []
+    if native['rate']:
+        score += 100
+        reasons.append(f"native {target['rate']} Hz")
+    else:
+        rates = native_rates(caps)
+        if native['rate'] is False and any(rate % target['rate'] == 0 for rate in rates):
+            # Integer decimation (e.g. 48 kHz -> 16 kHz) is the cheapest conversion
+            score += 5
+        reasons.append(f"resamples from {rates or 'unknown'} Hz")
+    if native['format']:
+        score += 20
+    else:
+        reasons.append(f"converts to {target['format']}")
+    if native['channels']:
+        score += 10
+    else:
+        reasons.append(f"remaps to {target['channels']} channel(s)")
+    period = caps['hw_params'].get('period_size')
+    if period and period[0] <= 256:
+        score += 1
+    for index, keyword in enumerate(PRIORITY_KEYWORDS):
+        if keyword in name:
+            score += 3 * (len(PRIORITY_KEYWORDS) - index)
+            break
+
+    # The raw hw device only works when it accepts the stream as-is
+    direct = all(native.values())
+    pcm = 'hw' if direct else 'plughw'
+    reasons.insert(0, 'opened directly, no plug conversion' if direct else 'via plug layer')
+    return {
+        'device': f"{pcm}:CARD={device['card_id']},DEV={device['device']}",
+        'hw': device['hw'],
+        'name': name,
+        'rate': target['rate'],
+        'format': target['format'],
+        'channels': target['channels'],
+        'resample': not native['rate'],
+        'score': score,
+        'rationale': ', '.join(reasons),
+    }
+
+def choose_device(devices, direction, target, probe=True, probe_cache=PROBE_CACHE):
+    """Pick the best device for a direction, returning its plan (or None)
+
+    A busy device is scored on its last successful probe. One that was never
+    probed can't be compared, so as the device in use it is kept.
+    """
+    probes = load_probes(probe_cache) if probe else {}
+    plans = []
+    busy = None
+    changed = False
+    for device in devices:
+        if device['direction'] != direction:
+            continue
+        hw_params = probe_hw_params(device) if probe else {}
+        if hw_params is None:
+            hw_params = probes.get(probe_key(device))
+            logger.info(f"{device['hw']} is busy; "
+                        f"{'using its last probe' if hw_params is not None else 'never probed'}")
+            if hw_params is None:
+                hw_params = {}
+                busy = busy or device
+        elif hw_params:
+            # Compared as JSON, where the (min, max) ranges are lists
+            hw_params = json.loads(json.dumps(hw_params))
+            changed = changed or probes.get(probe_key(device)) != hw_params
+            probes[probe_key(device)] = hw_params
+        plans.append(plan_device(device, target, capabilities(device, hw_params)))
+    if changed:
+        save_probes(probes, probe_cache)
+    if not plans:
+        return None
+    if busy is not None:
+        plan = next(plan for plan in plans if plan['hw'] == busy['hw'])
+        logger.info(f"Keeping {direction} {plan['device']} in use: no probe to compare it with")
+        return plan
+    # Stable sort keeps card order for equal scores, like the old keyword pick
+    plans.sort(key=lambda plan: plan['score'], reverse=True)
+    for plan in plans:
+        logger.info(f"{direction} candidate {plan['hw']} ({plan['name']}): "
+                    f"score {plan['score']}, {plan['rationale']}")
+    best = plans[0]
+    logger.info(f"Selected {direction} {best['device']}: {best['rationale']}")
+    return best
+
+def main():
+    parser = argparse.ArgumentParser(description="List ALSA devices from /proc/asound")
+    parser.add_argument('--asound-root', type=Path, default=ASOUND_ROOT)
+    parser.add_argument('--plan', action='store_true',
+                        help="Show the mic/speaker the setup would choose and why")
+    parser.add_argument('--no-probe', dest='probe', action='store_false',
+                        help="Do not open devices to query their hw params")
+    args = parser.parse_args()
+    devices = enumerate_devices(args.asound_root)
+    if args.plan:
+        logging.basicConfig(level=logging.INFO, format='%(message)s')
+        plans = {
+            'mic': choose_device(devices, 'capture', MIC_TARGET, args.probe),
+            'speaker': choose_device(devices, 'playback', SPEAKER_TARGET, args.probe),
+        }
+        print(json.dumps(plans, indent=2))
+        return
+    print(json.dumps(devices, indent=2))
+
+if __name__ == "__main__":
+    main()
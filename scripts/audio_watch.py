@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Re-select audio devices when sound hardware is plugged in or removed.
+
+Watches /dev/snd (inotify, or polling where that is unavailable). When the
+set of device nodes changes and settles, only device selection and the
+mic/speaker blocks of /etc/wyoming/satellite.yaml are redone, and only the
+satellite service (or just wyoming-mic / wyoming-snd, when the satellite reads
+the shared capture ring / plays through the playback sink) is restarted - no
+full re-provision.
+"""
+import argparse
+import ctypes
+import logging
+import os
+import select
+import time
+from pathlib import Path
+
+import log_buffer
+import setup
+import wyoming_commands
+
+logger = logging.getLogger('wyoming-setup.audio-watch')
+
+DEV_SND = Path('/dev/snd')
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+def device_nodes(dev_snd=DEV_SND):
+    """Return the current set of sound device nodes"""
+    try:
+        return frozenset(os.listdir(dev_snd))
+    except OSError:
+        return frozenset()
+
+def open_inotify(path):
+    """Return an inotify fd watching path for create/delete, or None"""
+    try:
+        libc = ctypes.CDLL(None, use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            return None
+        if libc.inotify_add_watch(fd, str(path).encode(), IN_CREATE | IN_DELETE) < 0:
+            os.close(fd)
+            return None
+        return fd
+    except (OSError, AttributeError):
+        return None
+
+def wait_for_change(fd, timeout):
+    """Block until the watch fires (or timeout passes), draining pending events"""
+    if fd is None:
+        time.sleep(timeout)
+        return
+    readable, _, _ = select.select([fd], [], [], timeout)
+    if readable:
+        try:
+            while os.read(fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+def selected_hardware(selection):
+    """Identify which hw devices a (mic, speaker) plan pair uses"""
+    return tuple(plan['hw'] if plan else None for plan in selection or (None, None))
+
+def restart_units(current, selection, config_path=setup.WYOMING_CONFIG_PATH):
+    """Units to restart for a new selection
+
+    With the shared capture ring only wyoming-mic reopens the microphone;
+    the satellite keeps reading the ring. Likewise with the playback sink
+    only wyoming-snd reopens a replaced speaker, unless a speaker appeared
+    or went away, which changes the satellite's own arguments.
+    """
+    old_mic, old_speaker = selected_hardware(current)
+    new_mic, new_speaker = selected_hardware(selection)
+    try:
+        wyoming_config = wyoming_commands.load_config(config_path)
+    except (OSError, KeyError, TypeError):
+        wyoming_config = {}
+    ring = 'capture_command' in wyoming_config.get('mic', {})
+    sink = (wyoming_config.get('playback_sink') or {}).get('enabled', False)
+    units = []
+    if new_mic != old_mic:
+        units.append('wyoming-mic' if ring else 'wyoming-satellite')
+    if new_speaker != old_speaker:
+        if sink:
+            units.append('wyoming-snd')
+        if (not sink or old_speaker is None or new_speaker is None) and 'wyoming-satellite' not in units:
+            units.append('wyoming-satellite')
+    return units
+
+def rescan(current, restart=True, asound_root=setup.audio_devices.ASOUND_ROOT,
+           config_path=setup.WYOMING_CONFIG_PATH):
+    """Redo device selection; returns the new (mic, speaker) selection
+
+    The Wyoming config is rewritten and the satellite restarted only if a
+    different device was chosen. The devices the satellite holds open are
+    busy, so they are scored on their last successful probe.
+    """
+    selection = setup.detect_devices(asound_root)
+    if selected_hardware(selection) == selected_hardware(current):
+        logger.info(f"Device change did not affect selection {selected_hardware(selection)}")
+        return current
+    mic, speaker = selection
+    if not mic:
+        logger.warning("No microphone present; keeping current configuration")
+        return current
+    logger.info(f"Audio devices changed: {selected_hardware(current)} -> {selected_hardware(selection)}")
+    if setup.update_audio_sections(mic, speaker, config_path) and restart:
+        for unit in restart_units(current, selection, config_path):
+            start = time.monotonic()
+            success, output = setup.run_command(['systemctl', 'restart', unit])
+            if success:
+                logger.info(f"Restarted {unit} in {time.monotonic() - start:.2f}s")
+    return selection
+
+def watch(dev_snd=DEV_SND, settle=1.0, poll_interval=2.0, restart=True,
+          asound_root=setup.audio_devices.ASOUND_ROOT, config_path=setup.WYOMING_CONFIG_PATH):
+    """Watch for sound device changes forever"""
+    fd = open_inotify(dev_snd)
+    if fd is None:
+        logger.info(f"inotify unavailable, polling {dev_snd} every {poll_interval}s")
+    nodes = device_nodes(dev_snd)
+    selection = setup.detect_devices(asound_root)
+    logger.info(f"Watching {dev_snd}; current selection {selected_hardware(selection)}")
+    while True:
+        wait_for_change(fd, poll_interval if fd is None else None)
+        new_nodes = device_nodes(dev_snd)
+        if new_nodes == nodes:
+            continue
+        # USB cards create several nodes in a burst; wait until it settles
+        while True:
+            time.sleep(settle)
+            settled = device_nodes(dev_snd)
+            if settled == new_nodes:
+                break
+            new_nodes = settled
+        if fd is not None:
+            wait_for_change(fd, 0)
+        nodes = new_nodes
+        selection = rescan(selection, restart, asound_root, config_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-select audio devices on hot-plug")
+    parser.add_argument('--once', action='store_true', help="Rescan once and exit")
+    parser.add_argument('--no-restart', dest='restart', action='store_false',
+                        help="Update the config but do not restart the satellite")
+    parser.add_argument('--dev-snd', type=Path, default=DEV_SND)
+    parser.add_argument('--asound-root', type=Path, default=setup.audio_devices.ASOUND_ROOT)
+    parser.add_argument('--config', default=setup.WYOMING_CONFIG_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        config = wyoming_commands.load_config(args.config)
+    except Exception as e:
+        # Device selection still works; only the logging settings are missing
+        logger.warning(f"Cannot read {args.config} ({e}); using default logging")
+        config = {}
+    log_buffer.apply(config, 'audio-watch')
+    if args.once:
+        rescan(None, args.restart, args.asound_root, args.config)
+    else:
+        watch(args.dev_snd, restart=args.restart, asound_root=args.asound_root, config_path=args.config)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,767 @@
+#!/usr/bin/env python3
+"""Synthetic load and soak benchmark for a deployed satellite.
+
+Runs the installed wyoming-satellite exactly as run-satellite.py would, but
+on spare ports and with stand-ins for everything around it:
+
+- the mic command is ``benchmark.py feed``, which plays a WAV file (or
+  synthetic audio) at real-time pace instead of arecord,
+- the speaker command discards audio,
+- a stand-in wake word server on the wake port emits a detection every
+  ``--wake-interval`` seconds of audio,
+- a fake Home Assistant client on the satellite port runs the satellite,
+  receives the streamed audio and ends each pipeline with a transcript.
+
+It measures wake-to-stream latency (detection sent -> first audio chunk at
+HA), audio chunk jitter on both links, and CPU/RSS of the satellite process
+tree. Results are checkpointed as JSON so multi-hour soaks survive being
+interrupted, and ``compare`` diffs two result files.
+
+``--profile`` runs the satellite with a service_profile.py profile's CPU
+settings and ``--load`` adds busy processes with the setup unit's
+settings, standing in for pip builds at boot; ``profiles`` runs each
+profile in turn and tabulates late chunks (underruns) and wake-to-stream
+latency side by side.
+
+``vad`` runs a recorded corpus (positive/ and negative/ WAVs) through the
+installed wake word service with and without the VAD gate, reporting the
+wake word CPU saved and the recall retained.
+
+``threads`` replays the same clip through the installed wake word service
+once per inference thread count and reports per-chunk latency (p50/p99)
+and total CPU for each; ``--save`` writes the best count to config.yaml as
+``wake_threads``, which run-wakeword.py passes to the service at launch.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import signal
+import socket
+import subprocess
+import sys
+import time
+import wave
+from datetime import datetime
+from pathlib import Path
+
+import repo_fetch
+import service_profile
+import vad_gate
+import wyoming_commands
+import wyoming_tap
+
+logger = logging.getLogger('wyoming-bench')
+
+RESULTS_DIR = Path('/var/lib/wyoming/bench')
+
+RATE = 16000
+WIDTH = 2
+CHANNELS = 1
+SAMPLES_PER_CHUNK = 1024
+CHECKPOINT_INTERVAL = 60
+RESOURCE_INTERVAL = 5
+# A detection that is not streamed to HA within this long counts as missed
+STREAM_TIMEOUT = 10
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+# More threads must cut chunk p99 by at least this much to be worth their CPU
+THREAD_GAIN = 0.9
+# Models every chunk runs through before the per-word classifiers
+FEATURE_MODELS = ('melspectrogram', 'embedding_model')
+
+def read_wav(wav_path):
+    """Raw audio of a 16 kHz 16-bit mono WAV file"""
+    with wave.open(str(wav_path), 'rb') as wav:
+        if (wav.getframerate(), wav.getsampwidth(), wav.getnchannels()) != (RATE, WIDTH, CHANNELS):
+            sys.exit(f"{wav_path} must be {RATE} Hz, 16-bit, mono")
+        return wav.readframes(wav.getnframes())
+
+def synthetic_audio():
+    """One second of a quiet 440 Hz tone with a little deterministic noise"""
+    return b''.join(
+        int(800 * math.sin(2 * math.pi * 440 * n / RATE) + (n * 7919 % 200) - 100)
+        .to_bytes(2, 'little', signed=True)
+        for n in range(RATE))
+
+def feed(wav_path=None, chunk_samples=SAMPLES_PER_CHUNK, stall_after=None):
+    """Write raw 16 kHz S16_LE mono audio to stdout at real-time pace, forever
+
+    With stall_after, stop writing after that many seconds but keep the
+    pipe open, like a hung arecord.
+    """
+    audio = read_wav(wav_path) if wav_path else synthetic_audio()
+    chunk_bytes = chunk_samples * WIDTH
+    audio += bytes(-len(audio) % chunk_bytes)
+    period = chunk_samples / RATE
+    out = sys.stdout.buffer
+    deadline = stall_at = time.monotonic()
+    if stall_after is not None:
+        stall_at += stall_after
+    offset = 0
+    try:
+        while True:
+            if stall_after is not None and time.monotonic() >= stall_at:
+                signal.pause()
+            out.write(audio[offset:offset + chunk_bytes])
+            out.flush()
+            offset = (offset + chunk_bytes) % len(audio)
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+    except BrokenPipeError:
+        pass
+
+class Jitter:
+    """Bounded-memory stats on how far chunk gaps deviate from the chunk period"""
+
+    def __init__(self):
+        self.histogram = wyoming_tap.new_histogram()
+        self.count = 0
+        # Gaps a whole chunk period late: a one-period device buffer would have run dry
+        self.late = 0
+        self.total = 0.0
+        self.squares = 0.0
+        self.worst = 0.0
+        self.last = None
+
+    def chunk(self, now, period):
+        if self.last is not None:
+            deviation = abs(now - self.last - period)
+            wyoming_tap.observe(self.histogram, deviation)
+            self.count += 1
+            self.total += deviation
+            self.squares += deviation * deviation
+            self.worst = max(self.worst, deviation)
+            if deviation > period:
+                self.late += 1
+        self.last = now
+
+    def gap(self):
+        """Forget the previous chunk, e.g. between pipeline runs"""
+        self.last = None
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        mean = self.total / self.count
+        return {
+            'count': self.count,
+            'mean_ms': round(mean * 1000, 3),
+            'stdev_ms': round(math.sqrt(max(self.squares / self.count - mean * mean, 0)) * 1000, 3),
+            'p95_ms': wyoming_tap.percentile(self.histogram, 95),
+            'p99_ms': wyoming_tap.percentile(self.histogram, 99),
+            'max_ms': round(self.worst * 1000, 3),
+            'late': self.late,
+        }
+
+def summarize(values):
+    """count/mean/p50/p95/max of a list of seconds, in ms"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    pick = lambda q: round(ordered[min(len(ordered) - 1, int(q / 100 * len(ordered)))] * 1000, 2)
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 2),
+        'p50_ms': pick(50),
+        'p95_ms': pick(95),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+class Run:
+    """State shared by the stand-in wake server and the fake HA client"""
+
+    def __init__(self, wake_word, wake_interval, stream_seconds):
+        self.wake_word = wake_word
+        self.wake_interval = wake_interval
+        self.stream_seconds = stream_seconds
+        self.detected_at = None
+        self.streaming_since = None
+        self.wake_to_stream = []
+        self.detections = 0
+        self.missed = 0
+        self.wake_jitter = Jitter()
+        self.ha_jitter = Jitter()
+        self.resources = []
+
+    def expire(self, now):
+        """Count a detection that never reached HA as missed"""
+        if self.detected_at is not None and now - self.detected_at > STREAM_TIMEOUT:
+            self.missed += 1
+            self.detected_at = None
+
+async def wake_server(reader, writer, run):
+    """Stand-in wake word service: detects every wake_interval seconds of audio"""
+    samples = 0
+    try:
+        while True:
+            event = await wyoming_tap.read_event(reader)
+            if event is None:
+                break
+            event_type, data, payload = event
+            now = time.monotonic()
+            if event_type == 'describe':
+                model = {'name': run.wake_word, 'attribution': {'name': '', 'url': ''},
+                         'installed': True, 'description': run.wake_word, 'version': None,
+                         'languages': []}
+                wyoming_tap.write_event(writer, 'info', {'wake': [{
+                    'name': 'benchmark', 'attribution': {'name': '', 'url': ''}, 'installed': True,
+                    'description': 'benchmark stand-in', 'version': None, 'models': [model]}]})
+            elif event_type == 'audio-chunk':
+                chunk_samples = len(payload) // (data.get('width', WIDTH) * data.get('channels', CHANNELS))
+                run.wake_jitter.chunk(now, chunk_samples / data.get('rate', RATE))
+                samples += chunk_samples
+                run.expire(now)
+                idle = run.detected_at is None and run.streaming_since is None
+                if idle and samples >= run.wake_interval * RATE:
+                    samples = 0
+                    run.detections += 1
+                    run.detected_at = time.monotonic()
+                    # The satellite stops feeding the wake service while it streams to HA
+                    run.wake_jitter.gap()
+                    wyoming_tap.write_event(writer, 'detection', {'name': run.wake_word, 'timestamp': None})
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+async def fake_home_assistant(port, run, stopping):
+    """Connect like HA, run the satellite and receive every streamed pipeline"""
+    while not stopping.is_set():
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        except OSError:
+            await asyncio.sleep(0.5)
+            continue
+        logger.info("Fake Home Assistant connected")
+        wyoming_tap.write_event(writer, 'run-satellite')
+        await writer.drain()
+        try:
+            while not stopping.is_set():
+                event = await wyoming_tap.read_event(reader)
+                if event is None:
+                    break
+                event_type, data, payload = event
+                now = time.monotonic()
+                if event_type == 'ping':
+                    wyoming_tap.write_event(writer, 'pong', {'text': data.get('text')})
+                elif event_type == 'audio-chunk':
+                    if run.detected_at is not None:
+                        run.wake_to_stream.append(now - run.detected_at)
+                        run.detected_at = None
+                        run.streaming_since = now
+                        run.ha_jitter.gap()
+                    if run.streaming_since is None:
+                        continue
+                    samples = len(payload) // (data.get('width', WIDTH) * data.get('channels', CHANNELS))
+                    run.ha_jitter.chunk(now, samples / data.get('rate', RATE))
+                    if now - run.streaming_since >= run.stream_seconds:
+                        # End the pipeline; the satellite goes back to waiting for the wake word
+                        wyoming_tap.write_event(writer, 'transcript', {'text': 'benchmark'})
+                        run.streaming_since = None
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        writer.close()
+        if not stopping.is_set():
+            logger.warning("Satellite closed the connection; reconnecting")
+            await asyncio.sleep(0.5)
+
+def process_tree(pid):
+    """pid plus all of its descendants"""
+    children = {}
+    for entry in Path('/proc').iterdir():
+        if not entry.name.isdigit():
+            continue
+        try:
+            stat = (entry / 'stat').read_text()
+        except OSError:
+            continue
+        ppid = int(stat.rsplit(')', 1)[1].split()[1])
+        children.setdefault(ppid, []).append(int(entry.name))
+    tree, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        tree.append(current)
+        pending += children.get(current, [])
+    return tree
+
+def tree_usage(pid):
+    """Total (cpu seconds, RSS kB) of a process tree"""
+    cpu, rss = 0.0, 0
+    for member in process_tree(pid):
+        try:
+            fields = Path(f'/proc/{member}/stat').read_text().rsplit(')', 1)[1].split()
+            status = Path(f'/proc/{member}/status').read_text()
+        except OSError:
+            continue
+        cpu += (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+        for line in status.splitlines():
+            if line.startswith('VmRSS:'):
+                rss += int(line.split()[1])
+    return cpu, rss
+
+async def sample_resources(pid, run, stopping):
+    start = time.monotonic()
+    last_cpu, last_time = tree_usage(pid)[0], start
+    while not stopping.is_set():
+        try:
+            await asyncio.wait_for(stopping.wait(), RESOURCE_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        if stopping.is_set():
+            break
+        cpu, rss = tree_usage(pid)
+        now = time.monotonic()
+        run.resources.append((round(now - start, 1), round(100 * (cpu - last_cpu) / (now - last_time), 1), rss))
+        last_cpu, last_time = cpu, now
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def bench_config(config, wav, ha_port, wake_port):
+    """The deployed satellite config with the mic, speaker and ports replaced"""
+    config = dict(config)
+    config.pop('wake_tap_port', None)
+    # The satellite talks to the stand-ins directly, not through the VAD gate or playback sink
+    config['vad'] = dict(config.get('vad') or {}, enabled=False)
+    config.pop('playback_sink', None)
+    feed_command = [sys.executable, str(Path(__file__).resolve()), 'feed']
+    if wav:
+        feed_command += ['--wav', str(Path(wav).resolve())]
+    config.update({
+        'port': ha_port,
+        'wake_word_port': wake_port,
+        'wake_word': config.get('wake_word') or 'hey_jarvis',
+        'mic': {'command': feed_command},
+        'speaker': {'command': ['dd', 'of=/dev/null', 'status=none']},
+    })
+    return config
+
+def results(run, args, config, started, elapsed):
+    cpu = [sample[1] for sample in run.resources]
+    rss = [sample[2] for sample in run.resources]
+    ok, head = repo_fetch.git('rev-parse', 'HEAD', cwd=wyoming_commands.SATELLITE_REPO)
+    return {
+        'label': args.label,
+        'started': started,
+        'elapsed_seconds': round(elapsed, 1),
+        'settings': {'wav': str(args.wav) if args.wav else 'synthetic', 'wake_interval': args.wake_interval,
+                     'stream_seconds': args.stream_seconds, 'profile': args.profile, 'load': args.load},
+        'config': {key: config.get(key) for key in ('name', 'wake_word', 'vad')},
+        'versions': {'satellite': head if ok else None, 'python': platform.python_version(),
+                     'machine': platform.machine()},
+        'detections': run.detections,
+        'missed': run.missed,
+        'wake_to_stream': summarize(run.wake_to_stream),
+        'wake_chunk_jitter': run.wake_jitter.summary(),
+        'ha_chunk_jitter': run.ha_jitter.summary(),
+        'cpu_percent': {'mean': round(sum(cpu) / len(cpu), 1), 'max': max(cpu)} if cpu else {},
+        'rss_kb': {'first': rss[0], 'last': rss[-1], 'max': max(rss)} if rss else {},
+        'resource_samples': run.resources,
+    }
+
+def write_results(data, output):
+    output.parent.mkdir(parents=True, exist_ok=True)
+    temp_path = output.with_name(output.name + '.tmp')
+    with open(temp_path, 'w') as f:
+        json.dump(data, f, indent=1)
+    os.replace(temp_path, output)
+
+async def start_load(count, settings):
+    """Busy processes standing in for setup's pip builds"""
+    return [await asyncio.create_subprocess_exec(sys.executable, '-c', 'while True: pass',
+                                                 preexec_fn=service_profile.preexec(settings))
+            for _ in range(count)]
+
+def profile_settings(name):
+    """{unit: settings} of a profile sized for this machine; {} without one"""
+    if not name:
+        return {}
+    profile = service_profile.build_profile(name, *service_profile.system_resources())
+    if os.geteuid() != 0 and any(service_profile.needs_privileges(s) for s in profile.values()):
+        logger.warning(f"Not running as root; priority settings of profile '{name}' will be skipped")
+    return profile
+
+async def benchmark(args, output):
+    config = bench_config(wyoming_commands.load_config(args.config), args.wav, free_port(), free_port())
+    profile = profile_settings(args.profile)
+    # The stand-in detects the first configured word
+    run = Run(wyoming_commands.wake_words(config)[0]['name'], args.wake_interval, args.stream_seconds)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    server = await asyncio.start_server(lambda r, w: wake_server(r, w, run), '127.0.0.1',
+                                        config['wake_word_port'])
+    load = await start_load(args.load, profile.get('wyoming-setup', {}))
+    command, env, cwd = wyoming_commands.satellite_command(config)
+    # The mic command inherits the satellite's settings, as arecord would
+    process = await asyncio.create_subprocess_exec(
+        *command, env=env, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        preexec_fn=service_profile.preexec(profile.get('wyoming-satellite', {})))
+    logger.info(f"Satellite pid {process.pid} on port {config['port']}, "
+                f"stand-in wake server on port {config['wake_word_port']}")
+
+    started = datetime.now().isoformat(timespec='seconds')
+    start = time.monotonic()
+    tasks = [asyncio.create_task(fake_home_assistant(config['port'], run, stopping)),
+             asyncio.create_task(sample_resources(process.pid, run, stopping))]
+    exited = asyncio.create_task(process.wait())
+    exited.add_done_callback(lambda _: stopping.set())
+    try:
+        while not stopping.is_set() and time.monotonic() - start < args.duration:
+            try:
+                await asyncio.wait_for(stopping.wait(), min(CHECKPOINT_INTERVAL, args.duration))
+            except asyncio.TimeoutError:
+                pass
+            write_results(results(run, args, config, started, time.monotonic() - start), output)
+            logger.info(f"{time.monotonic() - start:.0f}s: {run.detections} detections, "
+                        f"{len(run.wake_to_stream)} streamed, {run.missed} missed")
+    finally:
+        stopping.set()
+        if process.returncode is None:
+            process.terminate()
+            await process.wait()
+        elif time.monotonic() - start < args.duration:
+            logger.error(f"Satellite exited early with {process.returncode}")
+        for burner in load:
+            burner.kill()
+            await burner.wait()
+        server.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    data = results(run, args, config, started, time.monotonic() - start)
+    write_results(data, output)
+    return data
+
+async def detect_file(port, audio, wake_words, gate=None, speed=1.0):
+    """Stream one recording to a wake word service; returns (detected, chunks sent)"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    format_data = {'rate': RATE, 'width': WIDTH, 'channels': CHANNELS}
+    wyoming_tap.write_event(writer, 'detect', {'names': wake_words})
+    wyoming_tap.write_event(writer, 'audio-start', format_data)
+    detected = asyncio.Event()
+
+    async def listen():
+        while True:
+            event = await wyoming_tap.read_event(reader)
+            if event is None or event[0] == 'not-detected':
+                return
+            if event[0] == 'detection':
+                detected.set()
+
+    listener = asyncio.create_task(listen())
+    chunk_bytes = SAMPLES_PER_CHUNK * WIDTH
+    period = SAMPLES_PER_CHUNK / RATE / speed
+    sent = 0
+    deadline = time.monotonic()
+    for offset in range(0, len(audio), chunk_bytes):
+        chunk = audio[offset:offset + chunk_bytes]
+        # The service keeps a sliding window, so audio is paced rather than dumped
+        for pending in (gate.chunk(chunk, chunk) if gate else [chunk]):
+            wyoming_tap.write_event(writer, 'audio-chunk', format_data, pending)
+            sent += 1
+        await writer.drain()
+        deadline += period
+        await asyncio.sleep(max(0, deadline - time.monotonic()))
+    # Let the service finish the last window before asking for a verdict
+    await asyncio.sleep(0.5)
+    wyoming_tap.write_event(writer, 'audio-stop')
+    await writer.drain()
+    try:
+        await asyncio.wait_for(listener, 5)
+    except asyncio.TimeoutError:
+        pass
+    writer.close()
+    return detected.is_set(), sent
+
+async def vad_benchmark(args):
+    """Wake word CPU and recall on a corpus, with and without the VAD gate"""
+    config = wyoming_commands.load_config(args.config)
+    config['wake_word'] = config.get('wake_word') or 'hey_jarvis'
+    names = [word['name'] for word in wyoming_commands.wake_words(config)]
+    settings = vad_gate.vad_settings(config)
+    for key in ('threshold', 'trigger_level', 'pre_roll', 'hangover'):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+    corpus = {label: [(path, read_wav(path)) for path in sorted((args.corpus / label).glob('*.wav'))]
+              for label in ('positive', 'negative')}
+    if not corpus['positive'] and not corpus['negative']:
+        sys.exit(f"No WAV files in {args.corpus}/positive or {args.corpus}/negative")
+
+    config['wake_word_port'] = free_port()
+    command, env, cwd = wyoming_commands.wakeword_command(config)
+    process = await asyncio.create_subprocess_exec(*command, env=env, cwd=cwd,
+                                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if await asyncio.to_thread(wyoming_commands.wait_for_port, config['wake_word_port'], 120) is None:
+            sys.exit("Wake word service did not start")
+        modes = {}
+        for mode in ('ungated', 'gated'):
+            cpu_before = tree_usage(process.pid)[0]
+            result = {'chunks_total': 0, 'chunks_sent': 0}
+            for label, files in corpus.items():
+                hits = []
+                for path, audio in files:
+                    gate = vad_gate.Gate(settings) if mode == 'gated' else None
+                    detected, sent = await detect_file(config['wake_word_port'], audio, names,
+                                                       gate, args.speed)
+                    result['chunks_total'] += math.ceil(len(audio) / (SAMPLES_PER_CHUNK * WIDTH))
+                    result['chunks_sent'] += sent
+                    if detected:
+                        hits.append(path.name)
+                    logger.info(f"{mode} {label}/{path.name}: {'detected' if detected else 'not detected'}")
+                result[label] = {'files': len(files), 'detected': len(hits), 'detected_files': hits}
+            result['cpu_seconds'] = round(tree_usage(process.pid)[0] - cpu_before, 2)
+            result['sent_fraction'] = round(result['chunks_sent'] / result['chunks_total'], 3)
+            modes[mode] = result
+    finally:
+        process.terminate()
+        await process.wait()
+
+    def recall(mode):
+        positive = modes[mode]['positive']
+        return positive['detected'] / positive['files'] if positive['files'] else None
+    ungated, gated = modes['ungated'], modes['gated']
+    return {
+        'label': args.label,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'corpus': str(args.corpus),
+        'wake_word': config['wake_word'],
+        'vad': settings,
+        'modes': modes,
+        'cpu_saved_fraction': (round(1 - gated['cpu_seconds'] / ungated['cpu_seconds'], 3)
+                               if ungated['cpu_seconds'] else None),
+        'recall_ungated': recall('ungated'),
+        'recall_gated': recall('gated'),
+        'false_accepts_ungated': ungated['negative']['detected'],
+        'false_accepts_gated': gated['negative']['detected'],
+    }
+
+def thread_candidates(cores):
+    """1, 2, 4, ... up to and including the core count"""
+    candidates, threads = [], 1
+    while threads < cores:
+        candidates.append(threads)
+        threads *= 2
+    return candidates + [cores]
+
+def chunk_latency(timing):
+    """Per-chunk latency estimate from per-model timing: the feature models
+    run one after the other, then the word classifiers in parallel"""
+    latency = {}
+    for stat in ('wall_p50_ms', 'wall_p99_ms'):
+        features = sum(timing[name][stat] for name in FEATURE_MODELS if name in timing)
+        words = [entry[stat] for name, entry in timing.items() if name not in FEATURE_MODELS]
+        latency[stat.replace('wall_', 'chunk_')] = round(features + max(words, default=0), 3)
+    return latency
+
+async def thread_run(config, threads, audio, names, speed):
+    """Stream audio through a wake word service started with this many threads"""
+    config = dict(config, wake_word_port=free_port(), wake_threads=threads)
+    timing_path = Path(f"/tmp/wyoming-bench-timing-{os.getpid()}-{threads}.json")
+    command, env, cwd = wyoming_commands.wakeword_command(config)
+    process = await asyncio.create_subprocess_exec(*command, '--timing-file', str(timing_path),
+                                                   env=env, cwd=cwd,
+                                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if await asyncio.to_thread(wyoming_commands.wait_for_port, config['wake_word_port'], 120) is None:
+            sys.exit("Wake word service did not start")
+        cpu_before, start = tree_usage(process.pid)[0], time.monotonic()
+        await detect_file(config['wake_word_port'], audio, names, speed=speed)
+        cpu, elapsed = tree_usage(process.pid)[0] - cpu_before, time.monotonic() - start
+    finally:
+        process.terminate()
+        await process.wait()
+    try:
+        timing = json.loads(timing_path.read_text())
+        timing_path.unlink()
+    except (OSError, ValueError):
+        sys.exit("Wake word service wrote no timing; is wakeword_service.py installed?")
+    return {'threads': threads, **chunk_latency(timing), 'cpu_seconds': round(cpu, 2),
+            'cpu_percent': round(100 * cpu / elapsed, 1), 'models': timing}
+
+async def thread_benchmark(args):
+    """Per-chunk latency and CPU of the wake word service per thread count"""
+    config = wyoming_commands.load_config(args.config)
+    config['wake_word'] = config.get('wake_word') or 'hey_jarvis'
+    names = [word['name'] for word in wyoming_commands.wake_words(config)]
+    clip = read_wav(args.wav) if args.wav else synthetic_audio()
+    # The same clip, looped to the requested length, for every thread count
+    length = int(args.seconds * RATE) * WIDTH
+    audio = (clip * (length // len(clip) + 1))[:length]
+    candidates = ([int(value) for value in args.threads.split(',')] if args.threads
+                  else thread_candidates(os.cpu_count()))
+
+    runs, best = [], None
+    for threads in candidates:
+        run = await thread_run(config, threads, audio, names, args.speed)
+        logger.info(f"{threads} threads: chunk p50 {run['chunk_p50_ms']} ms, p99 {run['chunk_p99_ms']} ms, "
+                    f"CPU {run['cpu_percent']}%")
+        runs.append(run)
+        # A larger count has to earn its extra wakeups and contention
+        if best is None or run['chunk_p99_ms'] < best['chunk_p99_ms'] * THREAD_GAIN:
+            best = run
+    return {
+        'label': args.label,
+        'started': datetime.now().isoformat(timespec='seconds'),
+        'wav': str(args.wav) if args.wav else 'synthetic',
+        'seconds': args.seconds,
+        'cores': os.cpu_count(),
+        'wake_words': names,
+        'runs': runs,
+        'best_threads': best['threads'],
+    }
+
+def save_setting(config_path, key, value):
+    """Set a top-level satellite key in config.yaml, keeping its comments"""
+    lines = Path(config_path).read_text().splitlines(keepends=True)
+    line = f"  {key}: {value}\n"
+    for index, existing in enumerate(lines):
+        # A commented-out example of the key is replaced too
+        if existing.startswith((f"  {key}:", f"  # {key}:")):
+            lines[index] = line
+            break
+    else:
+        lines.append(line)
+    Path(config_path).write_text(''.join(lines))
+
+def headline(data):
+    """The metrics compared between runs"""
+    return {
+        'wake_to_stream_p50_ms': data['wake_to_stream'].get('p50_ms'),
+        'wake_to_stream_p95_ms': data['wake_to_stream'].get('p95_ms'),
+        'ha_jitter_p99_ms': data['ha_chunk_jitter'].get('p99_ms'),
+        'wake_jitter_p99_ms': data['wake_chunk_jitter'].get('p99_ms'),
+        'ha_late_chunks': data['ha_chunk_jitter'].get('late'),
+        'wake_late_chunks': data['wake_chunk_jitter'].get('late'),
+        'cpu_mean_percent': data['cpu_percent'].get('mean'),
+        'rss_max_kb': data['rss_kb'].get('max'),
+        'rss_growth_kb': (data['rss_kb']['last'] - data['rss_kb']['first']) if data['rss_kb'] else None,
+        'missed': data['missed'],
+    }
+
+def compare(baseline, current):
+    """Deltas of the headline metrics between two result files"""
+    before, after = headline(baseline), headline(current)
+    return {key: {'baseline': before[key], 'current': after[key],
+                  'delta': (after[key] - before[key]) if None not in (before[key], after[key]) else None}
+            for key in before}
+
+async def profile_benchmark(args):
+    """Run the same load once per profile; returns {profile: headline metrics}"""
+    stamp = f"{datetime.now():%Y%m%d-%H%M%S}"
+    table = {}
+    for name in args.profiles.split(','):
+        args.profile = name
+        logger.info(f"Profile '{name}': {args.duration:.0f}s with {args.load} load processes")
+        data = await benchmark(args, RESULTS_DIR / f"{stamp}-{name}.json")
+        table[name] = headline(data)
+        if data['elapsed_seconds'] < args.duration:
+            logger.warning(f"Profile '{name}' ended early; not running the rest")
+            break
+    return table
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a deployed Wyoming satellite without audio hardware or HA")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('run', help="Run a load/soak benchmark")
+    run.add_argument('--duration', type=float, default=300, help="Seconds to run (hours for a soak)")
+    run.add_argument('--wav', type=Path, help="16 kHz 16-bit mono WAV to loop as mic input (default: synthetic)")
+    run.add_argument('--wake-interval', type=float, default=10, help="Seconds of audio between detections")
+    run.add_argument('--stream-seconds', type=float, default=3, help="Seconds streamed to HA per pipeline")
+    run.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    run.add_argument('--label', default='', help="Free-form label stored with the results")
+    run.add_argument('--output', type=Path, help="Results file (default: RESULTS_DIR/<timestamp>.json)")
+    run.add_argument('--profile', choices=service_profile.PROFILES,
+                     help="Run the satellite with this service profile's CPU settings")
+    run.add_argument('--load', type=int, default=0, help="Busy processes running with setup's settings")
+    profiles = subparsers.add_parser('profiles', help="Compare service profiles under the same load")
+    profiles.add_argument('--profiles', default=','.join(service_profile.PROFILES),
+                          help="Comma-separated profiles to run")
+    profiles.add_argument('--duration', type=float, default=120, help="Seconds per profile")
+    profiles.add_argument('--load', type=int, default=os.cpu_count(), help="Busy processes running with setup's settings")
+    profiles.add_argument('--wav', type=Path)
+    profiles.add_argument('--wake-interval', type=float, default=5)
+    profiles.add_argument('--stream-seconds', type=float, default=3)
+    profiles.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    profiles.add_argument('--label', default='')
+    feeder = subparsers.add_parser('feed', help="Mic command stand-in: write real-time audio to stdout")
+    feeder.add_argument('--wav', type=Path)
+    feeder.add_argument('--stall-after', type=float, help="Stop producing audio after this many seconds")
+    vad = subparsers.add_parser('vad', help="Wake word CPU and recall with and without the VAD gate")
+    vad.add_argument('corpus', type=Path, help="Directory with positive/*.wav and negative/*.wav")
+    vad.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    vad.add_argument('--threshold', type=int, help="Override vad.threshold")
+    vad.add_argument('--trigger-level', type=int, help="Override vad.trigger_level")
+    vad.add_argument('--pre-roll', type=float, help="Override vad.pre_roll")
+    vad.add_argument('--hangover', type=float, help="Override vad.hangover")
+    vad.add_argument('--speed', type=float, default=1.0, help="Playback speed (1 = real time)")
+    vad.add_argument('--label', default='')
+    vad.add_argument('--output', type=Path)
+    threads = subparsers.add_parser('threads', help="Tune the wake word service's inference threads")
+    threads.add_argument('--wav', type=Path, help="16 kHz 16-bit mono WAV to replay (default: synthetic)")
+    threads.add_argument('--seconds', type=float, default=30, help="Seconds of audio per thread count")
+    threads.add_argument('--threads', help="Comma-separated counts to try (default: 1, 2, 4 ... cores)")
+    threads.add_argument('--speed', type=float, default=1.0, help="Playback speed (1 = real time)")
+    threads.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    threads.add_argument('--save', nargs='?', const='/usr/local/bin/wyoming/config.yaml', metavar='CONFIG',
+                         help="Write the best count to config.yaml as wake_threads and reload")
+    threads.add_argument('--label', default='')
+    threads.add_argument('--output', type=Path)
+    diff = subparsers.add_parser('compare', help="Compare two result files")
+    diff.add_argument('baseline', type=Path)
+    diff.add_argument('current', type=Path)
+    args = parser.parse_args()
+
+    if args.command == 'feed':
+        feed(args.wav, stall_after=args.stall_after)
+        return
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'compare':
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        print(json.dumps(compare(baseline, current), indent=2))
+        return
+
+    if args.command == 'profiles':
+        print(json.dumps(asyncio.run(profile_benchmark(args)), indent=2))
+        return
+
+    if args.command == 'vad':
+        data = asyncio.run(vad_benchmark(args))
+        if args.output:
+            write_results(data, args.output)
+        print(json.dumps(data, indent=2))
+        return
+
+    if args.command == 'threads':
+        data = asyncio.run(thread_benchmark(args))
+        if args.output:
+            write_results(data, args.output)
+        print(json.dumps(data, indent=2))
+        if args.save:
+            save_setting(args.save, 'wake_threads', data['best_threads'])
+            logger.info(f"wake_threads: {data['best_threads']} saved to {args.save}")
+            subprocess.run([sys.executable, str(Path(__file__).with_name('reload_config.py')),
+                            '--config', args.save], check=False)
+        return
+
+    output = args.output or RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    data = asyncio.run(benchmark(args, output))
+    data.pop('resource_samples')
+    print(json.dumps(data, indent=2))
+    logger.info(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -33,6 +33,20 @@ def get_input(prompt, default):
     response = input(f"{prompt} (default: {default}): ").strip()
     return response if response else default
 
+def wake_word_names(wake_word):
+    """Comma-separated names of a wake_word setting (one name or a list)"""
+    words = wake_word if isinstance(wake_word, list) else [wake_word]
+    return ', '.join(word['name'] if isinstance(word, dict) else str(word) for word in words)
+
+def parse_wake_words(names, current):
+    """wake_word setting for comma-separated names, keeping per-word settings of kept words"""
+    existing = {}
+    for word in (current if isinstance(current, list) else [current]):
+        if isinstance(word, dict):
+            existing[word['name']] = word
+    words = [existing.get(name, name) for name in (n.strip() for n in names.split(',')) if name]
+    return words[0] if len(words) == 1 and not isinstance(words[0], dict) else words
+
 def configure():
     """Interactive configuration"""
     print("\nWyoming Satellite Configuration")
@@ -51,28 +65,41 @@ def configure():
             'host': get_input("Home Assistant IP", config['host']),
             'ha_port': int(get_input("Home Assistant Port", config['ha_port'])),
             'satellite_port': int(get_input("Satellite Port", config['satellite_port'])),
-            'wake_word': get_input("Wake Word", config['wake_word']),
-            'wake_word_port': get_input("Wake Word Port Default 10400", config['wake_word'])
+            'wake_word': parse_wake_words(get_input("Wake Word(s), comma-separated", wake_word_names(config['wake_word'])), config['wake_word']),
+            'wake_word_port': int(get_input("Wake Word Port", config.get('wake_word_port', 10400)))
         }
     }
 
      # Add VAD configuration
-    vad_enabled = get_input("Enable VAD (Voice Activity Detection)", str(config.get('vad', {}).get('enabled', True))).lower() in ['true', 'yes', 'y', '1']
+    vad_enabled = get_input("Enable VAD (Voice Activity Detection)", str(config.get('vad', {}).get('enabled', False))).lower() in ['true', 'yes', 'y', '1']
 
     if vad_enabled:
         vad_threshold = int(get_input("VAD Sensitivity (0-3)", config.get('vad', {}).get('threshold', 2)))
         vad_trigger = int(get_input("VAD Trigger Level", config.get('vad', {}).get('trigger_level', 3)))
+        vad_pre_roll = float(get_input("VAD Pre-roll Seconds", config.get('vad', {}).get('pre_roll', 1.0)))
+        vad_hangover = float(get_input("VAD Hangover Seconds", config.get('vad', {}).get('hangover', 2.0)))
     else:
         vad_threshold = 2
         vad_trigger = 3
+        vad_pre_roll = 1.0
+        vad_hangover = 2.0
 
 
     new_config['satellite']['vad'] = {
         'enabled': vad_enabled,
         'threshold': vad_threshold,
         'trigger_level': vad_trigger,
-        'chunk_size': 960
+        'chunk_size': config.get('vad', {}).get('chunk_size', 960),
+        'pre_roll': vad_pre_roll,
+        'hangover': vad_hangover,
+        'gate_port': config.get('vad', {}).get('gate_port', 10402)
     }
+
+    # Settings without a prompt are carried over unchanged
+    for key in ('pyc_invalidation', 'repositories', 'wake_tap_port', 'mic_ring', 'playback_sink', 'service_profile',
+                'wake_threads', 'watchdog', 'logging', 'governor', 'metrics'):
+        if key in config:
+            new_config['satellite'][key] = config[key]
     
     # Show the new configuration
     print("\nNew Configuration:")
@@ -91,11 +118,9 @@ def configure():
             yaml.dump(new_config, f, default_flow_style=False)
         print("Configuration saved successfully")
         
-        # Ask about restarting services
-        if input("\nRestart Wyoming services now? (y/N): ").lower() == 'y':
-            os.system('sudo systemctl restart wyoming-setup')
-            os.system('sudo systemctl restart wyoming-satellite')
-            print("Services restarted")
+        # Ask about applying the changes; only the affected services restart
+        if input("\nApply changes to the running services now? (y/N): ").lower() == 'y':
+            os.system('sudo python3 /usr/local/bin/wyoming/reload_config.py')
             
     except Exception as e:
         print(f"Error saving configuration: {e}")
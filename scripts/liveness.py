@@ -0,0 +1,534 @@
+#!/usr/bin/env python3
+"""Watchdog liveness for the wake word and satellite launchers.
+
+``Restart=always`` only catches services that exit. A hung arecord, a wake
+word service that stops answering or a connection whose peer stopped
+reading leave the service "running" and deaf. With ``watchdog.enabled``
+the run-*.py launchers keep their service as a child instead of exec'ing
+it and poll these checks:
+
+- ``mic``: the satellite's mic command runs under ``liveness.py relay``,
+  which copies the capture's audio through unchanged and stamps a
+  heartbeat in /dev/shm on every read,
+- ``wake``: the wake word service must answer a describe,
+- ``wake-link``/``ha-link``: the satellite's connection to the wake word
+  service and Home Assistant's connection to the satellite must not hold
+  unsent data without draining (their send queues in /proc/net/tcp).
+
+A check failing for ``stall_seconds`` is a stall. It is recovered by
+restarting only the broken part: the mic capture (the relay respawns it
+and keeps the satellite's pipe open), the satellite, or the wake word
+service. A restart that does not bring the check back within
+``recover_seconds`` is followed by the next one on the check's ladder;
+past the last, the launcher exits and systemd restarts the whole unit.
+The launcher feeds systemd's watchdog (sd_notify) from its loop, so a
+wedged launcher is restarted as well.
+
+Time to detect (last sign of life -> stall) and time to recover (stall ->
+first sign of life) are logged and kept in /dev/shm/wyoming-liveness-*.json
+(``liveness.py status``). ``liveness.py drill`` runs the mic check
+against a fake audio source that stalls, without any services.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import mmap
+import os
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import wyoming_commands
+import wyoming_tap
+
+logger = logging.getLogger('wyoming-liveness')
+
+MIC_HEARTBEAT = Path('/dev/shm/wyoming-mic-heartbeat')
+METRICS_DIR = Path('/dev/shm')
+METRICS_PREFIX = 'wyoming-liveness-'
+DEFAULTS = {'enabled': False, 'timeout': 30, 'interval': 1.0, 'stall_seconds': 10,
+            'recover_seconds': 15, 'probe_timeout': 5}
+
+# Last frame (CLOCK_MONOTONIC ns, shared by all processes), bytes relayed, relay pid
+HEARTBEAT = struct.Struct('<QQI')
+READ_BYTES = 4096
+RESPAWN_DELAY = 1.0
+READY_TIMEOUT = 120
+STOP_TIMEOUT = 10
+# A stalled service is unlikely to exit cleanly; don't wait long for it
+STALL_STOP_TIMEOUT = 2
+STATS_INTERVAL = 300
+TCP_ESTABLISHED = '01'
+
+def watchdog_settings(config):
+    """The watchdog block of satellite.yaml with defaults filled in"""
+    settings = dict(DEFAULTS)
+    settings.update(config.get('watchdog') or {})
+    return settings
+
+def sd_notify(*messages):
+    """Send state lines to systemd's notify socket; False outside systemd"""
+    address = os.environ.get('NOTIFY_SOCKET')
+    if not address:
+        return False
+    if address.startswith('@'):
+        address = '\0' + address[1:]
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+        try:
+            sock.sendto('\n'.join(messages).encode(), address)
+        except OSError as e:
+            logger.warning(f"sd_notify failed: {e}")
+            return False
+    return True
+
+class Heartbeat:
+    """The relay's frame stamp in shared memory"""
+
+    def __init__(self, path):
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o664)
+        if os.fstat(self.fd).st_size < HEARTBEAT.size:
+            os.ftruncate(self.fd, HEARTBEAT.size)
+        self.map = mmap.mmap(self.fd, HEARTBEAT.size)
+        self.pid = os.getpid()
+        # No frame yet: a stamp left by an earlier relay must not look fresh
+        HEARTBEAT.pack_into(self.map, 0, 0, 0, self.pid)
+
+    def beat(self, relayed):
+        HEARTBEAT.pack_into(self.map, 0, time.monotonic_ns(), relayed, self.pid)
+
+def read_heartbeat(path):
+    """(last frame in monotonic seconds, bytes relayed, relay pid), or None"""
+    try:
+        stamp, relayed, pid = HEARTBEAT.unpack(Path(path).read_bytes()[:HEARTBEAT.size])
+    except (OSError, struct.error):
+        return None
+    return stamp / 1e9, relayed, pid
+
+def write_all(fd, data):
+    view = memoryview(data)
+    while view:
+        view = view[os.write(fd, view):]
+
+def relay(command, heartbeat_path, frame_bytes=2):
+    """Copy a capture command's stdout to ours, stamping the heartbeat per read
+
+    The capture is respawned when it exits or on SIGUSR1 (a stall) while
+    our stdout, the satellite's mic pipe, stays open throughout.
+    """
+    heartbeat = Heartbeat(heartbeat_path)
+    state = {'process': None, 'stopping': False, 'respawn': False}
+
+    def respawn(signum, frame):
+        state['respawn'] = True
+        if state['process'] is not None:
+            state['process'].kill()
+
+    def stop(signum, frame):
+        state['stopping'] = True
+        respawn(signum, frame)
+
+    signal.signal(signal.SIGUSR1, respawn)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    relayed = 0
+    while not state['stopping']:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE)
+        state['process'] = process
+        try:
+            while True:
+                data = os.read(process.stdout.fileno(), READ_BYTES)
+                if not data:
+                    break
+                write_all(1, data)
+                relayed += len(data)
+                heartbeat.beat(relayed)
+        except BrokenPipeError:
+            # The satellite is gone
+            state['stopping'] = True
+            process.kill()
+        process.stdout.close()
+        process.wait()
+        if state['stopping']:
+            break
+        # A capture killed mid-sample would shift every later sample by a byte
+        padding = -relayed % frame_bytes
+        if padding:
+            write_all(1, bytes(padding))
+            relayed += padding
+        if state['respawn']:
+            logger.warning("Capture stalled; restarting it")
+            state['respawn'] = False
+        else:
+            logger.warning(f"Capture exited with {process.returncode}; restarting it")
+            # Don't spin on a capture that fails straight away (device gone)
+            time.sleep(RESPAWN_DELAY)
+
+def send_queues(port, side):
+    """Send-queue bytes of established TCP sockets by their local or remote port"""
+    queues = []
+    for table in ('/proc/net/tcp', '/proc/net/tcp6'):
+        try:
+            lines = Path(table).read_text().splitlines()[1:]
+        except OSError:
+            continue
+        for line in lines:
+            fields = line.split()
+            address = fields[1] if side == 'local' else fields[2]
+            if fields[3] == TCP_ESTABLISHED and int(address.rsplit(':', 1)[1], 16) == port:
+                queues.append(int(fields[4].split(':')[0], 16))
+    return queues
+
+async def describe(port, timeout):
+    """True if the Wyoming service on port answers a describe with its info"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return False
+    try:
+        wyoming_tap.write_event(writer, 'describe')
+        await writer.drain()
+        event = await asyncio.wait_for(wyoming_tap.read_event(reader), timeout)
+        return event is not None and event[0] == 'info'
+    except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+        return False
+    finally:
+        writer.close()
+
+class MicFrames:
+    """Last sign of life: the relay's last frame"""
+
+    def __init__(self, path):
+        self.path = path
+
+    async def __call__(self):
+        beat = read_heartbeat(self.path)
+        return beat[0] if beat else 0.0
+
+class Responsive:
+    """Last sign of life: the last describe the service answered"""
+
+    def __init__(self, port, timeout):
+        self.port = port
+        self.timeout = timeout
+        self.last_ok = 0.0
+
+    async def __call__(self):
+        if await describe(self.port, self.timeout):
+            self.last_ok = time.monotonic()
+        return self.last_ok
+
+class Draining:
+    """Last sign of life: the last time a connection's send queue was empty or shrank
+
+    With peer_timeout the peer is a local Wyoming service: while it does
+    not answer a describe, the stall is the peer's (its own launcher
+    restarts it) rather than this link's.
+    """
+
+    def __init__(self, port, side, peer_timeout=None):
+        self.port = port
+        self.side = side
+        self.peer_timeout = peer_timeout
+        self.last_ok = 0.0
+        self.queued = 0
+
+    async def __call__(self):
+        queued = sum(send_queues(self.port, self.side))
+        if queued == 0 or queued < self.queued:
+            self.last_ok = time.monotonic()
+        elif self.peer_timeout and not await describe(self.port, self.peer_timeout):
+            self.last_ok = time.monotonic()
+        self.queued = queued
+        return self.last_ok
+
+class Service:
+    """The launcher's child: the wake word service or the satellite"""
+
+    def __init__(self, name, command, ports=(), feed=None, stdout=None):
+        self.name = name
+        self.command = command
+        self.ports = ports
+        self.feed = feed or (lambda: None)
+        self.stdout = stdout
+        self.process = None
+        self.started = 0.0
+
+    async def start(self):
+        args, env, cwd = self.command
+        self.process = await asyncio.create_subprocess_exec(*args, env=env, cwd=cwd, stdout=self.stdout)
+        self.started = time.monotonic()
+        logger.info(f"Started {self.name} (pid {self.process.pid})")
+
+    def exited(self):
+        return self.process is not None and self.process.returncode is not None
+
+    async def ready(self, timeout=READY_TIMEOUT):
+        """Wait until the ports accept connections, feeding the watchdog meanwhile"""
+        deadline = time.monotonic() + timeout
+        for port in self.ports:
+            while not wyoming_commands.port_open(port):
+                if self.exited() or time.monotonic() > deadline:
+                    return False
+                self.feed()
+                await asyncio.sleep(0.2)
+        return True
+
+    async def stop(self, timeout=STOP_TIMEOUT):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.name} did not stop in {timeout}s, killing it")
+            self.process.kill()
+            await self.process.wait()
+
+    async def restart(self):
+        await self.stop(STALL_STOP_TIMEOUT)
+        await self.start()
+        if not await self.ready():
+            logger.error(f"{self.name} not ready after restart")
+
+def respawn_capture(path):
+    """Recovery action: have the mic relay respawn its capture command"""
+    async def action():
+        beat = read_heartbeat(path)
+        try:
+            os.kill(beat[2], signal.SIGUSR1)
+        except (TypeError, ProcessLookupError, PermissionError) as e:
+            logger.error(f"Cannot signal the mic relay ({e})")
+    return action
+
+class Check:
+    """A liveness condition and its recovery ladder of (label, action) steps"""
+
+    def __init__(self, name, last_ok, ladder):
+        self.name = name
+        self.last_ok = last_ok
+        self.ladder = ladder
+        self.detected = None
+        self.acted = None
+        self.step = 0
+
+class Metrics:
+    """Stall counts and time to detect/recover per check"""
+
+    def __init__(self, name):
+        self.path = METRICS_DIR / f"{METRICS_PREFIX}{name}.json"
+        self.name = name
+        self.checks = {}
+        self.escalations = 0
+
+    def entry(self, check):
+        return self.checks.setdefault(check, {'stalls': 0, 'recovered': 0, 'detect_total': 0.0,
+                                              'detect_max': 0.0, 'recover_total': 0.0, 'recover_max': 0.0,
+                                              'last_stall': None})
+
+    def detected(self, check, seconds):
+        entry = self.entry(check)
+        entry['stalls'] += 1
+        entry['detect_total'] += seconds
+        entry['detect_max'] = max(entry['detect_max'], seconds)
+        entry['last_stall'] = datetime.now().isoformat(timespec='seconds')
+
+    def recovered(self, check, seconds):
+        entry = self.entry(check)
+        entry['recovered'] += 1
+        entry['recover_total'] += seconds
+        entry['recover_max'] = max(entry['recover_max'], seconds)
+
+    def summary(self):
+        checks = {}
+        for check, entry in self.checks.items():
+            checks[check] = {
+                'stalls': entry['stalls'],
+                'recovered': entry['recovered'],
+                'mttd_seconds': round(entry['detect_total'] / entry['stalls'], 2) if entry['stalls'] else None,
+                'max_detect_seconds': round(entry['detect_max'], 2),
+                'mttr_seconds': round(entry['recover_total'] / entry['recovered'], 2) if entry['recovered'] else None,
+                'max_recover_seconds': round(entry['recover_max'], 2),
+                'last_stall': entry['last_stall'],
+            }
+        return {'launcher': self.name, 'pid': os.getpid(), 'escalations': self.escalations, 'checks': checks}
+
+    def write(self):
+        temp_path = self.path.with_name(self.path.name + '.tmp')
+        try:
+            temp_path.write_text(json.dumps(self.summary()))
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Cannot write {self.path}: {e}")
+
+class Monitor:
+    """Polls the checks, runs recovery ladders and feeds systemd's watchdog"""
+
+    def __init__(self, name, settings):
+        self.settings = settings
+        self.metrics = Metrics(name)
+        self.last_feed = 0.0
+
+    def feed(self):
+        now = time.monotonic()
+        if now - self.last_feed >= 1:
+            sd_notify('WATCHDOG=1')
+            self.last_feed = now
+
+    async def act(self, check):
+        label, action = check.ladder[check.step]
+        logger.warning(f"{check.name}: {label}")
+        await action()
+        check.acted = time.monotonic()
+
+    async def poll(self, check, service):
+        """Advance one check; False if its ladder is exhausted"""
+        seen = await check.last_ok()
+        # Nothing is expected from a service that was (re)started just now
+        last_ok = max(seen, service.started)
+        now = time.monotonic()
+        if check.detected is None:
+            if now - last_ok >= self.settings['stall_seconds']:
+                check.detected, check.step = now, 0
+                self.metrics.detected(check.name, now - last_ok)
+                logger.warning(f"{check.name} stalled: no sign of life for {now - last_ok:.1f}s")
+                await self.act(check)
+                self.metrics.write()
+        elif seen > check.acted:
+            self.metrics.recovered(check.name, seen - check.detected)
+            logger.info(f"{check.name} recovered {seen - check.detected:.1f}s after the stall was detected")
+            check.detected = None
+            self.metrics.write()
+        elif now - check.acted >= self.settings['recover_seconds']:
+            check.step += 1
+            if check.step >= len(check.ladder):
+                return False
+            await self.act(check)
+        return True
+
+    async def run(self, service, checks, stopping):
+        """Watch the service until stopping is set; returns the exit code"""
+        last_stats = time.monotonic()
+        while not stopping.is_set():
+            if service.exited():
+                logger.error(f"{service.name} exited with {service.process.returncode}")
+                return service.process.returncode or 1
+            for check in checks:
+                if not await self.poll(check, service):
+                    logger.error(f"{check.name} did not recover; exiting so systemd restarts the unit")
+                    self.metrics.escalations += 1
+                    self.metrics.write()
+                    return 1
+            self.feed()
+            if time.monotonic() - last_stats >= STATS_INTERVAL:
+                last_stats = time.monotonic()
+                self.metrics.write()
+                logger.info(f"Liveness: {self.metrics.summary()['checks']}")
+            try:
+                await asyncio.wait_for(stopping.wait(), self.settings['interval'])
+            except asyncio.TimeoutError:
+                pass
+        return 0
+
+def satellite_checks(config, settings, service):
+    restart = ('restart the satellite', service.restart)
+    checks = [Check('mic', MicFrames(MIC_HEARTBEAT),
+                    [('restart the mic capture', respawn_capture(MIC_HEARTBEAT)), restart])]
+    if config.get('wake_word'):
+        checks.append(Check('wake-link', Draining(wyoming_commands.wake_uri_port(config), 'remote',
+                                                  settings['probe_timeout']), [restart]))
+    checks.append(Check('ha-link', Draining(config.get('port', wyoming_commands.DEFAULT_SATELLITE_PORT), 'local'),
+                        [restart]))
+    return checks
+
+def wakeword_checks(config, settings, service):
+    port = config.get('wake_word_port', wyoming_commands.DEFAULT_WAKE_WORD_PORT)
+    return [Check('wake', Responsive(port, settings['probe_timeout']),
+                  [('restart the wake word service', service.restart)])]
+
+async def supervise(name, command, ports, settings, make_checks, stdout=None):
+    """Run a service as a watched child; returns the launcher's exit code"""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    monitor = Monitor(name, settings)
+    # Enabled at runtime, so the units need no WatchdogSec for the exec mode
+    sd_notify(f"WATCHDOG_USEC={int(settings['timeout'] * 1e6)}")
+    service = Service(name, command, ports, monitor.feed, stdout)
+    await service.start()
+    if not await service.ready():
+        logger.error(f"{name} not accepting connections on {ports} after {READY_TIMEOUT}s")
+        await service.stop()
+        return 1
+    sd_notify('READY=1')
+    logger.info(f"{name} ready; watching it every {settings['interval']}s")
+    try:
+        return await monitor.run(service, make_checks(service), stopping)
+    finally:
+        await service.stop()
+        monitor.metrics.write()
+        logger.info(f"Liveness: {monitor.metrics.summary()}")
+
+async def drill(args):
+    """The mic check and its recovery against a fake audio source that stalls"""
+    heartbeat = Path(f"/tmp/wyoming-drill-heartbeat-{os.getpid()}")
+    source = [sys.executable, str(Path(__file__).with_name('benchmark.py')), 'feed',
+              '--stall-after', str(args.stall_after)]
+    command = ([sys.executable, str(Path(__file__).resolve()), 'relay', '--heartbeat', str(heartbeat), '--']
+               + source, None, None)
+    settings = dict(DEFAULTS, stall_seconds=args.stall_seconds, recover_seconds=args.recover_seconds,
+                    interval=args.interval)
+    checks = lambda service: [Check('mic', MicFrames(heartbeat), [('restart the mic capture',
+                                                                   respawn_capture(heartbeat))])]
+
+    async def stop_after():
+        await asyncio.sleep(args.duration)
+        os.kill(os.getpid(), signal.SIGTERM)
+    timer = asyncio.create_task(stop_after())
+    try:
+        await supervise('drill', command, [], settings, checks, stdout=subprocess.DEVNULL)
+    finally:
+        timer.cancel()
+        heartbeat.unlink(missing_ok=True)
+    metrics_path = METRICS_DIR / f"{METRICS_PREFIX}drill.json"
+    summary = json.loads(metrics_path.read_text())
+    metrics_path.unlink()
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Liveness checks for the Wyoming launchers")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    relay_parser = subparsers.add_parser('relay', help="Mic command wrapper that stamps a heartbeat per read")
+    relay_parser.add_argument('--heartbeat', type=Path, default=MIC_HEARTBEAT)
+    relay_parser.add_argument('--frame-bytes', type=int, default=2, help="Bytes per sample frame (default: S16 mono)")
+    relay_parser.add_argument('capture', nargs=argparse.REMAINDER, help="-- capture command")
+    subparsers.add_parser('status', help="Print every launcher's stall and recovery metrics")
+    drill_parser = subparsers.add_parser('drill', help="Stall a fake audio source and measure detect/recover")
+    drill_parser.add_argument('--stall-after', type=float, default=5, help="Seconds of audio before each stall")
+    drill_parser.add_argument('--duration', type=float, default=30)
+    drill_parser.add_argument('--stall-seconds', type=float, default=2)
+    drill_parser.add_argument('--recover-seconds', type=float, default=5)
+    drill_parser.add_argument('--interval', type=float, default=0.2)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'relay':
+        capture = args.capture[1:] if args.capture[:1] == ['--'] else args.capture
+        if not capture:
+            parser.error("relay needs a capture command after --")
+        relay(capture, args.heartbeat, args.frame_bytes)
+    elif args.command == 'status':
+        for path in sorted(METRICS_DIR.glob(f"{METRICS_PREFIX}*.json")):
+            print(json.dumps(json.loads(path.read_text()), indent=2))
+    else:
+        print(json.dumps(asyncio.run(drill(args)), indent=2))
+
+if __name__ == "__main__":
+    main()
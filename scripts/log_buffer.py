@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""Low-write logging for setup and the long-running services.
+
+By default setup.py writes every line straight to /var/log/wyoming/setup.log
+(including the whole pip/apt stderr when a step fails), and the services
+send every line to journald as it happens. On an SD card those small
+synchronous writes cost latency spikes and wear. With ``logging.mode:
+low-write`` a process's logging is switched over to:
+
+- a ``QueueHandler`` on the root logger: callers only format the message
+  and enqueue it (a full queue drops rather than blocks), and one thread
+  does all the writing,
+- a per-process log in RAM (/dev/shm/wyoming-log/<name>.log) that rotates
+  at ``ram_kb``, so ``tail -f`` still shows everything live,
+- for setup, batched appends to the log on disk every ``flush_interval``
+  seconds (and at exit), rotating at ``file_kb``,
+- journald only for ``journal_level`` and above,
+- repeated messages (same logger, level and text once numbers are masked)
+  limited to ``burst`` per ``burst_window`` seconds, and messages clipped to
+  ``max_message_bytes`` (keeping the tail, where pip and apt put the error).
+
+Bytes offered (what the default mode would have written) and bytes that
+went to disk and journald are reported every ``report_interval`` seconds
+and at exit, per hour, and kept in /dev/shm/wyoming-log/<name>.stats.json
+(``log_buffer.py stats``).
+"""
+import argparse
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger('wyoming-log')
+
+RAM_DIR = Path('/dev/shm/wyoming-log')
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DEFAULTS = {'mode': 'default', 'flush_interval': 300, 'ram_kb': 512, 'file_kb': 1024,
+            'journal_level': 'WARNING', 'burst': 5, 'burst_window': 60,
+            'max_message_bytes': 2000, 'report_interval': 3600}
+QUEUE_SIZE = 10000
+# Rate-limit keys kept before the ones outside the window are forgotten
+MAX_KEYS = 1000
+_NUMBERS = re.compile(r'\d+')
+
+def logging_settings(config):
+    """The logging block of config.yaml/satellite.yaml with defaults filled in"""
+    settings = dict(DEFAULTS)
+    settings.update(config.get('logging') or {})
+    return settings
+
+class WriteStats:
+    """Byte and write counters, reported per hour"""
+
+    COUNTERS = ('offered_bytes', 'ram_bytes', 'disk_bytes', 'disk_writes', 'journal_bytes',
+                'suppressed', 'clipped_bytes', 'dropped')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.totals = dict.fromkeys(self.COUNTERS, 0)
+        self.since = time.monotonic()
+
+    def add(self, counter, amount=1):
+        with self.lock:
+            self.totals[counter] += amount
+
+    def summary(self):
+        with self.lock:
+            totals = dict(self.totals)
+        hours = max(time.monotonic() - self.since, 1) / 3600
+        written = totals['disk_bytes'] + totals['journal_bytes']
+        return {
+            'hours': round(hours, 3),
+            **totals,
+            'offered_bytes_per_hour': round(totals['offered_bytes'] / hours),
+            'disk_bytes_per_hour': round(totals['disk_bytes'] / hours),
+            'disk_writes_per_hour': round(totals['disk_writes'] / hours),
+            'journal_bytes_per_hour': round(totals['journal_bytes'] / hours),
+            'reduction_percent': (round(100 * (1 - written / totals['offered_bytes']), 1)
+                                  if totals['offered_bytes'] else None),
+        }
+
+class RateLimit:
+    """Lets at most burst similar messages through per window"""
+
+    def __init__(self, burst, window, stats):
+        self.burst = burst
+        self.window = window
+        self.stats = stats
+        self.seen = {}
+
+    def allow(self, record):
+        """False to drop the record; annotates the first one after a suppressed run"""
+        key = (record.name, record.levelno, _NUMBERS.sub('#', record.getMessage()[:200]))
+        now = time.monotonic()
+        entry = self.seen.get(key)
+        if entry is None or now - entry[0] >= self.window:
+            suppressed = entry[2] if entry else 0
+            if suppressed:
+                record.msg = f"{record.getMessage()} ({suppressed} similar suppressed)"
+                record.args = None
+            if len(self.seen) >= MAX_KEYS:
+                self.seen = {k: v for k, v in self.seen.items() if now - v[0] < self.window}
+            self.seen[key] = [now, 1, 0]
+            return True
+        entry[1] += 1
+        if entry[1] > self.burst:
+            entry[2] += 1
+            self.stats.add('suppressed')
+            return False
+        return True
+
+    def take_suppressed(self):
+        """(logger, level, masked message, count) of runs suppressed and not reported yet"""
+        pending = []
+        for key, entry in self.seen.items():
+            if entry[2]:
+                pending.append((*key, entry[2]))
+                entry[2] = 0
+        return pending
+
+def clip(text, limit):
+    """text cut down to limit bytes: a quarter from the head, the rest from the tail"""
+    if len(text) <= limit:
+        return text, 0
+    head = limit // 4
+    tail = limit - head
+    removed = len(text) - head - tail
+    return f"{text[:head]} [... {removed} bytes clipped ...] {text[-tail:]}", removed
+
+class RotatingFile:
+    """Append-only file rotated to <name>.1 past max_bytes"""
+
+    def __init__(self, path, max_bytes):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def append(self, data):
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            size = os.fstat(fd).st_size
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+        if size + len(data) > self.max_bytes:
+            os.replace(self.path, self.path.with_name(self.path.name + '.1'))
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: a full queue drops the record and counts it"""
+
+    def __init__(self, log_queue, stats):
+        super().__init__(log_queue)
+        self.stats = stats
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.stats.add('dropped')
+
+class LowWriteLogging:
+    """The writer thread behind the queue, and where each line goes"""
+
+    def __init__(self, name, settings, persistent=None, stream=None):
+        self.name = name
+        self.settings = settings
+        self.stats = WriteStats()
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.handler = DroppingQueueHandler(self.queue, self.stats)
+        self.formatter = logging.Formatter(FORMAT)
+        self.limit = RateLimit(settings['burst'], settings['burst_window'], self.stats)
+        self.journal_level = logging.getLevelName(str(settings['journal_level']).upper())
+        self.stream = stream or sys.stderr
+        self.ram = RotatingFile(RAM_DIR / f"{name}.log", int(settings['ram_kb']) * 1024)
+        self.disk = RotatingFile(persistent, int(settings['file_kb']) * 1024) if persistent else None
+        self.pending = []
+        self.thread = threading.Thread(target=self.run, name='low-write-logging', daemon=True)
+
+    def start(self):
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+            handler.close()
+        root.addHandler(self.handler)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+
+    def write(self, record, journal=False):
+        clipped, removed = clip(record.getMessage(), self.settings['max_message_bytes'])
+        if removed:
+            record.msg, record.args = clipped, None
+            self.stats.add('clipped_bytes', removed)
+        line = (self.formatter.format(record) + '\n').encode()
+        self.ram.append(line)
+        self.stats.add('ram_bytes', len(line))
+        if self.disk is not None:
+            self.pending.append(line)
+        if journal or record.levelno >= self.journal_level:
+            try:
+                self.stream.write(line.decode())
+                self.stream.flush()
+            except (OSError, ValueError):
+                pass
+            self.stats.add('journal_bytes', len(line))
+
+    def handle(self, record):
+        # What the default mode would have written for this record
+        self.stats.add('offered_bytes', len(self.formatter.format(record)) + 1)
+        if self.limit.allow(record):
+            self.write(record)
+
+    def flush(self):
+        if not self.pending:
+            return
+        data = b''.join(self.pending)
+        self.pending = []
+        try:
+            self.disk.append(data)
+        except OSError as e:
+            self.stream.write(f"Cannot write {self.disk.path}: {e}\n")
+            return
+        self.stats.add('disk_bytes', len(data))
+        self.stats.add('disk_writes')
+
+    def report(self):
+        # A suppressed run is otherwise only reported by the next similar message
+        for name, level, message, count in self.limit.take_suppressed():
+            self.write(logger.makeRecord(name, level, __file__, 0,
+                                         f"{count} similar suppressed: {message}", None, None))
+        # Flushed first so the report counts the batch it is part of
+        self.flush()
+        summary = self.stats.summary()
+        record = logger.makeRecord(logger.name, logging.INFO, __file__, 0,
+                                   f"Log writes: {summary}", None, None)
+        self.write(record, journal=True)
+        self.flush()
+        try:
+            (RAM_DIR / f"{self.name}.stats.json").write_text(json.dumps(summary))
+        except OSError:
+            pass
+
+    def run(self):
+        next_flush = time.monotonic() + self.settings['flush_interval']
+        next_report = time.monotonic() + self.settings['report_interval']
+        while True:
+            timeout = max(0, min(next_flush, next_report) - time.monotonic())
+            try:
+                record = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                record = False
+            if record is None:
+                break
+            if record:
+                self.handle(record)
+            now = time.monotonic()
+            if now >= next_flush:
+                self.flush()
+                next_flush = now + self.settings['flush_interval']
+            if now >= next_report:
+                self.report()
+                next_report = now + self.settings['report_interval']
+        self.report()
+
+def apply(config, name, persistent=None):
+    """Switch this process to low-write logging if the config asks for it
+
+    Call after logging.basicConfig; returns the LowWriteLogging or None.
+    """
+    settings = logging_settings(config)
+    if settings['mode'] != 'low-write':
+        return None
+    low_write = LowWriteLogging(name, settings, persistent)
+    low_write.start()
+    logger.info(f"Low-write logging: RAM log {low_write.ram.path}, "
+                f"disk {persistent or 'none'}, journald from {settings['journal_level']}")
+    return low_write
+
+def main():
+    parser = argparse.ArgumentParser(description="Low-write logging statistics")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Print every process's log write statistics")
+    parser.parse_args()
+
+    for path in sorted(RAM_DIR.glob('*.stats.json')):
+        print(f"{path.name[:-len('.stats.json')]}: {path.read_text()}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,371 @@
+#!/usr/bin/env python3
+"""Serve per-unit resource metrics of the Wyoming services for Prometheus.
+
+Samples every ``wyoming-*`` unit's cgroup and the processes in it, plus the
+last setup run, and serves them in the Prometheus text format on
+``host:port`` (``/metrics``):
+
+- per unit: CPU seconds and memory (from the cgroup), summed RSS, PSS and
+  open file descriptors of its processes, process count and systemd's
+  restart count (``NRestarts``),
+- per audio command (arecord, aplay, parec, ...) in each unit: process
+  count, CPU seconds, RSS, open fds, context switches and the newest start
+  time, so a respawning or starved capture shows (no pid label, so a
+  respawn keeps its series),
+- setup: each step's duration and status from the last run
+  (/var/lib/wyoming/setup-timings.json).
+
+The cost is bounded: one thread samples every ``interval`` seconds and
+scrapes only read the text it rendered last, PSS (which walks page tables)
+is read every ``pss_every`` samples and at most ``max_processes`` per unit,
+and when a sample's CPU time exceeds ``budget`` of the interval the
+interval is stretched to fit. The exporter's own sample cost is exported
+too. ``--proc-root``/``--cgroup-root`` point it at other trees.
+"""
+import argparse
+import http.server
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+
+import log_buffer
+import wyoming_commands
+
+logger = logging.getLogger('wyoming-metrics')
+
+DEFAULTS = {'enabled': False, 'host': '127.0.0.1', 'port': 9474, 'interval': 15.0, 'budget': 0.01,
+            'pss_every': 4, 'max_processes': 64, 'restart_interval': 60.0}
+UNIT_GLOB = 'wyoming-*.service'
+# cgroup v2 first; v1 only has the pids in systemd's named hierarchy
+SLICE_DIRS = ['system.slice', 'systemd/system.slice']
+SETUP_TIMINGS = Path('/var/lib/wyoming/setup-timings.json')
+AUDIO_COMMANDS = {'arecord', 'aplay', 'parec', 'parecord', 'pacat', 'paplay', 'pw-cat', 'pw-record',
+                  'pw-play', 'sox', 'rec', 'play'}
+CLK_TCK = os.sysconf('SC_CLK_TCK')
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+METRICS = {
+    'wyoming_unit_cpu_seconds_total': ('counter', "CPU time used by the unit's cgroup"),
+    'wyoming_unit_memory_bytes': ('gauge', "Memory charged to the unit's cgroup"),
+    'wyoming_unit_memory_peak_bytes': ('gauge', "Peak memory charged to the unit's cgroup"),
+    'wyoming_unit_rss_bytes': ('gauge', "Resident memory summed over the unit's processes"),
+    'wyoming_unit_pss_bytes': ('gauge', "Proportional set size summed over the unit's processes"),
+    'wyoming_unit_open_fds': ('gauge', "Open file descriptors summed over the unit's processes"),
+    'wyoming_unit_processes': ('gauge', "Processes in the unit's cgroup"),
+    'wyoming_unit_restarts_total': ('counter', "Automatic restarts of the unit since boot (NRestarts)"),
+    'wyoming_audio_processes': ('gauge', "Running audio child processes of a command"),
+    'wyoming_audio_process_cpu_seconds_total': ('counter', "CPU time of a command's audio child processes"),
+    'wyoming_audio_process_rss_bytes': ('gauge', "Resident memory of a command's audio child processes"),
+    'wyoming_audio_process_open_fds': ('gauge', "Open file descriptors of a command's audio child processes"),
+    'wyoming_audio_process_context_switches_total': ('counter',
+                                                     "Context switches of a command's audio child processes"),
+    'wyoming_audio_process_start_time_seconds': ('gauge',
+                                                 "Start time of a command's newest audio child process (Unix time)"),
+    'wyoming_setup_step_seconds': ('gauge', "Duration of a setup step in the last setup run"),
+    'wyoming_setup_last_run_timestamp_seconds': ('gauge', "When the last setup run finished (Unix time)"),
+    'wyoming_exporter_sample_cpu_seconds': ('gauge', "CPU time the previous sample took"),
+    'wyoming_exporter_interval_seconds': ('gauge', "Current sampling interval after the CPU budget"),
+    'wyoming_exporter_samples_total': ('counter', "Samples taken"),
+}
+
+def metrics_settings(config):
+    """The metrics block of satellite.yaml with defaults filled in"""
+    settings = dict(DEFAULTS)
+    settings.update(config.get('metrics') or {})
+    return settings
+
+def read(path, default=None):
+    try:
+        return Path(path).read_text()
+    except OSError:
+        return default
+
+def key_values(text):
+    """{key: int} from 'key value' or 'Key:  value kB' lines (kB converted to bytes)"""
+    values = {}
+    for line in (text or '').splitlines():
+        parts = line.replace(':', ' ', 1).split()
+        if len(parts) >= 2 and parts[1].isdigit():
+            values[parts[0]] = int(parts[1]) * (1024 if parts[2:3] == ['kB'] else 1)
+    return values
+
+class Tree:
+    """/proc and the cgroup hierarchy under (possibly fake) roots"""
+
+    def __init__(self, proc_root='/proc', cgroup_root='/sys/fs/cgroup'):
+        self.proc = Path(proc_root)
+        self.cgroup = Path(cgroup_root)
+
+    def units(self):
+        """{unit name: cgroup directory} of every wyoming-* unit with a cgroup"""
+        units = {}
+        for slice_dir in SLICE_DIRS:
+            for path in sorted((self.cgroup / slice_dir).glob(UNIT_GLOB)):
+                units.setdefault(path.name[:-len('.service')], path)
+        return units
+
+    def pids(self, cgroup):
+        return [int(pid) for pid in (read(cgroup / 'cgroup.procs', '')).split() if pid.isdigit()]
+
+    def boot_time(self):
+        for line in (read(self.proc / 'stat', '')).splitlines():
+            if line.startswith('btime '):
+                return int(line.split()[1])
+        return None
+
+    def process(self, pid, pss=False):
+        """CPU, memory, fds and identity of one process; None if it is gone"""
+        base = self.proc / str(pid)
+        stat = read(base / 'stat')
+        if stat is None:
+            return None
+        comm = stat[stat.find('(') + 1:stat.rfind(')')]
+        fields = stat[stat.rfind(')') + 2:].split()
+        status = key_values(read(base / 'status'))
+        try:
+            fds = len(os.listdir(base / 'fd'))
+        except OSError:
+            fds = None  # not ours to look at
+        info = {
+            'pid': pid,
+            'comm': comm,
+            'cpu_seconds': (int(fields[11]) + int(fields[12])) / CLK_TCK,
+            'start_ticks': int(fields[19]),
+            'rss_bytes': status.get('VmRSS', 0),
+            'fds': fds,
+            'context_switches': status.get('voluntary_ctxt_switches', 0) + status.get('nonvoluntary_ctxt_switches', 0),
+        }
+        if pss:
+            info['pss_bytes'] = key_values(read(base / 'smaps_rollup')).get('Pss')
+        return info
+
+def systemd_restarts(units):
+    """{unit: NRestarts} from one systemctl call"""
+    if not units:
+        return {}
+    try:
+        output = subprocess.run(['systemctl', 'show', '-p', 'Id', '-p', 'NRestarts', *units],
+                                capture_output=True, text=True, timeout=10).stdout
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"Cannot read restart counts: {e}")
+        return {}
+    restarts, unit = {}, None
+    for line in output.splitlines():
+        key, _, value = line.partition('=')
+        if key == 'Id':
+            unit = value[:-len('.service')] if value.endswith('.service') else value
+        elif key == 'NRestarts' and unit and value.isdigit():
+            restarts[unit] = int(value)
+    return restarts
+
+def setup_timings(path=SETUP_TIMINGS):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+def render(samples):
+    """Prometheus text format from {metric: [(labels, value)]}"""
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        values = samples.get(name)
+        if not values:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in values:
+            label_text = ','.join(f'{key}="{escape(item)}"' for key, item in labels.items())
+            lines.append(f"{name}{{{label_text}}} {number(value)}" if label_text else f"{name} {number(value)}")
+    return '\n'.join(lines) + '\n'
+
+class Sampler:
+    """Takes samples within the CPU budget and keeps the last rendered text"""
+
+    def __init__(self, settings, tree, restarts=systemd_restarts, timings_path=SETUP_TIMINGS):
+        self.settings = settings
+        self.tree = tree
+        self.restarts = restarts
+        self.timings_path = timings_path
+        self.interval = settings['interval']
+        self.count = 0
+        self.cost = 0.0
+        self.restart_counts = {}
+        self.restarts_at = None
+        self.pss = {}
+        self.text = render({})
+
+    def sample(self):
+        """One pass over every unit; returns {metric: [(labels, value)]}"""
+        samples = {}
+        add = lambda name, labels, value: samples.setdefault(name, []).append((labels, value))
+        units = self.tree.units()
+        read_pss = self.count % max(1, int(self.settings['pss_every'])) == 0
+        boot_time = self.tree.boot_time()
+
+        if self.restarts and (self.restarts_at is None
+                              or time.monotonic() - self.restarts_at >= self.settings['restart_interval']):
+            self.restart_counts = self.restarts(list(units))
+            self.restarts_at = time.monotonic()
+
+        for unit, cgroup in units.items():
+            labels = {'unit': unit}
+            cpu = key_values(read(cgroup / 'cpu.stat')).get('usage_usec')
+            processes = [info for info in (self.tree.process(pid, read_pss) for pid in
+                                           self.tree.pids(cgroup)[:int(self.settings['max_processes'])])
+                         if info is not None]
+            if cpu is None:
+                cpu = sum(info['cpu_seconds'] for info in processes) * 1e6
+            add('wyoming_unit_cpu_seconds_total', labels, cpu / 1e6)
+            for metric, filename in (('wyoming_unit_memory_bytes', 'memory.current'),
+                                     ('wyoming_unit_memory_peak_bytes', 'memory.peak')):
+                value = (read(cgroup / filename) or '').strip()
+                if value.isdigit():
+                    add(metric, labels, int(value))
+            add('wyoming_unit_processes', labels, len(processes))
+            add('wyoming_unit_rss_bytes', labels, sum(info['rss_bytes'] for info in processes))
+            fds = [info['fds'] for info in processes if info['fds'] is not None]
+            if fds:
+                add('wyoming_unit_open_fds', labels, sum(fds))
+            if read_pss:
+                self.pss[unit] = sum(info.get('pss_bytes') or 0 for info in processes)
+            if unit in self.pss:
+                add('wyoming_unit_pss_bytes', labels, self.pss[unit])
+            if unit in self.restart_counts:
+                add('wyoming_unit_restarts_total', labels, self.restart_counts[unit])
+
+            # Keyed on the command, not the pid, so a respawn does not start a new series
+            commands = {}
+            for info in processes:
+                if info['comm'] in AUDIO_COMMANDS:
+                    commands.setdefault(info['comm'], []).append(info)
+            for command, children in sorted(commands.items()):
+                child = {'unit': unit, 'command': command}
+                add('wyoming_audio_processes', child, len(children))
+                add('wyoming_audio_process_cpu_seconds_total', child, sum(c['cpu_seconds'] for c in children))
+                add('wyoming_audio_process_rss_bytes', child, sum(c['rss_bytes'] for c in children))
+                fds = [c['fds'] for c in children if c['fds'] is not None]
+                if fds:
+                    add('wyoming_audio_process_open_fds', child, sum(fds))
+                add('wyoming_audio_process_context_switches_total', child,
+                    sum(c['context_switches'] for c in children))
+                if boot_time is not None:
+                    add('wyoming_audio_process_start_time_seconds', child,
+                        boot_time + max(c['start_ticks'] for c in children) / CLK_TCK)
+
+        timings = setup_timings(self.timings_path)
+        if timings:
+            for step in timings.get('steps', []):
+                # A step without a duration would fail the whole sample in number()
+                if not isinstance(step.get('seconds'), (int, float)):
+                    continue
+                add('wyoming_setup_step_seconds', {'step': step.get('name'), 'status': step.get('status')},
+                    step['seconds'])
+            add('wyoming_setup_last_run_timestamp_seconds', {}, timings.get('finished', 0))
+        return samples
+
+    def update(self):
+        start = time.thread_time()
+        samples = self.sample()
+        self.count += 1
+        add = lambda name, value: samples.setdefault(name, []).append(({}, value))
+        add('wyoming_exporter_sample_cpu_seconds', self.cost)
+        add('wyoming_exporter_interval_seconds', self.interval)
+        add('wyoming_exporter_samples_total', self.count)
+        self.text = render(samples)
+        self.cost = time.thread_time() - start
+        # Stretch the interval so sampling stays within its share of one CPU
+        interval = max(self.settings['interval'], self.cost / self.settings['budget'])
+        if interval > self.interval * 1.5 or interval < self.interval / 1.5:
+            logger.info(f"Sample took {self.cost * 1000:.1f} ms CPU; interval now {interval:.1f}s")
+        self.interval = interval
+
+    def run(self):
+        while True:
+            try:
+                self.update()
+            except Exception as e:
+                logger.error(f"Sample failed: {e}")
+            time.sleep(self.interval)
+
+def handler(sampler):
+    class MetricsHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = sampler.text.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # one log line per scrape is exactly the write load to avoid
+
+    return MetricsHandler
+
+def main():
+    parser = argparse.ArgumentParser(description="Prometheus exporter for the Wyoming units")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('serve', "Serve the metrics over HTTP"), ('sample', "Print one sample")):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+        sub.add_argument('--proc-root', type=Path, default=Path('/proc'))
+        sub.add_argument('--cgroup-root', type=Path, default=Path('/sys/fs/cgroup'))
+        sub.add_argument('--setup-timings', type=Path, default=SETUP_TIMINGS)
+        sub.add_argument('--no-systemd', action='store_true', help="Leave out systemd's restart counts")
+        if command == 'serve':
+            sub.add_argument('--port', type=int, help="Port to listen on (default: metrics.port)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        config = wyoming_commands.load_config(args.config)
+    except Exception as e:
+        if args.command == 'serve' and args.port is None:
+            logger.error(f"Error loading config: {e}")
+            sys.exit(1)
+        # A one-off sample or a test exporter on an explicit port needs no satellite.yaml
+        config = {}
+    settings = metrics_settings(config)
+    sampler = Sampler(settings, Tree(args.proc_root, args.cgroup_root),
+                      None if args.no_systemd else systemd_restarts, args.setup_timings)
+    if args.command == 'sample':
+        sampler.update()
+        print(sampler.text, end='')
+        return
+
+    log_buffer.apply(config, 'metrics')
+    if not settings['enabled'] and args.port is None:
+        logger.info("Metrics exporter disabled (metrics.enabled is false); not serving")
+        sys.exit(0)
+    port = args.port or settings['port']
+    server = http.server.ThreadingHTTPServer((settings['host'], port), handler(sampler))
+    threading.Thread(target=sampler.run, daemon=True).start()
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    logger.info(f"Serving metrics for {', '.join(sampler.tree.units()) or 'no units yet'} "
+                f"on {settings['host']}:{port}/metrics every {settings['interval']}s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""Capture the mic once into a shared-memory ring buffer that many readers share.
+
+The capture daemon owns the ALSA device (or a file-backed source for
+testing) and reads 16 kHz S16_LE frames straight into a ring in
+/dev/shm. Readers map the same file and consume it through memoryviews
+of the mapping, each with its own cursor; a reader that falls more than
+one ring behind skips to the live position and the skipped bytes are
+counted against its slot, so overruns are visible per consumer. When the
+capture daemon exits it clears its pid and removes the ring, unless a live
+reader is still attached (a restarting capture then resumes the same ring).
+
+The satellite's mic command becomes ``mic_ring.py read``, which writes
+the ring to stdout, and diagnostics can read the live audio without
+opening (or being locked out of) the device.
+"""
+import argparse
+import atexit
+import fcntl
+import json
+import logging
+import mmap
+import os
+import shlex
+import signal
+import struct
+import subprocess
+import sys
+import time
+import wave
+from pathlib import Path
+
+import log_buffer
+import wyoming_commands
+
+logger = logging.getLogger('wyoming-mic')
+
+RING_PATH = Path('/dev/shm/wyoming-mic')
+MAGIC = b'WYMIC001'
+RATE = 16000
+WIDTH = 2
+CHANNELS = 1
+# Four seconds of audio; a reader further behind than this has overrun
+CAPACITY = RATE * WIDTH * CHANNELS * 4
+CHUNK_BYTES = 1024 * WIDTH * CHANNELS
+# How often an idle reader checks for new audio
+POLL_INTERVAL = 0.01
+
+# magic, rate, width, channels, capacity, write position (total bytes ever written), writer pid
+HEADER = struct.Struct('<8sIIIIQI')
+WRITE_POS_OFFSET = 24
+WRITER_PID_OFFSET = 32
+# pid, cursor, overrun bytes, overrun count
+SLOT = struct.Struct('<IQQQ')
+SLOTS = 8
+SLOTS_OFFSET = 64
+DATA_OFFSET = 4096
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class Ring:
+    """A mapping of the ring file; shared by the writer and readers"""
+
+    def __init__(self, path, create=False, capacity=CAPACITY):
+        self.path = Path(path)
+        flags = os.O_RDWR | (os.O_CREAT if create else 0)
+        self.fd = os.open(self.path, flags, 0o664)
+        size = DATA_OFFSET + capacity
+        if create and os.fstat(self.fd).st_size != size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, os.fstat(self.fd).st_size)
+        self.view = memoryview(self.map)
+        if create and self.header()[:5] != (MAGIC, RATE, WIDTH, CHANNELS, capacity):
+            # Keep an existing ring (and its write position) across capture restarts
+            self.map[:DATA_OFFSET] = bytes(DATA_OFFSET)
+            HEADER.pack_into(self.map, 0, MAGIC, RATE, WIDTH, CHANNELS, capacity, 0, 0)
+        magic, rate, width, channels, self.capacity, _, _ = self.header()
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a mic ring")
+        self.frame = width * channels
+        # The writer may be filling up to one chunk past write_pos, so only
+        # this much behind it is safe to read
+        self.window = self.capacity - CHUNK_BYTES
+        self.data = self.view[DATA_OFFSET:DATA_OFFSET + self.capacity]
+
+    def header(self):
+        return HEADER.unpack_from(self.map, 0)
+
+    def write_pos(self):
+        return struct.unpack_from('<Q', self.map, WRITE_POS_OFFSET)[0]
+
+    def slot(self, index):
+        return SLOT.unpack_from(self.map, SLOTS_OFFSET + index * SLOT.size)
+
+    def set_slot(self, index, pid, cursor, overrun_bytes, overruns):
+        SLOT.pack_into(self.map, SLOTS_OFFSET + index * SLOT.size, pid, cursor, overrun_bytes, overruns)
+
+    def status(self):
+        magic, rate, width, channels, capacity, position, writer = self.header()
+        readers = []
+        for index in range(SLOTS):
+            pid, cursor, overrun_bytes, overruns = self.slot(index)
+            if pid and _pid_alive(pid):
+                readers.append({'slot': index, 'pid': pid, 'lag_bytes': position - cursor,
+                                'overrun_bytes': overrun_bytes, 'overruns': overruns})
+        return {'path': str(self.path), 'rate': rate, 'width': width, 'channels': channels,
+                'capacity': capacity, 'write_pos': position,
+                'writer_pid': writer if writer and _pid_alive(writer) else None, 'readers': readers}
+
+    def remove_if_unused(self):
+        """Delete the ring file unless a live reader holds a slot; True if deleted"""
+        # Under the slot lock, so no reader claims a slot in the file being removed
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+        try:
+            if any(pid and _pid_alive(pid) for pid, _, _, _ in map(self.slot, range(SLOTS))):
+                return False
+            self.path.unlink(missing_ok=True)
+            return True
+        finally:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+class Writer:
+    """The single producer; fills the ring from a source file object"""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.position = ring.write_pos()
+        self.pending = 0
+        HEADER.pack_into(ring.map, 0, MAGIC, RATE, WIDTH, CHANNELS, ring.capacity, self.position, os.getpid())
+
+    def fill(self, source):
+        """Read once from source directly into the ring; False at EOF"""
+        offset = (self.position + self.pending) % self.ring.capacity
+        limit = min(CHUNK_BYTES, self.ring.capacity - offset)
+        count = source.readinto(self.ring.data[offset:offset + limit])
+        if not count:
+            return False
+        self.pending += count
+        # Only publish whole frames so readers never split a sample
+        publish = self.pending - self.pending % self.ring.frame
+        if publish:
+            self.position += publish
+            self.pending -= publish
+            struct.pack_into('<Q', self.ring.map, WRITE_POS_OFFSET, self.position)
+        return True
+
+    def close(self):
+        """Mark the ring as having no writer; the write position is kept"""
+        struct.pack_into('<I', self.ring.map, WRITER_PID_OFFSET, 0)
+
+class Reader:
+    """One consumer with its own cursor and overrun accounting"""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self.slot = self._claim()
+        self.cursor = ring.write_pos()
+        self.overrun_bytes = 0
+        self.overruns = 0
+        self._publish()
+        atexit.register(self.close)
+
+    def _claim(self):
+        # The lock only serializes slot claims between readers
+        fcntl.flock(self.ring.fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self.ring.fd).st_nlink == 0:
+                # Removed by an exiting capture daemon after it was opened
+                raise FileNotFoundError(f"{self.ring.path} was removed")
+            for index in range(SLOTS):
+                pid = self.ring.slot(index)[0]
+                if not pid or not _pid_alive(pid):
+                    self.ring.set_slot(index, os.getpid(), self.ring.write_pos(), 0, 0)
+                    return index
+        finally:
+            fcntl.flock(self.ring.fd, fcntl.LOCK_UN)
+        raise RuntimeError(f"All {SLOTS} reader slots of {self.ring.path} are in use")
+
+    def _publish(self):
+        self.ring.set_slot(self.slot, os.getpid(), self.cursor, self.overrun_bytes, self.overruns)
+
+    def _check_overrun(self, position):
+        lost = position - self.cursor - self.ring.window
+        if lost > 0:
+            # Skip to live audio rather than replaying stale audio late
+            self.overrun_bytes += position - self.cursor
+            self.overruns += 1
+            self.cursor = position
+            self._publish()
+            logger.warning(f"Reader slot {self.slot} overran the ring by {lost} bytes")
+            return True
+        return False
+
+    def available(self):
+        """Return memoryviews (at most two, on wrap) of the unread audio"""
+        position = self.ring.write_pos()
+        self._check_overrun(position)
+        if position == self.cursor:
+            return []
+        start = self.cursor % self.ring.capacity
+        end = start + (position - self.cursor)
+        if end <= self.ring.capacity:
+            return [self.ring.data[start:end]]
+        return [self.ring.data[start:], self.ring.data[:end - self.ring.capacity]]
+
+    def consumed(self, count):
+        """Advance past count bytes; False if the writer lapped them meanwhile"""
+        position = self.ring.write_pos()
+        lapped = position - self.cursor > self.ring.window
+        self.cursor += count
+        if lapped:
+            # Part of what was just handed out was overwritten while in use
+            self.overrun_bytes += count
+            self.overruns += 1
+            self.cursor = position
+            logger.warning(f"Reader slot {self.slot} was lapped while reading {count} bytes")
+        self._publish()
+        return not lapped
+
+    def stream(self, fd):
+        """Write audio to fd as it arrives, forever"""
+        while True:
+            views = self.available()
+            if not views:
+                time.sleep(POLL_INTERVAL)
+                continue
+            for view in views:
+                written = 0
+                while written < len(view):
+                    written += os.write(fd, view[written:])
+                if not self.consumed(len(view)):
+                    break
+
+    def close(self):
+        if not self.ring.map.closed and self.ring.slot(self.slot)[0] == os.getpid():
+            self.ring.set_slot(self.slot, 0, self.cursor, self.overrun_bytes, self.overruns)
+
+class PacedFile:
+    """File-backed source that loops a WAV/raw file at real-time pace"""
+
+    def __init__(self, path):
+        if str(path).endswith('.wav'):
+            with wave.open(str(path), 'rb') as wav:
+                if (wav.getframerate(), wav.getsampwidth(), wav.getnchannels()) != (RATE, WIDTH, CHANNELS):
+                    raise ValueError(f"{path} must be {RATE} Hz, 16-bit, mono")
+                self.audio = wav.readframes(wav.getnframes())
+        else:
+            self.audio = Path(path).read_bytes()
+        if not self.audio:
+            raise ValueError(f"{path} has no audio")
+        self.offset = 0
+        self.deadline = time.monotonic()
+
+    def readinto(self, buffer):
+        count = min(len(buffer), len(self.audio) - self.offset)
+        buffer[:count] = self.audio[self.offset:self.offset + count]
+        self.offset = (self.offset + count) % len(self.audio)
+        self.deadline += count / (RATE * WIDTH * CHANNELS)
+        delay = self.deadline - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        return count
+
+def capture_command(config):
+    """The device capture command that setup.py rendered for ring mode"""
+    return config.get('mic', {}).get('capture_command')
+
+def capture(ring_path, command=None, file=None):
+    """Run the capture daemon until the source ends or SIGTERM"""
+    ring = Ring(ring_path, create=True)
+    writer = Writer(ring)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if file:
+        source, process = PacedFile(file), None
+        logger.info(f"Capturing from {file} into {ring_path}")
+    else:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, bufsize=0)
+        source = process.stdout
+        logger.info(f"Capturing from '{' '.join(command)}' into {ring_path}")
+    try:
+        while writer.fill(source):
+            pass
+    finally:
+        if process is not None and process.poll() is None:
+            process.terminate()
+            process.wait()
+        writer.close()
+        if ring.remove_if_unused():
+            logger.info(f"Removed {ring_path}")
+    logger.error("Audio source ended")
+    return False
+
+def open_ring(ring_path, timeout=None):
+    """Map an existing ring, waiting for the capture daemon to create it"""
+    start = time.monotonic()
+    while True:
+        try:
+            return Ring(ring_path)
+        except (FileNotFoundError, ValueError):
+            if timeout is not None and time.monotonic() - start >= timeout:
+                raise
+            time.sleep(0.5)
+
+def main():
+    parser = argparse.ArgumentParser(description="Shared-memory mic capture ring")
+    parser.add_argument('--path', type=Path, default=RING_PATH)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    cap = subparsers.add_parser('capture', help="Own the device and fill the ring")
+    cap.add_argument('--source-command', help="Capture command (default: mic.capture_command in satellite.yaml)")
+    cap.add_argument('--file', type=Path, help="Loop a 16 kHz S16_LE mono WAV/raw file instead of a device")
+    cap.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    subparsers.add_parser('read', help="Write the live ring audio to stdout")
+    subparsers.add_parser('status', help="Show write position and per-reader lag/overruns")
+    args = parser.parse_args()
+
+    # stdout carries audio for 'read', so log to stderr only
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'capture':
+        try:
+            config = wyoming_commands.load_config(args.config)
+        except Exception as e:
+            if not args.file and not args.source_command:
+                logger.error(f"Error loading config: {e}")
+                sys.exit(1)
+            # A test capture from an explicit source needs no satellite.yaml
+            config = {}
+        log_buffer.apply(config, 'mic-ring')
+        command = shlex.split(args.source_command) if args.source_command else None
+        if not args.file and not command:
+            command = capture_command(config)
+            if not command:
+                # Ring mode is off and the satellite opens the device itself
+                logger.info(f"No mic.capture_command in {args.config} (mic_ring disabled); not capturing")
+                sys.exit(0)
+        capture(args.path, command, args.file)
+        sys.exit(1)
+    elif args.command == 'read':
+        while True:
+            try:
+                reader = Reader(open_ring(args.path))
+                break
+            except FileNotFoundError:
+                time.sleep(0.5)
+        try:
+            reader.stream(sys.stdout.fileno())
+        except BrokenPipeError:
+            pass
+    else:
+        print(json.dumps(Ring(args.path).status(), indent=2))
+
+if __name__ == "__main__":
+    main()
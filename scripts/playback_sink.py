@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+"""Long-lived playback sink that keeps the speaker open between responses.
+
+With ``--snd-command`` wyoming-satellite starts aplay for every TTS
+response and chime, so each one pays process start, device open and plug
+setup before the first sample is audible. This daemon is a Wyoming sound
+service the satellite reaches with ``--snd-uri`` instead:
+
+- the player (the speaker block's aplay command, with ``-B``/``-F`` set
+  from ``buffer_ms``/``period_ms``) is started once and fed raw PCM over
+  its stdin pipe,
+- between responses it is fed silence, never much more than one period
+  ahead, so the device does not underrun and new audio is not queued
+  behind a long tail of silence; after ``idle_close`` seconds without
+  audio (0 = never) the device is released and reopened on the next
+  response,
+- the player is only restarted when a response arrives in another
+  rate/width/channels than the open one,
+- time-to-first-audio (audio-start received -> first sample audible,
+  counting whatever was still queued ahead of it) is logged per response,
+  returned in the ``played`` event and histogrammed. Responses that had
+  to reopen the player are flagged ``reopened``; their figure cannot see
+  how long the player itself took to open the device.
+
+``--sink null`` and ``--sink file:PATH`` replace the device for testing;
+they are paced like a device, so ``played`` and the timings behave the same.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import signal
+import sys
+import time
+import wave
+
+import log_buffer
+import wyoming_commands
+import wyoming_tap
+
+logger = logging.getLogger('wyoming-snd')
+
+DEFAULTS = {'port': wyoming_commands.DEFAULT_PLAYBACK_SINK_PORT, 'buffer_ms': 100,
+            'period_ms': 20, 'idle_close': 0}
+# What the satellite sends unless told otherwise (Piper voices, chimes)
+DEFAULT_FORMAT = (22050, 2, 1)
+# ALSA sample format per sample width in bytes
+FORMATS = {1: 'U8', 2: 'S16_LE', 3: 'S24_3LE', 4: 'S32_LE'}
+STATS_INTERVAL = 300
+
+def sink_settings(config):
+    """The playback_sink block of satellite.yaml with defaults filled in"""
+    settings = dict(DEFAULTS)
+    settings.update(config.get('playback_sink') or {})
+    return settings
+
+def command_format(command):
+    """(rate, width, channels) an aplay command line plays, DEFAULT_FORMAT for anything unset"""
+    rate, width, channels = DEFAULT_FORMAT
+    widths = {name: size for size, name in FORMATS.items()}
+    for flag, value in zip(command, command[1:]):
+        if flag == '-r':
+            rate = int(value)
+        elif flag == '-c':
+            channels = int(value)
+        elif flag == '-f':
+            width = widths.get(value, width)
+    return rate, width, channels
+
+def player_command(command, fmt, buffer_ms, period_ms):
+    """The speaker command for one stream format, with aplay's buffer and period sizes
+
+    A hw: device only takes the format it was chosen for; any other stream
+    format goes through plughw: so ALSA converts it.
+    """
+    rate, width, channels = fmt
+    values = {'-r': str(rate), '-c': str(channels), '-f': FORMATS[width]}
+    convert = fmt != command_format(command)
+    args = [command[0]]
+    rest = iter(command[1:])
+    for arg in rest:
+        if arg in values or arg in ('-B', '-F'):
+            next(rest, None)
+        elif convert and arg.startswith('hw:'):
+            args.append('plug' + arg)
+        else:
+            args.append(arg)
+    for flag, value in values.items():
+        args.extend([flag, value])
+    if os.path.basename(args[0]) == 'aplay':
+        args.extend(['-B', str(int(buffer_ms * 1000)), '-F', str(int(period_ms * 1000))])
+    return args
+
+def silence(fmt, seconds):
+    rate, width, channels = fmt
+    frames = int(rate * seconds)
+    # U8 is unsigned, so its silence is the mid value
+    return (b'\x80' if width == 1 else bytes(1)) * (frames * width * channels)
+
+class Sink:
+    """Paced PCM output; subclasses hand the bytes to a device, a file or nowhere"""
+
+    keepalive = False
+
+    def __init__(self):
+        self.format = None
+        # When the audio written so far will have finished playing
+        self.deadline = 0.0
+
+    async def open(self, fmt):
+        self.format = fmt
+        self.deadline = time.monotonic()
+
+    async def close(self):
+        self.format = None
+
+    async def output(self, pcm):
+        pass
+
+    def queued(self):
+        """Seconds of audio written but not played yet"""
+        return max(0.0, self.deadline - time.monotonic())
+
+    async def write(self, pcm):
+        await self.output(pcm)
+        rate, width, channels = self.format
+        self.deadline = max(self.deadline, time.monotonic()) + len(pcm) / (rate * width * channels)
+
+class NullSink(Sink):
+    """Discards audio"""
+
+    def __str__(self):
+        return 'null sink'
+
+class FileSink(Sink):
+    """Appends raw PCM to a file"""
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.file = None
+
+    def __str__(self):
+        return f"file {self.path}"
+
+    async def open(self, fmt):
+        await super().open(fmt)
+        self.file = open(self.path, 'ab')
+
+    async def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        await super().close()
+
+    async def output(self, pcm):
+        self.file.write(pcm)
+        # Flushed like a device would have played it, so the file can be read while open
+        self.file.flush()
+
+class PlayerSink(Sink):
+    """A persistent player process (aplay) that holds the device open"""
+
+    keepalive = True
+
+    def __init__(self, command, buffer_ms, period_ms):
+        super().__init__()
+        self.command = command
+        self.buffer_ms = buffer_ms
+        self.period_ms = period_ms
+        self.process = None
+
+    def __str__(self):
+        return ' '.join(self.command)
+
+    async def open(self, fmt):
+        args = player_command(self.command, fmt, self.buffer_ms, self.period_ms)
+        self.process = await asyncio.create_subprocess_exec(*args, stdin=asyncio.subprocess.PIPE)
+        logger.info(f"Opened player: {' '.join(args)}")
+        await super().open(fmt)
+
+    async def close(self):
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+                await self.process.wait()
+            except (ProcessLookupError, BrokenPipeError, ConnectionResetError):
+                pass
+            self.process = None
+        await super().close()
+
+    async def output(self, pcm):
+        try:
+            self.process.stdin.write(pcm)
+            await self.process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            # The player died (device unplugged, xrun it could not recover); start over once
+            logger.warning(f"Player exited with {self.process.returncode}; reopening")
+            fmt = self.format
+            await self.close()
+            await self.open(fmt)
+            self.process.stdin.write(pcm)
+            await self.process.stdin.drain()
+
+def make_sink(spec, speaker_command, settings):
+    """Sink for --sink: device (the speaker block's command), null or file:PATH"""
+    if spec == 'null':
+        return NullSink()
+    if spec.startswith('file:'):
+        return FileSink(spec[len('file:'):])
+    if not speaker_command:
+        raise ValueError("satellite.yaml has no speaker command")
+    return PlayerSink(speaker_command, settings['buffer_ms'], settings['period_ms'])
+
+class Playback:
+    """Feeds one sink from successive satellite connections"""
+
+    def __init__(self, sink, settings, initial_format=DEFAULT_FORMAT):
+        self.sink = sink
+        self.settings = settings
+        self.initial_format = initial_format
+        self.period = settings['period_ms'] / 1000
+        self.idle_close = settings['idle_close']
+        self.lock = asyncio.Lock()
+        self.last_audio = time.monotonic()
+        self.responses = 0
+        self.reopens = 0
+        self.ttfa = wyoming_tap.new_histogram()
+
+    async def prepare(self, fmt):
+        """Make sure the sink plays fmt; True if it had to be (re)opened"""
+        async with self.lock:
+            if self.sink.format == fmt:
+                return False
+            if self.sink.format is not None:
+                logger.info(f"Stream format {fmt} differs from {self.sink.format}; reopening")
+                await self.sink.close()
+            await self.sink.open(fmt)
+        return True
+
+    async def write(self, pcm):
+        async with self.lock:
+            await self.sink.write(pcm)
+        self.last_audio = time.monotonic()
+
+    async def keep_fed(self):
+        """Top the device up with silence while idle, and release it after idle_close"""
+        await self.prepare(self.initial_format)
+        while True:
+            await asyncio.sleep(self.period)
+            if self.sink.format is None:
+                continue
+            idle = time.monotonic() - self.last_audio
+            if self.idle_close and idle >= self.idle_close and not self.sink.queued():
+                async with self.lock:
+                    await self.sink.close()
+                logger.info(f"Idle for {idle:.0f}s; released {self.sink}")
+                continue
+            if self.sink.keepalive and self.sink.queued() < self.period:
+                async with self.lock:
+                    await self.sink.write(silence(self.sink.format, self.period))
+
+    def event_format(self, data):
+        """(rate, width, channels) of an audio event, None if it can't be played
+
+        Fields the event leaves out are taken from the current (or initial) format.
+        """
+        current = self.sink.format or self.initial_format
+        fmt = tuple(data.get(key) if data.get(key) is not None else default
+                    for key, default in zip(('rate', 'width', 'channels'), current))
+        rate, width, channels = fmt
+        if not (isinstance(rate, int) and rate > 0 and isinstance(channels, int) and channels > 0
+                and width in FORMATS):
+            logger.warning(f"Ignoring audio with unsupported format rate={rate} width={width} channels={channels}")
+            return None
+        return fmt
+
+    async def handle(self, reader, writer):
+        wyoming_tap.set_nodelay(writer)
+        started = first = None
+        reopened = False
+        audio_bytes = 0
+        try:
+            while True:
+                event = await wyoming_tap.read_event(reader)
+                if event is None:
+                    break
+                event_type, data, payload = event
+                if event_type == 'audio-start':
+                    started = time.monotonic()
+                    first = None
+                    audio_bytes = 0
+                    fmt = self.event_format(data)
+                    if fmt is not None:
+                        reopened = await self.prepare(fmt)
+                        self.reopens += reopened
+                elif event_type == 'audio-chunk' and payload:
+                    fmt = self.event_format(data)
+                    if fmt is None:
+                        continue
+                    if await self.prepare(fmt):
+                        reopened = True
+                        self.reopens += 1
+                    if first is None:
+                        # Everything already queued plays before this chunk
+                        ahead = self.sink.queued()
+                        await self.write(payload)
+                        first = time.monotonic() - (started or time.monotonic()) + ahead
+                    else:
+                        await self.write(payload)
+                    audio_bytes += len(payload)
+                elif event_type == 'audio-stop':
+                    await asyncio.sleep(self.sink.queued())
+                    report = self.finish(first, reopened, audio_bytes)
+                    wyoming_tap.write_event(writer, 'played', report)
+                    await writer.drain()
+                    started = first = None
+                    reopened = False
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def finish(self, first, reopened, audio_bytes):
+        """Record one finished response and return what is reported for it"""
+        self.responses += 1
+        rate, width, channels = self.sink.format or DEFAULT_FORMAT
+        report = {'ttfa_ms': round(first * 1000, 1) if first is not None else None,
+                  'audio_seconds': round(audio_bytes / (rate * width * channels), 2),
+                  'reopened': reopened}
+        if first is not None:
+            wyoming_tap.observe(self.ttfa, first)
+        logger.info(f"Played response: {report}")
+        return report
+
+    def stats(self):
+        return {'responses': self.responses, 'reopens': self.reopens,
+                'ttfa_p50_ms': wyoming_tap.percentile(self.ttfa, 50),
+                'ttfa_p95_ms': wyoming_tap.percentile(self.ttfa, 95)}
+
+async def report(playback):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        logger.info(f"Playback stats: {playback.stats()}")
+
+async def serve(port, playback):
+    server = await asyncio.start_server(playback.handle, '127.0.0.1', port)
+    logger.info(f"Playback sink on port {port} -> {playback.sink} ({playback.settings})")
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    tasks = [asyncio.create_task(playback.keep_fed()), asyncio.create_task(report(playback))]
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await playback.sink.close()
+
+async def play(port, path, chunk_seconds=0.05):
+    """Send a WAV to the sink the way the satellite does; return the played report"""
+    with wave.open(str(path), 'rb') as wav:
+        rate, width, channels = wav.getframerate(), wav.getsampwidth(), wav.getnchannels()
+        audio = wav.readframes(wav.getnframes())
+    fmt = {'rate': rate, 'width': width, 'channels': channels}
+    step = int(rate * chunk_seconds) * width * channels
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    start = time.monotonic()
+    wyoming_tap.write_event(writer, 'audio-start', fmt)
+    for offset in range(0, len(audio), step):
+        wyoming_tap.write_event(writer, 'audio-chunk', fmt, audio[offset:offset + step])
+    wyoming_tap.write_event(writer, 'audio-stop')
+    await writer.drain()
+    event = await wyoming_tap.read_event(reader)
+    writer.close()
+    report = event[1] if event else {}
+    report['round_trip_seconds'] = round(time.monotonic() - start, 2)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent playback sink for the satellite")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('serve', help="Run the sink")
+    run.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    run.add_argument('--sink', default='device', help="device (default), null or file:PATH")
+    run.add_argument('--port', type=int, help="Port to listen on (default: playback_sink.port)")
+    test = subparsers.add_parser('play', help="Play a WAV through a running sink and report timings")
+    test.add_argument('wav')
+    test.add_argument('--port', type=int, default=wyoming_commands.DEFAULT_PLAYBACK_SINK_PORT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'play':
+        print(json.dumps(asyncio.run(play(args.port, args.wav)), indent=2))
+        return
+
+    try:
+        config = wyoming_commands.load_config(args.config)
+    except Exception as e:
+        if args.port is None:
+            logger.error(f"Error loading config: {e}")
+            sys.exit(1)
+        # A test sink on an explicit port needs no satellite.yaml
+        config = {}
+    log_buffer.apply(config, 'playback-sink')
+    port = args.port or wyoming_commands.playback_sink_port(config)
+    if port is None:
+        # The satellite starts the speaker command itself
+        logger.info("Playback sink disabled (playback_sink.enabled is false or no speaker); not serving")
+        sys.exit(0)
+    settings = sink_settings(config)
+    settings['port'] = port
+    speaker_command = config.get('speaker', {}).get('command', [])
+    try:
+        sink = make_sink(args.sink, speaker_command, settings)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    initial_format = command_format(speaker_command) if speaker_command else DEFAULT_FORMAT
+    try:
+        asyncio.run(serve(port, Playback(sink, settings, initial_format)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""Precompile the Wyoming checkouts and venvs, and profile service imports.
+
+The services run as admin against checkouts setup.py created as root, so
+the interpreter cannot write .pyc files and every restart recompiles the
+whole import graph. Compiling ahead of time with the venv's own interpreter
+fixes that; hash-based pycs stay valid when the clock jumps (no RTC on a
+Pi). ``profile`` runs a service's module with ``-X importtime`` and keeps a
+ranked list of the slowest imports, diffed against the previous profile.
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+logger = logging.getLogger('wyoming-setup.precompile')
+
+INVALIDATION_MODES = ['timestamp', 'checked-hash', 'unchecked-hash']
+PROFILE_DIR = Path('/var/lib/wyoming/importtime')
+
+SERVICES = {
+    'satellite': {
+        'module': 'wyoming_satellite',
+        'venv': Path("/home/admin/.wyoming-satellite"),
+        'repo': Path("/home/admin/.wyoming/wyoming-satellite"),
+    },
+    'wakeword': {
+        'module': 'wyoming_openwakeword',
+        'venv': Path("/home/admin/.wyoming-openwakeword"),
+        'repo': Path("/home/admin/.wyoming/wyoming-openwakeword"),
+    },
+}
+
+def precompile(venv_path, paths, invalidation='timestamp'):
+    """Compile every module under paths with the venv's interpreter
+
+    Uses the venv's python so the pycs match the interpreter that will load
+    them. Returns True on success.
+    """
+    python = Path(venv_path) / 'bin' / 'python'
+    targets = [str(path) for path in paths if Path(path).exists()]
+    if not targets:
+        return True
+    start = time.monotonic()
+    command = [str(python), '-m', 'compileall', '-q', '-j', '0',
+               '--invalidation-mode', invalidation, *targets]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                            universal_newlines=True)
+    # compileall exits non-zero if any file has a syntax error; upstream
+    # packages ship a few deliberately broken test files, so only warn.
+    if result.returncode != 0:
+        logger.warning(f"Some files failed to compile under {', '.join(targets)}")
+    logger.info(f"Precompiled {', '.join(targets)} ({invalidation}) in {time.monotonic() - start:.1f}s")
+    return True
+
+def parse_importtime(output):
+    """Parse ``-X importtime`` stderr into (module, self_us, cumulative_us) tuples"""
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue  # header line
+        imports.append((fields[2].strip(), self_us, cumulative_us))
+    return imports
+
+def profile_imports(service, profile_dir=PROFILE_DIR, top=25):
+    """Capture import times for a service and store a ranked summary
+
+    Runs ``python -X importtime -m <module> --help``, which performs the
+    service's real imports and exits before opening any audio or sockets.
+    """
+    spec = SERVICES[service]
+    env = os.environ.copy()
+    env['PYTHONPATH'] = str(spec['repo'])
+    start = time.monotonic()
+    result = subprocess.run([str(spec['venv'] / 'bin' / 'python'), '-X', 'importtime',
+                             '-m', spec['module'], '--help'],
+                            cwd=spec['repo'] if spec['repo'].exists() else None, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True)
+    wall = time.monotonic() - start
+    imports = parse_importtime(result.stderr)
+    if not imports:
+        logger.error(f"No import timings captured for {service}: {result.stderr.strip()[-500:]}")
+        return None
+
+    ranked = sorted(imports, key=lambda item: item[1], reverse=True)
+    profile = {
+        'service': service,
+        'captured': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'wall_seconds': round(wall, 3),
+        'total_self_us': sum(item[1] for item in imports),
+        'modules': len(imports),
+        'slowest': [{'module': name, 'self_us': self_us, 'cumulative_us': cumulative_us}
+                    for name, self_us, cumulative_us in ranked[:top]],
+    }
+
+    profile_dir = Path(profile_dir)
+    profile_dir.mkdir(parents=True, exist_ok=True)
+    path = profile_dir / f"{service}.json"
+    previous = None
+    if path.exists():
+        with open(path) as f:
+            previous = json.load(f)
+        os.replace(path, profile_dir / f"{service}.prev.json")
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+    logger.info(f"{service}: {profile['modules']} modules, "
+                f"{profile['total_self_us'] / 1000:.0f} ms import time, {wall:.2f}s wall")
+    before = {item['module']: item['self_us'] for item in (previous or {}).get('slowest', [])}
+    for item in profile['slowest'][:10]:
+        delta = ''
+        if item['module'] in before:
+            delta = f" ({(item['self_us'] - before[item['module']]) / 1000:+.1f} ms)"
+        logger.info(f"  {item['self_us'] / 1000:8.1f} ms  {item['module']}{delta}")
+    if previous:
+        change = (profile['total_self_us'] - previous['total_self_us']) / 1000
+        logger.info(f"  total change since {previous['captured']}: {change:+.0f} ms")
+    return profile
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompile Wyoming services or profile their imports")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    compile_parser = subparsers.add_parser('compile', help="Precompile checkouts and venvs")
+    compile_parser.add_argument('--invalidation-mode', choices=INVALIDATION_MODES, default='timestamp')
+    profile_parser = subparsers.add_parser('profile', help="Record -X importtime for each service")
+    profile_parser.add_argument('services', nargs='*', metavar='SERVICE',
+                                help=f"Services to profile (default: {' '.join(SERVICES)})")
+    profile_parser.add_argument('--profile-dir', type=Path, default=PROFILE_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'compile':
+        for spec in SERVICES.values():
+            precompile(spec['venv'], [spec['repo'], spec['venv'] / 'lib'], args.invalidation_mode)
+        return
+    unknown = set(args.services) - set(SERVICES)
+    if unknown:
+        parser.error(f"unknown service(s): {' '.join(sorted(unknown))}")
+    services = args.services or list(SERVICES)
+    ok = all([profile_imports(service, args.profile_dir) is not None for service in services])
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""Apply config.yaml changes with the smallest possible service disruption.
+
+Instead of re-running the whole setup pipeline and restarting everything,
+the new effective Wyoming configuration is rendered from config.yaml (the
+current mic/speaker selection is kept), diffed against the live
+/etc/wyoming/satellite.yaml, and only the changed keys are written. Only
+the units those keys affect are restarted, and the downtime of each is
+measured until its port accepts connections again.
+
+``service_profile`` lives in systemd drop-ins rather than satellite.yaml, so
+they are rewritten here too and the units whose drop-in changed restart.
+``repositories`` and ``pyc_invalidation`` only take effect when the
+environments are rebuilt, which is left to setup.py (a warning says so).
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+
+import service_profile
+import setup
+import wyoming_commands
+
+logger = logging.getLogger('wyoming-setup.reload')
+
+# Which units need a restart when a key of the effective config changes.
+# Keys not listed here (area, host) are informational and only re-rendered.
+KEY_UNITS = {
+    'name': ['wyoming-satellite'],
+    'port': ['wyoming-satellite'],
+    'mic': ['wyoming-mic', 'wyoming-satellite'],
+    'speaker': ['wyoming-snd', 'wyoming-satellite'],
+    'playback_sink': ['wyoming-snd', 'wyoming-satellite'],
+    'vad': ['wyoming-vad-gate', 'wyoming-satellite'],
+    'wake_word': ['wyoming-wakeword', 'wyoming-vad-gate', 'wyoming-satellite'],
+    'wake_word_port': ['wyoming-wakeword', 'wyoming-vad-gate', 'wyoming-satellite'],
+    'wake': ['wyoming-wakeword'],
+    'wake_threads': ['wyoming-wakeword'],
+    'watchdog': ['wyoming-wakeword', 'wyoming-satellite'],
+    'wake_tap_port': ['wyoming-satellite'],
+    'governor': ['wyoming-governor', 'wyoming-satellite'],
+    'metrics': ['wyoming-metrics'],
+    'logging': ['wyoming-governor', 'wyoming-metrics', 'wyoming-audio-watch', 'wyoming-mic', 'wyoming-wakeword',
+                'wyoming-vad-gate', 'wyoming-snd', 'wyoming-satellite'],
+}
+
+# Restart order: the satellite depends on the capture ring, the wake word
+# service, the VAD gate in front of it and the playback sink (the governor, the
+# metrics exporter and the hot-plug watcher on nothing)
+UNIT_ORDER = ['wyoming-governor', 'wyoming-metrics', 'wyoming-audio-watch', 'wyoming-mic', 'wyoming-wakeword',
+              'wyoming-vad-gate', 'wyoming-snd', 'wyoming-satellite']
+# Units the supervisor runs in place of separate units
+SERVICE_UNITS = ['wyoming-wakeword', 'wyoming-satellite']
+
+def diff_configs(old, new):
+    """Return the keys whose values differ between two effective configs"""
+    return sorted(key for key in set(old) | set(new) if old.get(key) != new.get(key))
+
+def affected_units(changed, extra=()):
+    """Map changed keys (plus any extra units) to the units that must restart, in restart order"""
+    units = {unit for key in changed for unit in KEY_UNITS.get(key, [])} | set(extra)
+    return [unit for unit in UNIT_ORDER if unit in units]
+
+def apply_profile(config, unit_dir=service_profile.UNIT_DIR, dry_run=False):
+    """Bring the drop-ins in line with service_profile, returning the units whose drop-in changed"""
+    name = config.get('service_profile', service_profile.DEFAULT_PROFILE)
+    cores, ram_mb = service_profile.system_resources()
+    try:
+        profile = service_profile.build_profile(name, cores, ram_mb)
+    except ValueError as e:
+        logger.error(str(e))
+        return []
+    changed = service_profile.write_dropins(profile, name, cores, ram_mb, unit_dir, dry_run)
+    if changed and not dry_run:
+        setup.run_command(['systemctl', 'daemon-reload'])
+    return changed
+
+def stale_environments(config, manifest_path=setup.MANIFEST_PATH):
+    """Environments whose setup inputs (ref, pyc_invalidation) differ from the last setup run"""
+    manifest = setup.load_manifest(manifest_path)
+    return [name for name in setup.ENVIRONMENTS
+            if manifest['steps'].get(name, {}).get('fingerprint')
+            != setup.fingerprint(setup.step_inputs(name, config))]
+
+def unit_ports(unit, config):
+    """Ports that accept connections once a unit is serving again"""
+    if unit == 'wyoming-wakeword':
+        return [config.get('wake_word_port', wyoming_commands.DEFAULT_WAKE_WORD_PORT)]
+    if unit == 'wyoming-vad-gate':
+        gate_port = wyoming_commands.vad_gate_port(config)
+        return [gate_port] if gate_port else []
+    if unit == 'wyoming-snd':
+        sink_port = wyoming_commands.playback_sink_port(config)
+        return [sink_port] if sink_port else []
+    if unit == 'wyoming-satellite':
+        return [config.get('port', wyoming_commands.DEFAULT_SATELLITE_PORT)]
+    if unit == 'wyoming-metrics':
+        metrics = config.get('metrics') or {}
+        return [metrics.get('port', 9474)] if metrics.get('enabled') else []
+    if unit == 'wyoming-supervisor':
+        return [port for u in SERVICE_UNITS for port in unit_ports(u, config)]
+    return []
+
+def supervisor_active():
+    """True if the single-unit supervisor runs the services instead"""
+    success, output = setup.run_command(['systemctl', 'is-active', 'wyoming-supervisor'])
+    return success and output.strip() == 'active'
+
+def restart_units(units, config, timeout=120):
+    """Restart units in order, returning {unit: seconds until it was serving again}"""
+    if supervisor_active() and set(units) & set(SERVICE_UNITS):
+        units = [unit for unit in units if unit not in SERVICE_UNITS] + ['wyoming-supervisor']
+    downtime = {}
+    for unit in units:
+        start = time.monotonic()
+        success, output = setup.run_command(['systemctl', 'restart', unit])
+        if not success:
+            logger.error(f"Failed to restart {unit}: {output}")
+            downtime[unit] = None
+            continue
+        ready = True
+        for port in unit_ports(unit, config):
+            ready = wyoming_commands.wait_for_port(port, timeout) is not None and ready
+        downtime[unit] = time.monotonic() - start if ready else None
+        if ready:
+            logger.info(f"{unit} back after {downtime[unit]:.2f}s")
+        else:
+            logger.error(f"{unit} not serving {timeout}s after restart")
+    return downtime
+
+def reload(config_path='/usr/local/bin/wyoming/config.yaml',
+           wyoming_config_path=setup.WYOMING_CONFIG_PATH, dry_run=False, restart=True,
+           unit_dir=service_profile.UNIT_DIR, manifest_path=setup.MANIFEST_PATH):
+    """Re-render what changed and restart only the affected units"""
+    config = setup.load_config(config_path)
+    try:
+        current = wyoming_commands.load_config(wyoming_config_path)
+    except (OSError, KeyError, TypeError) as e:
+        logger.error(f"Cannot read {wyoming_config_path} ({e}); run setup.py instead")
+        return None
+
+    rendered = setup.render_wyoming_config(config)['satellite']
+    # Device selection is not part of config.yaml; keep what is live
+    if 'speaker' in current:
+        rendered['speaker'] = current['speaker']
+    if 'mic' in current:
+        capture = current['mic'].get('capture_command', current['mic'].get('command'))
+        rendered['mic'] = setup.route_mic(capture, config.get('mic_ring', False))
+
+    changed = diff_configs(current, rendered)
+    profile_units = apply_profile(config, unit_dir, dry_run=True)
+    units = affected_units(changed, profile_units)
+    stale = stale_environments(config, manifest_path)
+    report = {'changed': changed, 'profile': profile_units, 'setup': stale, 'units': units, 'downtime': {}}
+    if stale:
+        logger.warning(f"Setup inputs (repositories, pyc_invalidation) changed for {', '.join(stale)}; "
+                       f"re-run setup.py to rebuild them")
+    if not changed and not profile_units:
+        logger.info("Configuration unchanged; nothing to restart")
+        return report
+    if profile_units:
+        logger.info(f"service_profile drop-ins changed for {', '.join(profile_units)}")
+    logger.info(f"Changed keys: {', '.join(changed) or 'none'}; units to restart: {', '.join(units) or 'none'}")
+    if dry_run:
+        return report
+
+    updated = dict(current)
+    for key in changed:
+        if key in rendered:
+            updated[key] = rendered[key]
+        else:
+            updated.pop(key, None)
+    if changed and not setup.write_wyoming_config({'satellite': updated}, wyoming_config_path):
+        return None
+    if profile_units:
+        apply_profile(config, unit_dir)
+    if restart:
+        report['downtime'] = restart_units(units, updated)
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply config.yaml changes to the running services")
+    parser.add_argument('--config', default='/usr/local/bin/wyoming/config.yaml')
+    parser.add_argument('--wyoming-config', default=setup.WYOMING_CONFIG_PATH)
+    parser.add_argument('--dry-run', action='store_true', help="Only show what would change")
+    parser.add_argument('--no-restart', dest='restart', action='store_false')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    report = reload(args.config, args.wyoming_config, args.dry_run, args.restart)
+    if report is None:
+        sys.exit(1)
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""Fetch the upstream Wyoming checkouts pinned to a configured ref.
+
+Checkouts are populated with a shallow fetch of exactly one ref (branch,
+tag or commit) and updated in place on later runs instead of being left
+alone once they exist. When a local bare mirror of a repository is present
+in the mirror directory it is used as the source, so a fleet can be served
+from one cache without every node pulling full history from GitHub.
+"""
+import argparse
+import logging
+import subprocess
+import sys
+from pathlib import Path
+
+logger = logging.getLogger('wyoming-setup.repo')
+
+MIRROR_DIR = Path('/var/lib/wyoming/mirrors')
+DEFAULT_REF = 'master'
+
+def git(*args, cwd=None):
+    """Run a git command, returning (success, stdout or stderr)"""
+    command = ['git']
+    if cwd is not None:
+        command += ['-C', str(cwd)]
+    try:
+        result = subprocess.run([*command, *args], check=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        return False, e.stderr.strip()
+    except OSError as e:
+        return False, str(e)
+    return True, result.stdout.strip()
+
+def mirror_path(url, mirror_dir):
+    """Return where the bare mirror for a repository URL lives"""
+    name = url.rstrip('/').rsplit('/', 1)[-1]
+    if not name.endswith('.git'):
+        name += '.git'
+    return Path(mirror_dir) / name
+
+def fetch_source(url, mirror_dir=None):
+    """Pick the local mirror if one exists, otherwise the upstream URL"""
+    if mirror_dir:
+        mirror = mirror_path(url, mirror_dir)
+        if (mirror / 'HEAD').exists():
+            # A file:// URL (not a bare path) so git honours --depth
+            return mirror.resolve().as_uri()
+    return url
+
+def update_mirror(url, mirror_dir=MIRROR_DIR):
+    """Create or refresh the bare mirror for a repository"""
+    mirror = mirror_path(url, mirror_dir)
+    if (mirror / 'HEAD').exists():
+        logger.info(f"Updating mirror {mirror}...")
+        success, output = git('remote', 'update', '--prune', cwd=mirror)
+    else:
+        logger.info(f"Creating mirror {mirror} from {url}...")
+        mirror.parent.mkdir(parents=True, exist_ok=True)
+        success, output = git('clone', '--mirror', url, str(mirror))
+    if not success:
+        logger.error(f"Failed to update mirror {mirror}: {output}")
+    return success
+
+def fetch_checkout(url, repository_path, ref=DEFAULT_REF, mirror_dir=None, depth=1):
+    """Make repository_path a checkout of ``ref``, fetching only what is needed
+
+    Returns the checked-out commit, or None on failure.
+    """
+    repository_path = Path(repository_path)
+    source = fetch_source(url, mirror_dir)
+
+    if not (repository_path / '.git').exists():
+        logger.info(f"Fetching {ref} of {source} into {repository_path}...")
+        repository_path.mkdir(parents=True, exist_ok=True)
+        success, output = git('init', '-q', cwd=repository_path)
+        if success:
+            success, output = git('remote', 'add', 'origin', source, cwd=repository_path)
+        if not success:
+            logger.error(f"Failed to initialise {repository_path}: {output}")
+            return None
+    else:
+        git('remote', 'set-url', 'origin', source, cwd=repository_path)
+
+    fetch = ['fetch', '--no-tags']
+    if depth:
+        fetch += ['--depth', str(depth)]
+    success, output = git(*fetch, 'origin', ref, cwd=repository_path)
+    if not success:
+        logger.error(f"Failed to fetch {ref} from {source}: {output}")
+        return None
+
+    _, target = git('rev-parse', 'FETCH_HEAD^{commit}', cwd=repository_path)
+    _, current = git('rev-parse', '--verify', '-q', 'HEAD', cwd=repository_path)
+    if target == current:
+        logger.info(f"{repository_path} already at {ref} ({target[:12]})")
+        return target
+
+    success, output = git('checkout', '-q', '--detach', target, cwd=repository_path)
+    if not success:
+        logger.error(f"Failed to check out {target[:12]} in {repository_path}: {output}")
+        return None
+    logger.info(f"{repository_path}: {current[:12] or 'empty'} -> {target[:12]} ({ref})")
+    return target
+
+def is_commit_id(ref):
+    """True if ref looks like a (possibly abbreviated) commit hash"""
+    return 7 <= len(ref) <= 40 and all(c in '0123456789abcdef' for c in ref.lower())
+
+def main():
+    parser = argparse.ArgumentParser(description="Fetch pinned Wyoming checkouts or maintain local mirrors")
+    parser.add_argument('--mirror-dir', default=str(MIRROR_DIR))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    mirror = subparsers.add_parser('mirror', help="Create or refresh bare mirrors")
+    mirror.add_argument('urls', nargs='+')
+    checkout = subparsers.add_parser('checkout', help="Fetch one ref into a checkout")
+    checkout.add_argument('url')
+    checkout.add_argument('path')
+    checkout.add_argument('--ref', default=DEFAULT_REF)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'mirror':
+        ok = all([update_mirror(url, args.mirror_dir) for url in args.urls])
+    else:
+        ok = fetch_checkout(args.url, args.path, args.ref, args.mirror_dir) is not None
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
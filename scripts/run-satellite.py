@@ -1,11 +1,12 @@
 #!/usr/bin/env python3
-import yaml
-import os
+import asyncio
 import sys
-from pathlib import Path
-import subprocess
 import logging
 
+import liveness
+import log_buffer
+import wyoming_commands
+
 # Simplified logging setup
 logging.basicConfig(
     level=logging.INFO,
@@ -16,13 +17,13 @@ logging.basicConfig(
 )
 logger = logging.getLogger("wyoming-satellite")
 
+# How long to wait for the wake word service before giving up (systemd restarts us)
+WAKE_READY_TIMEOUT = 120
+
 def load_config():
     """Load the satellite configuration from YAML file."""
-    config_path = '/etc/wyoming/satellite.yaml'
     try:
-        with open(config_path, 'r') as f:
-            config = yaml.safe_load(f)['satellite']
-            return config
+        return wyoming_commands.load_config()
     except Exception as e:
         logger.error(f"Error loading config: {e}")
         sys.exit(1)
@@ -30,54 +31,50 @@ def load_config():
 def main():
     """Main function to execute wyoming-satellite."""
     config = load_config()
+    watchdog = liveness.watchdog_settings(config)
 
-    # Path to the Python interpreter in your virtual environment
-    venv_python = Path("/home/admin/.wyoming-satellite/bin/python")
-
-    # Repository path
-    repo_path = Path("/home/admin/.wyoming/wyoming-satellite")
+    # With the watchdog the mic command reports its frames to liveness.py
+    args, env, repo_path = wyoming_commands.satellite_command(
+        config, liveness.MIC_HEARTBEAT if watchdog['enabled'] else None)
 
     # Verify the repository path exists
     if not repo_path.exists():
         logger.error(f"Error: Repository not found at {repo_path}")
         sys.exit(1)
 
-    # Get microphone and speaker commands from the configuration
-    mic_command = ' '.join(config.get('mic', {}).get('command', []))
-    speaker_command = ' '.join(config.get('speaker', {}).get('command', []))
-
-    # Build the arguments for the satellite module
-    args = [
-        str(venv_python),  # Python interpreter from the virtual environment
-        "-m", "wyoming_satellite",
-        "--name", config['name'],
-        "--uri", f"tcp://0.0.0.0:{config.get('port', 10600)}",
-        "--mic-command", mic_command,
-        "--snd-command", speaker_command,
-    ]
-
-    # Add VAD settings if enabled
-    # if config.get('vad', {}).get('enabled'):
-    #     args.append("--vad")
-
-    # Add wake word settings if configured
+    # Hold the satellite back until the wake word service accepts connections
     if config.get('wake_word'):
-        args.extend([
-            "--wake-uri", f"tcp://0.0.0.0:{config.get('wake_word_port', 10400)}",
-            "--wake-word-name", config.get('wake_word', 'hey_jarvis'),
-        ])
+        # The service and any tap/VAD gate proxies in front of it must all be up
+        for port in wyoming_commands.wake_ports(config):
+            waited = wyoming_commands.wait_for_port(port, WAKE_READY_TIMEOUT)
+            if waited is None:
+                logger.error(f"Wake word service not accepting connections on port {port} "
+                             f"after {WAKE_READY_TIMEOUT}s")
+                sys.exit(1)
+            logger.info(f"Wake word service ready on port {port} after {waited:.2f}s")
 
-    # Set environment variables
-    env = os.environ.copy()
-    env["PYTHONPATH"] = str(repo_path)  # Add the repository to PYTHONPATH
+    sink_port = wyoming_commands.playback_sink_port(config)
+    if sink_port and wyoming_commands.wait_for_port(sink_port, WAKE_READY_TIMEOUT) is None:
+        logger.error(f"Playback sink not accepting connections on port {sink_port} "
+                     f"after {WAKE_READY_TIMEOUT}s")
+        sys.exit(1)
 
-    # Run the module using subprocess
+    if watchdog['enabled']:
+        # Only a resident launcher can buffer its logs; exec hands stderr to the service
+        log_buffer.apply(config, 'satellite')
+        # Stay resident to run the liveness checks and feed systemd's watchdog
+        port = config.get('port', wyoming_commands.DEFAULT_SATELLITE_PORT)
+        sys.exit(asyncio.run(liveness.supervise(
+            'satellite', (args, env, repo_path), [port], watchdog,
+            lambda service: liveness.satellite_checks(config, watchdog, service))))
+
+    # Replace this process with the satellite so no wrapper interpreter stays resident
+    logger.info(f"Executing command: {' '.join(args)}")
     try:
-        logger.info(f"Executing command: {' '.join(args)}")
-        subprocess.check_call(args, env=env, cwd=repo_path)
-    except subprocess.CalledProcessError as e:
+        wyoming_commands.exec_service(args, env, repo_path)
+    except OSError as e:
         logger.error(f"Error: Failed to run satellite service. {e}")
-        sys.exit(e.returncode)
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
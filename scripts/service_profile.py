@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""Generate systemd drop-ins that give each Wyoming unit a performance profile.
+
+With stock unit files every service runs with default scheduling, so wake
+word inference and audio capture compete for the same cores and setup's
+pip builds can starve audio at boot. A profile is sized from the core
+count and RAM of the board and written as one drop-in per unit
+(``<unit>.service.d/50-wyoming-profile.conf``):
+
+- ``CPUAffinity`` keeps the audio path (mic capture, satellite, VAD gate,
+  playback sink) on the last core and wake word inference and setup on
+  the others (no split on a single core),
+- ``balanced`` raises the audio path's priority with ``Nice``; ``realtime``
+  runs it ``SCHED_FIFO`` with ``CPUSchedulingPriority`` instead,
+- setup runs ``SCHED_BATCH`` with ``Nice=10`` and ``IOSchedulingClass=idle``,
+- ``MemoryHigh`` throttles (rather than kills) a unit that outgrows its
+  share of RAM.
+
+``none`` (the default) writes no drop-ins and removes ours. The same settings can be applied to a
+child process directly (``preexec``), which is how ``benchmark.py profiles``
+compares them without touching the installed units.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import yaml
+
+logger = logging.getLogger('wyoming-setup.profile')
+
+CONFIG_PATH = '/usr/local/bin/wyoming/config.yaml'
+UNIT_DIR = Path('/etc/systemd/system')
+DROPIN_NAME = '50-wyoming-profile.conf'
+PROFILES = ['none', 'balanced', 'realtime']
+# Drop-ins change scheduling on existing nodes, so they are opt-in
+DEFAULT_PROFILE = 'none'
+
+AUDIO_UNITS = ['wyoming-mic', 'wyoming-snd', 'wyoming-satellite', 'wyoming-vad-gate']
+WAKE_UNITS = ['wyoming-wakeword']
+SETUP_UNITS = ['wyoming-setup']
+# Runs the wake word service and the satellite together, so it can't be split
+SHARED_UNITS = ['wyoming-supervisor']
+UNITS = AUDIO_UNITS + WAKE_UNITS + SETUP_UNITS + SHARED_UNITS
+
+# SCHED_FIFO priorities for the realtime profile: capture first, then playback
+RT_PRIORITY = {'wyoming-mic': 60, 'wyoming-snd': 55, 'wyoming-satellite': 50, 'wyoming-vad-gate': 50}
+AUDIO_NICE = -10
+SETUP_NICE = 10
+# (share of RAM, floor in MB) per unit for MemoryHigh
+MEMORY_SHARE = {
+    'wyoming-wakeword': (0.30, 192),
+    'wyoming-satellite': (0.15, 96),
+    'wyoming-setup': (0.40, 128),
+    'wyoming-supervisor': (0.45, 288),
+}
+SMALL_UNIT_MEMORY_MB = 48
+
+POLICIES = {'other': os.SCHED_OTHER, 'batch': os.SCHED_BATCH, 'idle': os.SCHED_IDLE,
+            'fifo': os.SCHED_FIFO, 'rr': os.SCHED_RR}
+
+def system_resources():
+    """(cores, RAM in MB) of this machine"""
+    cores = len(os.sched_getaffinity(0))
+    ram_mb = 0
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemTotal:'):
+                ram_mb = int(line.split()[1]) // 1024
+                break
+    return cores, ram_mb
+
+def cpu_list(cpus):
+    """systemd CPUAffinity syntax for a list of CPU numbers, e.g. '0-2'"""
+    return f"{cpus[0]}-{cpus[-1]}" if len(cpus) > 1 else str(cpus[0])
+
+def parse_cpu_list(value):
+    cpus = set()
+    for part in str(value).replace(',', ' ').split():
+        start, _, end = part.partition('-')
+        cpus.update(range(int(start), int(end or start) + 1))
+    return cpus
+
+def cpu_split(cores):
+    """(audio CPUs, other CPUs), or (None, None) when there is nothing to split"""
+    if cores < 2:
+        return None, None
+    return [cores - 1], list(range(cores - 1))
+
+def build_profile(name, cores, ram_mb):
+    """{unit: {directive: value}} for a profile on a machine of this size"""
+    if name == 'none':
+        return {}
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile '{name}' (choose from {', '.join(PROFILES)})")
+    audio_cpus, other_cpus = cpu_split(cores)
+    profile = {}
+    for unit in UNITS:
+        settings = {}
+        if unit in AUDIO_UNITS:
+            if audio_cpus:
+                settings['CPUAffinity'] = cpu_list(audio_cpus)
+            if name == 'realtime':
+                settings['CPUSchedulingPolicy'] = 'fifo'
+                settings['CPUSchedulingPriority'] = RT_PRIORITY[unit]
+            else:
+                settings['Nice'] = AUDIO_NICE
+        elif unit in WAKE_UNITS:
+            if other_cpus:
+                settings['CPUAffinity'] = cpu_list(other_cpus)
+        elif unit in SETUP_UNITS:
+            if other_cpus:
+                settings['CPUAffinity'] = cpu_list(other_cpus)
+            settings['CPUSchedulingPolicy'] = 'batch'
+            settings['Nice'] = SETUP_NICE
+            settings['IOSchedulingClass'] = 'idle'
+        share, floor = MEMORY_SHARE.get(unit, (0, SMALL_UNIT_MEMORY_MB))
+        settings['MemoryHigh'] = f"{max(floor, int(ram_mb * share))}M"
+        profile[unit] = settings
+    return profile
+
+def render_dropin(settings, name, cores, ram_mb):
+    lines = [f"# Generated by service_profile.py: profile '{name}' for {cores} cores, {ram_mb} MB RAM",
+             "[Service]"]
+    lines += [f"{directive}={value}" for directive, value in settings.items()]
+    return '\n'.join(lines) + '\n'
+
+def dropin_path(unit, unit_dir=UNIT_DIR):
+    return Path(unit_dir) / f"{unit}.service.d" / DROPIN_NAME
+
+def write_dropins(profile, name, cores, ram_mb, unit_dir=UNIT_DIR, dry_run=False):
+    """Write the profile's drop-ins and remove ours from units it leaves out
+
+    Returns the units whose drop-in changed (or would, with ``dry_run``).
+    """
+    changed = []
+    for unit in UNITS:
+        path = dropin_path(unit, unit_dir)
+        old = path.read_text() if path.exists() else None
+        if unit in profile:
+            new = render_dropin(profile[unit], name, cores, ram_mb)
+            if new != old:
+                if not dry_run:
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    path.write_text(new)
+                changed.append(unit)
+        elif old is not None:
+            if not dry_run:
+                path.unlink()
+                try:
+                    path.parent.rmdir()
+                except OSError:
+                    pass  # other drop-ins live there too
+            changed.append(unit)
+    return changed
+
+def configured_profile(config_path=CONFIG_PATH):
+    """The service_profile named in config.yaml"""
+    try:
+        with open(config_path) as f:
+            config = yaml.safe_load(f)['satellite']
+    except (OSError, KeyError, TypeError, yaml.YAMLError) as e:
+        logger.warning(f"Cannot read {config_path} ({e}); using the '{DEFAULT_PROFILE}' profile")
+        return DEFAULT_PROFILE
+    return config.get('service_profile', DEFAULT_PROFILE)
+
+def preexec(settings):
+    """preexec_fn applying a unit's CPU settings to a child the way systemd would
+
+    MemoryHigh and the I/O class need a cgroup/unit and are left out.
+    Settings this process is not allowed to apply are skipped.
+    """
+    def apply():
+        try:
+            if 'CPUAffinity' in settings:
+                os.sched_setaffinity(0, parse_cpu_list(settings['CPUAffinity']))
+            if 'Nice' in settings:
+                os.setpriority(os.PRIO_PROCESS, 0, int(settings['Nice']))
+            if 'CPUSchedulingPolicy' in settings:
+                os.sched_setscheduler(0, POLICIES[settings['CPUSchedulingPolicy']],
+                                      os.sched_param(int(settings.get('CPUSchedulingPriority', 0))))
+        except PermissionError:
+            pass
+    return apply
+
+def needs_privileges(settings):
+    """True if applying these settings to a process requires root"""
+    return (int(settings.get('Nice', 0)) < 0
+            or settings.get('CPUSchedulingPolicy') in ('fifo', 'rr'))
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-unit systemd performance profiles")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command, help_text in (('show', "Print the drop-ins a profile would write"),
+                               ('apply', "Write the drop-ins and reload systemd")):
+        sub = subparsers.add_parser(command, help=help_text)
+        sub.add_argument('--profile', choices=PROFILES, help="Profile (default: service_profile in config.yaml)")
+        sub.add_argument('--config', default=CONFIG_PATH)
+        sub.add_argument('--cores', type=int, help="Size for this many cores instead of this machine's")
+        sub.add_argument('--ram-mb', type=int, help="Size for this much RAM instead of this machine's")
+        sub.add_argument('--unit-dir', type=Path, default=UNIT_DIR)
+        if command == 'apply':
+            sub.add_argument('--no-reload', action='store_true', help="Skip systemctl daemon-reload")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    name = args.profile or configured_profile(args.config)
+    cores, ram_mb = system_resources()
+    cores, ram_mb = args.cores or cores, args.ram_mb or ram_mb
+    try:
+        profile = build_profile(name, cores, ram_mb)
+    except ValueError as e:
+        logger.error(str(e))
+        sys.exit(1)
+
+    if args.command == 'show':
+        for unit, settings in profile.items():
+            print(f"# {dropin_path(unit, args.unit_dir)}")
+            print(render_dropin(settings, name, cores, ram_mb))
+        return
+
+    changed = write_dropins(profile, name, cores, ram_mb, args.unit_dir)
+    logger.info(f"Profile '{name}' ({cores} cores, {ram_mb} MB): "
+                f"{', '.join(changed) if changed else 'no drop-ins changed'}")
+    if changed and not args.no_reload:
+        subprocess.run(['systemctl', 'daemon-reload'], check=False)
+        # Scheduling and affinity only take effect when a unit (re)starts
+        logger.info(f"Restart to apply: systemctl restart {' '.join(changed)}")
+
+if __name__ == "__main__":
+    main()
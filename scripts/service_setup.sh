@@ -12,7 +12,15 @@ echo "Setting up Wyoming services..."
 # Ensure all service files are present
 if [ ! -f services/wyoming-setup.service ] || \
    [ ! -f services/wyoming-satellite.service ] || \
-   [ ! -f services/wyoming-wakeword.service ]; then
+   [ ! -f services/wyoming-wakeword.service ] || \
+   [ ! -f services/wyoming-audio-watch.service ] || \
+   [ ! -f services/wyoming-mic.service ] || \
+   [ ! -f services/wyoming-vad-gate.service ] || \
+   [ ! -f services/wyoming-snd.service ] || \
+   [ ! -f services/wyoming-governor.service ] || \
+   [ ! -f services/wyoming-metrics.service ] || \
+   [ ! -f services/wyoming-supervisor.service ] || \
+   [ ! -f services/wyoming-wake-tap.service ]; then
     echo "Error: One or more service files are missing in the 'services' directory."
     exit 1
 fi
@@ -21,16 +29,43 @@ fi
 cp services/wyoming-setup.service /etc/systemd/system/
 cp services/wyoming-satellite.service /etc/systemd/system/
 cp services/wyoming-wakeword.service /etc/systemd/system/
+cp services/wyoming-audio-watch.service /etc/systemd/system/
+cp services/wyoming-mic.service /etc/systemd/system/
+cp services/wyoming-vad-gate.service /etc/systemd/system/
+cp services/wyoming-snd.service /etc/systemd/system/
+cp services/wyoming-governor.service /etc/systemd/system/
+cp services/wyoming-metrics.service /etc/systemd/system/
+# Optional single-unit alternative to wyoming-wakeword + wyoming-satellite (not enabled)
+cp services/wyoming-supervisor.service /etc/systemd/system/
+# Optional wake word link instrumentation, enable together with wake_tap_port (not enabled)
+cp services/wyoming-wake-tap.service /etc/systemd/system/
 
 # Set correct permissions
 chmod 644 /etc/systemd/system/wyoming-setup.service
 chmod 644 /etc/systemd/system/wyoming-satellite.service
 chmod 644 /etc/systemd/system/wyoming-wakeword.service
+chmod 644 /etc/systemd/system/wyoming-audio-watch.service
+chmod 644 /etc/systemd/system/wyoming-mic.service
+chmod 644 /etc/systemd/system/wyoming-vad-gate.service
+chmod 644 /etc/systemd/system/wyoming-snd.service
+chmod 644 /etc/systemd/system/wyoming-governor.service
+chmod 644 /etc/systemd/system/wyoming-metrics.service
+chmod 644 /etc/systemd/system/wyoming-supervisor.service
+chmod 644 /etc/systemd/system/wyoming-wake-tap.service
+
+# Per-unit CPU/memory drop-ins for the service_profile in config.yaml
+python3 /usr/local/bin/wyoming/service_profile.py apply --no-reload
 
 # Stop any old services 
 systemctl stop wyoming-setup
 systemctl stop wyoming-wakeword
 systemctl stop wyoming-satellite
+systemctl stop wyoming-audio-watch
+systemctl stop wyoming-mic
+systemctl stop wyoming-vad-gate
+systemctl stop wyoming-snd
+systemctl stop wyoming-governor
+systemctl stop wyoming-metrics
 
 # Reload systemd and enable services
 systemctl daemon-reload
@@ -39,17 +74,32 @@ echo "Enabling Wyoming services..."
 systemctl enable wyoming-setup
 systemctl enable wyoming-wakeword
 systemctl enable wyoming-satellite
+systemctl enable wyoming-audio-watch
+# Idle unless mic_ring / vad.enabled / playback_sink.enabled / governor.enabled / metrics.enabled
+# are set in config.yaml
+systemctl enable wyoming-mic
+systemctl enable wyoming-vad-gate
+systemctl enable wyoming-snd
+systemctl enable wyoming-governor
+systemctl enable wyoming-metrics
 
 echo "Starting Wyoming services..."
 # Start services
 systemctl start wyoming-setup
+systemctl start wyoming-mic
 systemctl start wyoming-wakeword
-sleep 2  # Give setup service time to complete
+systemctl start wyoming-vad-gate
+systemctl start wyoming-snd
+systemctl start wyoming-governor
+systemctl start wyoming-metrics
+# run-satellite.py waits for the wake word port itself before starting
 systemctl start wyoming-satellite
+systemctl start wyoming-audio-watch
 
 echo "Checking service status..."
 systemctl status wyoming-setup --no-pager
 systemctl status wyoming-wakeword --no-pager
 systemctl status wyoming-satellite --no-pager
+systemctl status wyoming-audio-watch --no-pager
 
 echo "Service setup complete. Check logs at /var/log/wyoming/setup.log"
\ No newline at end of file
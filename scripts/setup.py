@@ -1,25 +1,86 @@
 #!/usr/bin/env python3
 import subprocess
+import argparse
+import hashlib
 import json
+import time
 import yaml
 import os
-import re
 import sys
 import shutil
+import tarfile
 import logging
 from pathlib import Path
 
-# Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('/var/log/wyoming/setup.log'),
-        logging.StreamHandler()
-    ]
-)
+import step_graph
+import audio_devices
+import log_buffer
+import precompile
+import repo_fetch
+import system_packages
+import venv_dedup
+import venv_snapshot
+import wyoming_commands
+
+LOG_PATH = '/var/log/wyoming/setup.log'
+
 logger = logging.getLogger('wyoming-setup')
 
+# Persisted record of what each setup step last ran against
+STATE_DIR = Path('/var/lib/wyoming')
+MANIFEST_PATH = STATE_DIR / 'setup-manifest.json'
+# Every step of the last run, including skipped and failed ones (read by metrics_exporter.py)
+TIMINGS_PATH = STATE_DIR / 'setup-timings.json'
+
+# Setup steps in the order they run; names are accepted by --only
+SETUP_STEPS = ['packages', 'openwakeword', 'satellite', 'config']
+
+SYSTEM_PACKAGES = [
+    "python3-pip",
+    "python3-venv",
+    "libatlas-base-dev",
+    "portaudio19-dev",
+    "pulseaudio",
+    "alsa-utils",
+    "python3-yaml"
+]
+
+ADDITIONAL_PACKAGES = [
+    "pyyaml",  # Add other required packages here if needed
+]
+
+OPENWAKEWORD_VENV = Path("/home/admin/.wyoming-openwakeword")
+OPENWAKEWORD_REPO = Path("/home/admin/.wyoming/wyoming-openwakeword")
+OPENWAKEWORD_REQUIREMENTS = ["requirements.txt"]
+
+SATELLITE_VENV = Path("/home/admin/.wyoming-satellite")
+SATELLITE_REPO = Path("/home/admin/.wyoming/wyoming-satellite")
+SATELLITE_REQUIREMENTS = [
+    "requirements.txt",
+    "requirements_audio_enhancement.txt",
+    "requirements_vad.txt"
+]
+
+ENVIRONMENTS = {
+    'openwakeword': {
+        'label': 'OpenWakeWord',
+        'url': "https://github.com/rhasspy/wyoming-openwakeword.git",
+        'repo': OPENWAKEWORD_REPO,
+        'venv': OPENWAKEWORD_VENV,
+        'requirements': OPENWAKEWORD_REQUIREMENTS,
+    },
+    'satellite': {
+        'label': 'Satellite',
+        'url': "https://github.com/rhasspy/wyoming-satellite.git",
+        'repo': SATELLITE_REPO,
+        'venv': SATELLITE_VENV,
+        'requirements': SATELLITE_REQUIREMENTS,
+    },
+}
+
+WYOMING_CONFIG_PATH = '/etc/wyoming/satellite.yaml'
+MIC_RING_READER = ['python3', '/usr/local/bin/wyoming/mic_ring.py', 'read']
+
 def run_command(command, shell=False):
     """Run a command and return output and success status"""
     try:
@@ -36,9 +97,8 @@ def run_command(command, shell=False):
         logger.error(f"Command failed: {e.stderr}")
         return False, e.stderr
 
-def load_config():
+def load_config(config_path='/usr/local/bin/wyoming/config.yaml'):
     """Load configuration from file and environment variables"""
-    config_path = '/usr/local/bin/wyoming/config.yaml'
     try:
         with open(config_path, 'r') as f:
             config = yaml.safe_load(f)['satellite']
@@ -63,190 +123,488 @@ def load_config():
 
     return config
 
-def get_audio_devices():
-    """Get all audio devices"""
-    try:
-        mic_output = subprocess.check_output(['arecord', '-l'], universal_newlines=True)
-        speaker_output = subprocess.check_output(['aplay', '-l'], universal_newlines=True)
-    except subprocess.CalledProcessError as e:
-        logger.error(f"Failed to get audio devices: {e}")
-        return None, None
-
-    mic_devices = {}
-    speaker_devices = {}
-
-    # Parse microphone devices
-    for line in mic_output.split('\n'):
-        if 'card' in line and 'device' in line:
-            match = re.search(r'card (\d+): ([^\[]+)\[(.*?)\], device (\d+): (.*)', line)
-            if match:
-                card_num, card_name, card_id, device_num, device_desc = match.groups()
-                device_id = f"hw:{card_num},{device_num}"
-                mic_devices[device_id] = f"{card_name.strip()} [{card_id.strip()}]: {device_desc.strip()}"
-
-    # Parse speaker devices
-    for line in speaker_output.split('\n'):
-        if 'card' in line and 'device' in line:
-            match = re.search(r'card (\d+): ([^\[]+)\[(.*?)\], device (\d+): (.*)', line)
-            if match:
-                card_num, card_name, card_id, device_num, device_desc = match.groups()
-                device_id = f"hw:{card_num},{device_num}"
-                speaker_devices[device_id] = f"{card_name.strip()} [{card_id.strip()}]: {device_desc.strip()}"
-
-    return mic_devices, speaker_devices
-
-def select_best_device(devices):
-    """Select the best audio device"""
-    if not devices:
-        return None
-        
-    # Priority order: M-Audio > Focusrite > Other USB > Built-in
-    priority_keywords = ['M-Track', 'Scarlett', 'USB']
-    
-    for keyword in priority_keywords:
-        matching_devices = {k: v for k, v in devices.items() if keyword in v}
-        if matching_devices:
-            return list(matching_devices.keys())[0]
-    
-    return list(devices.keys())[0]
-
 def get_user_home():
     """Get the actual user's home directory even when running as root"""
     # Get SUDO_USER or default to current user
     user = os.environ.get('SUDO_USER', os.environ.get('USER', 'admin'))
     return Path(f'/home/{user}')
 
+def create_virtual_environment(venv_path):
+    """Create a virtual environment if it does not exist yet"""
+    if venv_path.exists():
+        return True
+    logger.info(f"Creating virtual environment at {venv_path}...")
+    success, output = run_command(['python3', '-m', 'venv', str(venv_path)])
+    if not success:
+        logger.error(f"Failed to create virtual environment: {output}")
+        return False
+    return True
+
+def install_requirements(venv_path, req_file):
+    """Install one requirements file into a virtual environment"""
+    if not req_file.exists():
+        logger.warning(f"Requirements file not found: {req_file}")
+        return True
+    pip_path = venv_path / "bin" / "pip"
+    logger.info(f"Installing dependencies from {req_file}")
+    success, output = run_command([str(pip_path), "install", "-r", str(req_file)])
+    if not success:
+        logger.error(f"Failed to install dependencies: {output}")
+        return False
+    return True
+
 def setup_virtual_environment(venv_path, requirements_files):
     """Set up a virtual environment and install dependencies"""
     logger.info(f"Setting up virtual environment at {venv_path}")
-    if not venv_path.exists():
-        logger.info("Creating virtual environment...")
-        success, output = run_command(['python3', '-m', 'venv', str(venv_path)])
-        if not success:
-            logger.error(f"Failed to create virtual environment: {output}")
-            return False
-
-    pip_path = venv_path / "bin" / "pip"
+    if not create_virtual_environment(venv_path):
+        return False
     for req_file in requirements_files:
-        if req_file.exists():
-            logger.info(f"Installing dependencies from {req_file}")
-            success, output = run_command([str(pip_path), "install", "-r", str(req_file)])
-            if not success:
-                logger.error(f"Failed to install dependencies: {output}")
-                return False
-        else:
-            logger.warning(f"Requirements file not found: {req_file}")
+        if not install_requirements(venv_path, req_file):
+            return False
     return True
 
 def install_additional_packages(venv_path):
     venv_pip = venv_path / "bin" / "pip"
     # Install additional pip packages
-    additional_packages = [
-        "pyyaml",  # Add other required packages here if needed
-    ]
     logger.info("Installing additional pip packages...")
-    for package in additional_packages:
+    for package in ADDITIONAL_PACKAGES:
         logger.info(f"Installing {package}...")
         success, output = run_command([str(venv_pip), "install", package])
         if not success:
             logger.error(f"Failed to install {package}: {output}")
             return False
-        
-def setup_openwakeword():
-    """Set up the OpenWakeWord environment"""
-    logger.info("Setting up OpenWakeWord...")
-    venv_path = Path("/home/admin/.wyoming-openwakeword")
-    repository_path = Path("/home/admin/.wyoming/wyoming-openwakeword")
-    requirements_file = repository_path / "requirements.txt"
-
-    if not repository_path.exists():
-        logger.info("Cloning wyoming-openwakeword repository...")
-        success, output = run_command(["git", "clone", "https://github.com/rhasspy/wyoming-openwakeword.git", str(repository_path)])
-        if not success:
-            logger.error(f"Failed to clone OpenWakeWord repository: {output}")
-            return False
+    return True
 
-    if not setup_virtual_environment(venv_path, [requirements_file]):
-        logger.error("Failed to set up OpenWakeWord virtual environment")
+def repository_settings(name, config):
+    """Return the (ref, mirror_dir) configured for an environment's repository"""
+    repositories = (config or {}).get('repositories') or {}
+    return (repositories.get(name) or repo_fetch.DEFAULT_REF,
+            repositories.get('mirror_dir', repo_fetch.MIRROR_DIR))
+
+def clone_repository(name, config=None):
+    """Fetch an environment's repository at its configured ref
+
+    Served from the local mirror when one exists; an existing checkout is
+    updated in place rather than skipped.
+    """
+    env = ENVIRONMENTS[name]
+    ref, mirror_dir = repository_settings(name, config)
+    if repo_fetch.fetch_checkout(env['url'], env['repo'], ref, mirror_dir) is None:
+        logger.error(f"Failed to fetch {env['label']} repository")
         return False
+    return True
 
-    install_additional_packages(venv_path)
-    logger.info("OpenWakeWord setup complete")
+def snapshot_matches_ref(metadata, ref):
+    """True if a snapshot's checkout was taken at the configured ref"""
+    if metadata.get('ref') == ref:
+        return True
+    return repo_fetch.is_commit_id(ref) and (metadata.get('head') or '').startswith(ref.lower())
+
+def restore_environment(name, config, metadata, snapshot_dir):
+    """Restore an environment from a snapshot, building it with pip if that fails"""
+    env = ENVIRONMENTS[name]
+    if venv_snapshot.restore_snapshot(metadata, env['venv'], env['repo'], snapshot_dir):
+        return True
+    logger.warning(f"Falling back to building {env['label']} from scratch")
+    return setup_environment(name, config)
+
+def environment_steps(name, config=None, after=(), snapshot_dir=None):
+    """Build the clone -> venv -> requirements -> extras steps for an environment
+
+    Requirements files for one venv are chained because concurrent pip runs
+    against the same environment are not safe; separate environments are
+    independent and can run side by side. On a fresh node with a compatible
+    snapshot in ``snapshot_dir`` the whole chain is replaced by a restore.
+    """
+    env = ENVIRONMENTS[name]
+    venv_path = env['venv']
+    if snapshot_dir and not venv_path.exists() and not env['repo'].exists():
+        metadata = venv_snapshot.find_snapshot(name, snapshot_dir)
+        ref, _ = repository_settings(name, config)
+        if metadata and not snapshot_matches_ref(metadata, ref):
+            logger.info(f"Snapshot for {name} was taken at {metadata.get('ref')}, not {ref}; ignoring it")
+            metadata = None
+        if metadata:
+            restore = step_graph.Step(f"{name}:restore",
+                                      lambda: restore_environment(name, config, metadata, snapshot_dir),
+                                      tuple(after))
+            return [restore, precompile_step(name, config, restore.name)]
+    clone = f"{name}:clone"
+    venv = f"{name}:venv"
+    steps = [
+        step_graph.Step(clone, lambda: clone_repository(name, config), ()),
+        step_graph.Step(venv, lambda: create_virtual_environment(venv_path), tuple(after)),
+    ]
+    previous = (clone, venv)
+    for req_name in env['requirements']:
+        req_file = env['repo'] / req_name
+        step_name = f"{name}:{req_name}"
+        steps.append(step_graph.Step(step_name,
+                                     lambda req_file=req_file: install_requirements(venv_path, req_file),
+                                     previous))
+        previous = (step_name,)
+    steps.append(step_graph.Step(f"{name}:extras",
+                                 lambda: install_additional_packages(venv_path), previous))
+    steps.append(precompile_step(name, config, steps[-1].name))
+    return steps
+
+def pyc_invalidation(config):
+    """Return the configured pyc invalidation mode"""
+    mode = (config or {}).get('pyc_invalidation') or 'timestamp'
+    if mode not in precompile.INVALIDATION_MODES:
+        logger.warning(f"Unknown pyc_invalidation '{mode}', using timestamp")
+        mode = 'timestamp'
+    return mode
+
+def precompile_step(name, config, after):
+    """Compile the checkout and venv so the service never compiles at start-up"""
+    env = ENVIRONMENTS[name]
+    return step_graph.Step(f"{name}:precompile",
+                           lambda: precompile.precompile(env['venv'], [env['repo'], env['venv'] / 'lib'],
+                                                         pyc_invalidation(config)),
+                           (after,))
+
+def setup_environment(name, config=None):
+    """Set up one environment on its own, one step at a time"""
+    label = ENVIRONMENTS[name]['label']
+    logger.info(f"Setting up {label}...")
+    success, _ = step_graph.run_graph(environment_steps(name, config), max_workers=1)
+    if not success:
+        logger.error(f"{label} setup failed")
+        return False
+    logger.info(f"{label} setup complete")
     return True
 
-def setup_satellite():
+def setup_openwakeword(config=None):
+    """Set up the OpenWakeWord environment"""
+    return setup_environment('openwakeword', config)
+
+def setup_satellite(config=None):
     """Set up the Satellite environment"""
-    logger.info("Setting up Satellite...")
-    venv_path = Path("/home/admin/.wyoming-satellite")
-    repository_path = Path("/home/admin/.wyoming/wyoming-satellite")
-    requirements_files = [
-        repository_path / "requirements.txt",
-        repository_path / "requirements_audio_enhancement.txt",
-        repository_path / "requirements_vad.txt"
-    ]
+    return setup_environment('satellite', config)
+
+def deduplicate_environments():
+    """Hardlink files that are identical in both venvs; never fails setup"""
+    try:
+        venv_dedup.deduplicate([env['venv'] for env in ENVIRONMENTS.values()])
+    except OSError as e:
+        logger.warning(f"Skipping venv deduplication: {e}")
+    return True
+
+def install_system_packages():
+    """Install any missing system packages in a single apt transaction"""
+    logger.info("Checking system packages...")
+    success, report = system_packages.reconcile(SYSTEM_PACKAGES)
+    system_packages.log_report(report)
+    return success
+
+def file_digest(path):
+    """Return the sha256 of a file's contents, or None if it does not exist"""
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
 
-    if not repository_path.exists():
-        logger.info("Cloning wyoming-satellite repository...")
-        success, output = run_command(["git", "clone", "https://github.com/rhasspy/wyoming-satellite.git", str(repository_path)])
+def repo_head(repository_path):
+    """Return the checked-out commit of a repository, or None if there is none"""
+    if not (Path(repository_path) / '.git').exists():
+        return None
+    try:
+        result = subprocess.run(['git', '-C', str(repository_path), 'rev-parse', 'HEAD'],
+                                check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip()
+
+def fingerprint(inputs):
+    """Hash a JSON-serialisable description of a step's inputs"""
+    encoded = json.dumps(inputs, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+def environment_inputs(venv_path, repository_path, requirement_names, ref=None, invalidation=None):
+    """Describe the inputs that determine a venv's contents"""
+    return {
+        'venv_exists': (venv_path / 'bin' / 'python').exists(),
+        'ref': ref,
+        'pyc_invalidation': invalidation,
+        'head': repo_head(repository_path),
+        'requirements': {name: file_digest(repository_path / name) for name in requirement_names},
+        'additional_packages': ADDITIONAL_PACKAGES,
+    }
+
+def step_inputs(step, config=None, devices=None):
+    """Return the inputs a setup step depends on"""
+    if step == 'packages':
+        return {'packages': sorted(SYSTEM_PACKAGES)}
+    if step in ENVIRONMENTS:
+        env = ENVIRONMENTS[step]
+        ref, _ = repository_settings(step, config)
+        return environment_inputs(env['venv'], env['repo'], env['requirements'], ref,
+                                  pyc_invalidation(config))
+    if step == 'config':
+        return {
+            'config': config,
+            'devices': devices,
+            'output': file_digest(WYOMING_CONFIG_PATH),
+        }
+    raise ValueError(f"Unknown setup step: {step}")
+
+def load_manifest(path=MANIFEST_PATH):
+    """Load the setup manifest, returning an empty one if missing or unreadable"""
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {'steps': {}}
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+        return {'steps': {}}
+    manifest.setdefault('steps', {})
+    return manifest
+
+def save_manifest(manifest, path=MANIFEST_PATH):
+    """Atomically write the setup manifest"""
+    path = Path(path)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix('.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to save manifest {path}: {e}")
+
+def step_needed(name, inputs, manifest, options):
+    """Decide whether a step has to run given the manifest and CLI overrides"""
+    if options.only and name not in options.only:
+        return False
+    if options.force or options.only:
+        return True
+    recorded = manifest['steps'].get(name, {}).get('fingerprint')
+    return recorded is None or recorded != fingerprint(inputs())
+
+def record_step(name, success, elapsed, inputs, manifest):
+    """Store (or clear) a step's fingerprint after it has run"""
+    if success:
+        manifest['steps'][name] = {
+            'fingerprint': fingerprint(inputs()),
+            'completed': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seconds': round(elapsed, 3),
+        }
+    else:
+        manifest['steps'].pop(name, None)
+    save_manifest(manifest)
+
+def skip_reason(name, options):
+    return 'not selected' if options.only and name not in options.only else 'skipped'
+
+def run_step(name, func, inputs, manifest, options, timings):
+    """Run a setup step unless its inputs match the manifest
+
+    ``inputs`` is a callable so the fingerprint can be recomputed after the
+    step has run (e.g. a fresh clone now has a HEAD).
+    """
+    if not step_needed(name, inputs, manifest, options):
+        if skip_reason(name, options) == 'skipped':
+            logger.info(f"Step '{name}' is up to date, skipping")
+        timings.append((name, skip_reason(name, options), 0.0))
+        return True
+
+    logger.info(f"Running step '{name}'...")
+    start = time.monotonic()
+    success = func()
+    elapsed = time.monotonic() - start
+    timings.append((name, 'ran' if success else 'failed', elapsed))
+    record_step(name, success, elapsed, inputs, manifest)
+    return success
+
+def report_timings(timings, path=TIMINGS_PATH):
+    """Log how long each setup step took and keep it for the metrics exporter"""
+    logger.info("Setup step timings:")
+    for name, status, elapsed in timings:
+        logger.info(f"  {name:<14} {status:<12} {elapsed:8.2f}s")
+    logger.info(f"  {'sum':<14} {'':<12} {sum(t[2] for t in timings):8.2f}s")
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        Path(path).write_text(json.dumps({
+            'finished': round(time.time(), 3),
+            'steps': [{'name': name, 'status': status, 'seconds': round(elapsed, 3)}
+                      for name, status, elapsed in timings],
+        }))
+    except OSError as e:
+        logger.warning(f"Failed to save step timings {path}: {e}")
+
+def check_dependencies(config, manifest, options, timings):
+    """Check and install dependencies
+
+    System packages and the two environments are provisioned as one step
+    graph so the OpenWakeWord and Satellite branches run concurrently.
+    Only the parts whose inputs changed since the last run are included.
+    """
+    logger.info("Checking dependencies...")
+
+    selected = []
+    for name in ['packages', *ENVIRONMENTS]:
+        if step_needed(name, lambda name=name: step_inputs(name, config), manifest, options):
+            selected.append(name)
+        else:
+            if skip_reason(name, options) == 'skipped':
+                logger.info(f"Step '{name}' is up to date, skipping")
+            timings.append((name, skip_reason(name, options), 0.0))
+
+    steps = []
+    if 'packages' in selected:
+        steps.append(step_graph.Step('packages', install_system_packages, ()))
+    env_tails = []
+    for name in ENVIRONMENTS:
+        if name in selected:
+            # venv creation needs python3-venv from the package step
+            steps += environment_steps(name, config, after=('packages',) if 'packages' in selected else (),
+                                       snapshot_dir=options.snapshot_dir)
+            env_tails.append(steps[-1].name)
+    if env_tails and options.dedup:
+        steps.append(step_graph.Step('dedup', deduplicate_environments, tuple(env_tails)))
+
+    if steps:
+        success, results = step_graph.run_graph(steps, options.jobs)
+        step_graph.log_report(steps, results)
+        for name in selected:
+            spans = [result for step_name, result in results.items()
+                     if (step_name == name or step_name.startswith(f"{name}:")) and 'end' in result]
+            elapsed = (max(r['end'] for r in spans) - min(r['start'] for r in spans)) if spans else 0.0
+            ok = all(result['status'] == 'ok' for step_name, result in results.items()
+                     if step_name == name or step_name.startswith(f"{name}:"))
+            timings.append((name, 'ran' if ok else 'failed', elapsed))
+            record_step(name, ok, elapsed, lambda name=name: step_inputs(name, config), manifest)
         if not success:
-            logger.error(f"Failed to clone Satellite repository: {output}")
+            logger.error("Dependency setup failed")
             return False
 
-    if not setup_virtual_environment(venv_path, requirements_files):
-        logger.error("Failed to set up Satellite virtual environment")
+    logger.info("check_dependencies() complete.")
+    return True
+
+def mic_section(mic, ring=False):
+    """Render the mic block of the Wyoming configuration from a device plan"""
+    return route_mic([
+        'arecord',
+        '-D', mic['device'],
+        '-r', str(mic['rate']),
+        '-f', mic['format'],
+        '-c', str(mic['channels'])
+    ], ring)
+
+def route_mic(capture_command, ring=False):
+    """Mic block reading the device directly, or through the shared capture ring"""
+    if ring:
+        # wyoming-mic runs capture_command into the ring; the satellite reads the ring
+        return {'command': MIC_RING_READER, 'capture_command': capture_command}
+    return {'command': capture_command}
+
+def speaker_section(speaker):
+    """Render the speaker block of the Wyoming configuration from a device plan"""
+    # plughw is only used when the hardware can't take the stream as-is
+    return {
+        'command': [
+            'aplay',
+            '-D', speaker['device'],
+            '-r', str(speaker['rate']),
+            '-c', str(speaker['channels']),
+            '-f', speaker['format'],
+            '-t', 'raw'
+        ]
+    }
+
+def write_wyoming_config(wyoming_config, config_path=WYOMING_CONFIG_PATH):
+    """Write the rendered Wyoming configuration into place"""
+    try:
+        with open('/tmp/satellite.yaml', 'w') as f:
+            yaml.dump(wyoming_config, f, default_flow_style=False)
+        
+        run_command(f'mv /tmp/satellite.yaml {config_path}', shell=True)
+        run_command(f'chown root:root {config_path}', shell=True)
+    except Exception as e:
+        logger.error(f"Failed to update config: {e}")
         return False
-    
-    install_additional_packages(venv_path)
-    logger.info("Satellite setup complete")
+
     return True
 
-def check_dependencies(config):
-    """Check and install dependencies"""
-    logger.info("Checking dependencies...")
-    
+def vad_section(vad):
+    """Render the vad block read by vad_gate.py in front of the wake word service"""
+    return {
+        'enabled': bool(vad.get('enabled', False)),
+        'threshold': int(vad.get('threshold', 2)),
+        'trigger_level': int(vad.get('trigger_level', 3)),
+        'chunk_size': int(vad.get('chunk_size', 960)),
+        'pre_roll': float(vad.get('pre_roll', 1.0)),
+        'hangover': float(vad.get('hangover', 2.0)),
+        'gate_port': int(vad.get('gate_port', 10402)),
+    }
 
-    # Install system packages
-    packages = [
-        "python3-pip",
-        "python3-venv",
-        "libatlas-base-dev",
-        "portaudio19-dev",
-        "pulseaudio",
-        "alsa-utils",
-        "python3-yaml"
-    ]
-    logger.info("Checking system packages...")
-    for package in packages:
-        # Check if package is installed
-        success, output = run_command(f"dpkg -l | grep -q '^ii.*{package}'", shell=True)
-        if success:
-            logger.info(f"Package {package} is already installed")
-        else:
-            logger.info(f"Installing package {package}...")
-            success, output = run_command(f"apt-get install -y {package}", shell=True)
-            if not success:
-                logger.error(f"Failed to install {package}: {output}")
-                return False
-
-    if not setup_openwakeword():
-        logger.error("OpenWakeWord setup failed")
-        return
+def playback_sink_section(sink):
+    """Render the playback_sink block read by playback_sink.py"""
+    return {
+        'enabled': bool(sink.get('enabled', False)),
+        'port': int(sink.get('port', 10403)),
+        'buffer_ms': int(sink.get('buffer_ms', 100)),
+        'period_ms': int(sink.get('period_ms', 20)),
+        'idle_close': float(sink.get('idle_close', 0)),
+    }
 
-    # Set up Satellite
-    if not setup_satellite():
-        logger.error("Satellite setup failed")
-        return
-   
-    
+def watchdog_section(watchdog):
+    """Render the watchdog block read by liveness.py in the launchers"""
+    return {
+        'enabled': bool(watchdog.get('enabled', False)),
+        'timeout': int(watchdog.get('timeout', 30)),
+        'interval': float(watchdog.get('interval', 1.0)),
+        'stall_seconds': float(watchdog.get('stall_seconds', 10)),
+        'recover_seconds': float(watchdog.get('recover_seconds', 15)),
+        'probe_timeout': float(watchdog.get('probe_timeout', 5)),
+    }
 
-    logger.info("check_dependencies() complete.")
-    return True
+def governor_section(governor):
+    """Render the governor block read by thermal_governor.py"""
+    return {
+        'enabled': bool(governor.get('enabled', False)),
+        'interval': float(governor.get('interval', 0.5)),
+        'session_governor': str(governor.get('session_governor', 'performance')),
+        'idle_governor': str(governor.get('idle_governor', 'ondemand')),
+        'hot_temp': float(governor.get('hot_temp', 80)),
+        'hysteresis': float(governor.get('hysteresis', 5)),
+        'session_timeout': float(governor.get('session_timeout', 30)),
+    }
 
-def update_wyoming_config(config, mic_device, speaker_device=None):
-    """Update Wyoming configuration file"""
-    config_path = '/etc/wyoming/satellite.yaml'
-    logger.info(f"Updating Wyoming configuration at {config_path}")
-    
+def metrics_section(metrics):
+    """Render the metrics block read by metrics_exporter.py"""
+    return {
+        'enabled': bool(metrics.get('enabled', False)),
+        'host': str(metrics.get('host', '127.0.0.1')),
+        'port': int(metrics.get('port', 9474)),
+        'interval': float(metrics.get('interval', 15)),
+        'budget': float(metrics.get('budget', 0.01)),
+        'pss_every': int(metrics.get('pss_every', 4)),
+        'max_processes': int(metrics.get('max_processes', 64)),
+        'restart_interval': float(metrics.get('restart_interval', 60)),
+    }
+
+def logging_section(settings):
+    """Render the logging block read by log_buffer.py in the services"""
+    settings = log_buffer.logging_settings({'logging': settings})
+    return {
+        'mode': str(settings['mode']),
+        'flush_interval': float(settings['flush_interval']),
+        'ram_kb': int(settings['ram_kb']),
+        'file_kb': int(settings['file_kb']),
+        'journal_level': str(settings['journal_level']).upper(),
+        'burst': int(settings['burst']),
+        'burst_window': float(settings['burst_window']),
+        'max_message_bytes': int(settings['max_message_bytes']),
+        'report_interval': float(settings['report_interval']),
+    }
+
+def render_wyoming_config(config, mic_device=None, speaker_device=None):
+    """Render the Wyoming configuration from config.yaml and device plans"""
     wyoming_config = {
         'satellite': {
             'name': config.get('name'),
@@ -254,86 +612,160 @@ def update_wyoming_config(config, mic_device, speaker_device=None):
             'host': config.get('host'),
             'port': config.get('ha_port'),
             'wake_word': config.get('wake_word'),
-            'mic': {
-                'command': [
-                    'arecord',
-                    '-D', mic_device,
-                    '-r', '16000',
-                    '-f', 'S16_LE',
-                    '-c', '1'
-                ]
-            },
+            'wake_word_port': config.get('wake_word_port', 10400),
             'wake': {
-                'command': [
-                    'wyoming-openwakeword',
-                    '--model', config.get('wake_word')
+                'command': ['wyoming-openwakeword'] + [
+                    arg for word in wyoming_commands.wake_words(config) for arg in ('--model', word['name'])
                 ]
             },
-            'vad': {
-                'threshold': 2,
-                'trigger_level': 3,
-                'chunk_size': 960
-            }
+            'vad': vad_section(config.get('vad') or {}),
+            'playback_sink': playback_sink_section(config.get('playback_sink') or {}),
+            'watchdog': watchdog_section(config.get('watchdog') or {}),
+            'governor': governor_section(config.get('governor') or {}),
+            'metrics': metrics_section(config.get('metrics') or {}),
+            'logging': logging_section(config.get('logging') or {})
         }
     }
 
+    if config.get('wake_tap_port'):
+        wyoming_config['satellite']['wake_tap_port'] = config['wake_tap_port']
+    if config.get('wake_threads'):
+        wyoming_config['satellite']['wake_threads'] = int(config['wake_threads'])
+    if mic_device:
+        wyoming_config['satellite']['mic'] = mic_section(mic_device, config.get('mic_ring', False))
     if speaker_device:
-        wyoming_config['satellite']['speaker'] = {
-            'command': [
-                'aplay',
-                # '-D', f"plug{speaker_device}",  # Use plughw for flexible resampling
-                '-D', "plughw:CARD=Headphones,DEV=0",
-                '-r', '22050',
-                '-c', '1',
-                '-f', 'S16_LE',
-                '-t', 'raw'
-            ]
-        }
+        wyoming_config['satellite']['speaker'] = speaker_section(speaker_device)
+    return wyoming_config
+
+def update_wyoming_config(config, mic_device, speaker_device=None):
+    """Update Wyoming configuration file"""
+    config_path = WYOMING_CONFIG_PATH
+    logger.info(f"Updating Wyoming configuration at {config_path}")
+    wyoming_config = render_wyoming_config(config, mic_device, speaker_device)
+    return write_wyoming_config(wyoming_config, config_path)
 
+def update_audio_sections(mic_device, speaker_device=None, config_path=WYOMING_CONFIG_PATH):
+    """Re-render only the mic/speaker blocks of an existing Wyoming configuration"""
     try:
-        with open('/tmp/satellite.yaml', 'w') as f:
-            yaml.dump(wyoming_config, f, default_flow_style=False)
-        
-        run_command(f'mv /tmp/satellite.yaml {config_path}', shell=True)
-        run_command(f'chown root:root {config_path}', shell=True)
-    except Exception as e:
-        logger.error(f"Failed to update config: {e}")
+        with open(config_path) as f:
+            wyoming_config = yaml.safe_load(f)
+    except (OSError, yaml.YAMLError) as e:
+        logger.error(f"Failed to read {config_path}: {e}")
         return False
 
+    satellite = wyoming_config['satellite']
+    ring = 'capture_command' in satellite.get('mic', {})
+    satellite['mic'] = mic_section(mic_device, ring)
+    if speaker_device:
+        satellite['speaker'] = speaker_section(speaker_device)
+    else:
+        satellite.pop('speaker', None)
+    logger.info(f"Updating audio devices in {config_path}")
+    return write_wyoming_config(wyoming_config, config_path)
+
+def detect_devices(asound_root=audio_devices.ASOUND_ROOT):
+    """Detect audio devices and return the (mic, speaker) plans to use
+
+    Devices are scored on their probed native rates, formats and channel
+    counts so the generated commands avoid resampling where possible.
+    """
+    devices = audio_devices.enumerate_devices(asound_root)
+    if not devices:
+        logger.error(f"No ALSA devices found under {asound_root}")
+        return None, None
+
+    best_mic = audio_devices.choose_device(devices, 'capture', audio_devices.MIC_TARGET)
+    best_speaker = audio_devices.choose_device(devices, 'playback', audio_devices.SPEAKER_TARGET)
+    return best_mic, best_speaker
+
+def export_snapshots(config, manifest, snapshot_dir):
+    """Pack both finished environments into snapshots for other nodes"""
+    for name, env in ENVIRONMENTS.items():
+        build_seconds = manifest['steps'].get(name, {}).get('seconds')
+        ref, _ = repository_settings(name, config)
+        try:
+            venv_snapshot.export_snapshot(name, env['venv'], env['repo'], snapshot_dir, build_seconds,
+                                          ref=ref, head=repo_head(env['repo']))
+        except (OSError, tarfile.TarError) as e:
+            logger.error(f"Failed to export {env['label']} snapshot: {e}")
+            return False
     return True
 
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Provision the Wyoming satellite")
+    parser.add_argument('--force', action='store_true',
+                        help="Re-run every step even if its inputs are unchanged")
+    parser.add_argument('--only', action='append', choices=SETUP_STEPS, metavar='STEP',
+                        help=f"Run only this step (repeatable): {', '.join(SETUP_STEPS)}")
+    parser.add_argument('--jobs', type=int, default=step_graph.default_workers(),
+                        help="Maximum number of setup steps to run at once (default: %(default)s)")
+    parser.add_argument('--snapshot-dir', type=Path, default=venv_snapshot.SNAPSHOT_DIR,
+                        help="Restore fresh environments from snapshots here (default: %(default)s)")
+    parser.add_argument('--no-snapshots', dest='snapshot_dir', action='store_const', const=None,
+                        help="Always build environments with pip")
+    parser.add_argument('--no-dedup', dest='dedup', action='store_false',
+                        help="Do not hardlink identical files across the two venvs after installing")
+    parser.add_argument('--export-snapshots', action='store_true',
+                        help="After setup, export both environments to --snapshot-dir")
+    return parser.parse_args(argv)
+
 def main():
+    options = parse_args()
+    # Set up here rather than at import, so the daemons and tools that import
+    # this module keep their own logging
+    os.makedirs(os.path.dirname(LOG_PATH), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(LOG_PATH),
+            logging.StreamHandler()
+        ]
+    )
     logger.info("Starting Wyoming Satellite setup...")
     
     # Load configuration
     config = load_config()
+    # logging.mode: low-write batches setup.log and keeps routine lines off journald
+    log_buffer.apply(config, 'setup', persistent=LOG_PATH)
     logger.info(f"Loaded configuration: {config}")
-    
+
+    manifest = load_manifest()
+    timings = []
+
     # Check dependencies
-    if not check_dependencies(config):
+    if not check_dependencies(config, manifest, options, timings):
         logger.error("Failed to install dependencies")
+        report_timings(timings)
         sys.exit(1)
 
-    # Detect audio devices
-    mic_devices, speaker_devices = get_audio_devices()
-    if not mic_devices:
+    if options.only and 'config' not in options.only:
+        report_timings(timings)
+        logger.info("Setup completed successfully")
+        return
+
+    # Detect audio devices and select the best ones
+    best_mic, best_speaker = detect_devices()
+    if not best_mic:
         logger.error("No microphone devices found!")
         sys.exit(1)
 
-    # Select best devices
-    best_mic = select_best_device(mic_devices)
-    best_speaker = select_best_device(speaker_devices) if speaker_devices else None
-    
-    logger.info(f"Selected microphone: {best_mic}")
+    logger.info(f"Selected microphone: {best_mic['device']} ({best_mic['rationale']})")
     if best_speaker:
-        logger.info(f"Selected speaker: {best_speaker}")
+        logger.info(f"Selected speaker: {best_speaker['device']} ({best_speaker['rationale']})")
 
     # Update configuration
-    if not update_wyoming_config(config, best_mic, best_speaker):
+    devices = {'mic': best_mic, 'speaker': best_speaker}
+    if not run_step('config', lambda: update_wyoming_config(config, best_mic, best_speaker),
+                    lambda: step_inputs('config', config, devices), manifest, options, timings):
         logger.error("Failed to update Wyoming configuration")
+        report_timings(timings)
         sys.exit(1)
 
+    report_timings(timings)
+    if options.export_snapshots and not export_snapshots(config, manifest, options.snapshot_dir or venv_snapshot.SNAPSHOT_DIR):
+        sys.exit(1)
     logger.info("Setup completed successfully")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
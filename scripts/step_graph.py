@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Run setup steps as a small dependency graph on a bounded worker pool.
+
+A step starts once all of its dependencies have succeeded. Ready steps are
+started in the order they were declared. The first failure stops any new
+steps from starting; steps already running are allowed to finish.
+"""
+import logging
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger('wyoming-setup.graph')
+
+Step = namedtuple('Step', ['name', 'func', 'deps'])
+
+def default_workers():
+    """Default pool size: one worker per core, capped at four"""
+    return max(1, min(4, os.cpu_count() or 1))
+
+def topological_order(steps):
+    """Return step names in dependency order, raising ValueError on bad graphs"""
+    by_name = {step.name: step for step in steps}
+    if len(by_name) != len(steps):
+        raise ValueError("Duplicate step names in setup graph")
+    for step in steps:
+        for dep in step.deps:
+            if dep not in by_name:
+                raise ValueError(f"Step '{step.name}' depends on unknown step '{dep}'")
+
+    order = []
+    state = {}
+
+    def visit(name):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Dependency cycle through step '{name}'")
+        state[name] = 'visiting'
+        for dep in by_name[name].deps:
+            visit(dep)
+        state[name] = 'done'
+        order.append(name)
+
+    for step in steps:
+        visit(step.name)
+    return order
+
+def _run(step, origin):
+    start = time.monotonic() - origin
+    try:
+        success = bool(step.func())
+    except Exception:
+        logger.exception(f"Step '{step.name}' raised an exception")
+        success = False
+    end = time.monotonic() - origin
+    return success, start, end
+
+def run_graph(steps, max_workers=None):
+    """Run steps respecting their dependencies
+
+    Returns ``(success, results)`` where results maps each step name to a dict
+    with ``status`` ('ok', 'failed' or 'not run') and, for steps that ran,
+    ``start``/``end`` offsets in seconds from the start of the run.
+    """
+    topological_order(steps)
+    max_workers = max_workers or default_workers()
+    pending = list(steps)
+    results = {}
+    running = {}
+    failed = False
+    origin = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while True:
+            if not failed:
+                for step in list(pending):
+                    if len(running) >= max_workers:
+                        break
+                    if all(results.get(dep, {}).get('status') == 'ok' for dep in step.deps):
+                        pending.remove(step)
+                        running[pool.submit(_run, step, origin)] = step
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                success, start, end = future.result()
+                results[step.name] = {
+                    'status': 'ok' if success else 'failed',
+                    'start': start,
+                    'end': end,
+                }
+                if not success:
+                    logger.error(f"Step '{step.name}' failed, not starting further steps")
+                    failed = True
+
+    for step in pending:
+        results[step.name] = {'status': 'not run'}
+    return not failed and not pending, results
+
+def critical_path(steps, results):
+    """Return ``(seconds, [names])`` for the longest dependency chain that ran"""
+    by_name = {step.name: step for step in steps}
+    best = {}
+    for name in topological_order(steps):
+        result = results.get(name, {})
+        if 'end' not in result:
+            continue
+        duration = result['end'] - result['start']
+        chain = max((best[dep] for dep in by_name[name].deps if dep in best),
+                    key=lambda item: item[0], default=(0.0, []))
+        best[name] = (chain[0] + duration, chain[1] + [name])
+    return max(best.values(), key=lambda item: item[0], default=(0.0, []))
+
+def log_report(steps, results):
+    """Log per-step timings, the critical path and the achieved parallelism"""
+    logger.info("Setup graph timings:")
+    for step in steps:
+        result = results.get(step.name, {})
+        if 'end' in result:
+            logger.info(f"  {step.name:<44} {result['status']:<8} "
+                        f"start {result['start']:7.2f}s  took {result['end'] - result['start']:7.2f}s")
+        else:
+            logger.info(f"  {step.name:<44} {result.get('status', 'not run')}")
+
+    ran = [result for result in results.values() if 'end' in result]
+    if not ran:
+        return
+    wall = max(result['end'] for result in ran) - min(result['start'] for result in ran)
+    busy = sum(result['end'] - result['start'] for result in ran)
+    length, path = critical_path(steps, results)
+    logger.info(f"  wall {wall:.2f}s, step time {busy:.2f}s, "
+                f"critical path {length:.2f}s: {' -> '.join(path)}")
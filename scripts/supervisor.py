@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Run the wake-word service and the satellite from one asyncio supervisor.
+
+An alternative to the separate wyoming-wakeword/wyoming-satellite units for
+nodes that prefer a single process tree. The satellite is held back until
+the wake-word port accepts connections, crashed children are restarted with
+exponential backoff, and time-to-ready is logged for every (re)start.
+"""
+import argparse
+import asyncio
+import logging
+import signal
+import sys
+import time
+
+import log_buffer
+import wyoming_commands
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(),
+    ]
+)
+logger = logging.getLogger("wyoming-supervisor")
+
+READY_TIMEOUT = 120
+BACKOFF_INITIAL = 1.0
+BACKOFF_MAX = 30.0
+# A child that stayed up this long is considered healthy again
+BACKOFF_RESET_AFTER = 60.0
+STOP_TIMEOUT = 10.0
+
+async def wait_for_port(port, timeout, host='127.0.0.1', interval=0.1):
+    """Wait until host:port accepts connections; return seconds waited or None"""
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), interval * 5)
+            writer.close()
+            return time.monotonic() - start
+        except (OSError, asyncio.TimeoutError):
+            await asyncio.sleep(interval)
+    return None
+
+class Child:
+    """One supervised service process"""
+
+    def __init__(self, name, command, ready_port=None):
+        self.name = name
+        self.command = command
+        self.ready_port = ready_port
+        self.process = None
+        self.ready = asyncio.Event()
+        self.restarts = 0
+        self.backoff = BACKOFF_INITIAL
+
+    async def start(self):
+        args, env, cwd = self.command
+        started = time.monotonic()
+        self.ready.clear()
+        self.process = await asyncio.create_subprocess_exec(*args, env=env, cwd=cwd)
+        logger.info(f"Started {self.name} (pid {self.process.pid})")
+        if self.ready_port is not None:
+            # Stop waiting for the port as soon as the child exits
+            port_task = asyncio.ensure_future(wait_for_port(self.ready_port, READY_TIMEOUT))
+            exit_task = asyncio.ensure_future(self.process.wait())
+            await asyncio.wait([port_task, exit_task], return_when=asyncio.FIRST_COMPLETED)
+            exit_task.cancel()
+            if not port_task.done():
+                port_task.cancel()
+                return started
+            if port_task.result() is None:
+                logger.error(f"{self.name} not accepting connections on port {self.ready_port} "
+                             f"after {READY_TIMEOUT}s; restarting it")
+                await self.stop()
+                return started
+        logger.info(f"{self.name} ready in {time.monotonic() - started:.2f}s")
+        self.ready.set()
+        return started
+
+    async def stop(self):
+        if self.process is None or self.process.returncode is not None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"{self.name} did not stop in {STOP_TIMEOUT}s, killing it")
+            self.process.kill()
+            await self.process.wait()
+
+    async def run(self, stopping, after=None):
+        """Keep the child running until stopping is set"""
+        while not stopping.is_set():
+            if after is not None:
+                await after.ready.wait()
+            started = await self.start()
+            returncode = await self.process.wait()
+            if stopping.is_set():
+                break
+            uptime = time.monotonic() - started
+            if uptime >= BACKOFF_RESET_AFTER:
+                self.backoff = BACKOFF_INITIAL
+            self.restarts += 1
+            logger.warning(f"{self.name} exited with {returncode} after {uptime:.1f}s; "
+                           f"restart #{self.restarts} in {self.backoff:.1f}s")
+            try:
+                await asyncio.wait_for(stopping.wait(), self.backoff)
+            except asyncio.TimeoutError:
+                pass
+            self.backoff = min(self.backoff * 2, BACKOFF_MAX)
+
+async def supervise(config):
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    wakeword = Child('wyoming-openwakeword', wyoming_commands.wakeword_command(config),
+                     config['wake_word_port'])
+    satellite = Child('wyoming-satellite', wyoming_commands.satellite_command(config),
+                      config.get('port', wyoming_commands.DEFAULT_SATELLITE_PORT))
+
+    if config.get('wake_word'):
+        tasks = [asyncio.create_task(wakeword.run(stopping)),
+                 asyncio.create_task(satellite.run(stopping, after=wakeword))]
+        children = [wakeword, satellite]
+    else:
+        tasks = [asyncio.create_task(satellite.run(stopping))]
+        children = [satellite]
+
+    await stopping.wait()
+    logger.info("Stopping children...")
+    # Satellite first so it doesn't log a burst of wake-service errors
+    for child in reversed(children):
+        await child.stop()
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Supervise the Wyoming wake word and satellite services")
+    parser.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    args = parser.parse_args()
+    try:
+        config = wyoming_commands.load_config(args.config)
+    except Exception as e:
+        logger.error(f"Error loading config: {e}")
+        sys.exit(1)
+    log_buffer.apply(config, 'supervisor')
+
+    for repo_path in (wyoming_commands.SATELLITE_REPO, wyoming_commands.OPENWAKEWORD_REPO):
+        if not repo_path.exists():
+            logger.error(f"Error: Repository not found at {repo_path}")
+            sys.exit(1)
+
+    asyncio.run(supervise(config))
+
+if __name__ == "__main__":
+    main()
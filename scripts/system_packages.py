@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Reconcile the system packages the satellite needs in one pass.
+
+Installed state is read with a single ``dpkg-query`` call and everything
+missing is installed in one ``apt-get`` transaction. Both tools can be
+pointed elsewhere (``--admindir`` for a fake dpkg status file,
+``--apt-command`` for a stub apt) so the reconciler can be exercised
+without touching the real package database.
+"""
+import argparse
+import logging
+import os
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger('wyoming-setup.packages')
+
+DPKG_QUERY = ['dpkg-query']
+APT_INSTALL = ['apt-get', 'install', '-y']
+
+def installed_packages(packages, admindir=None, dpkg_query=DPKG_QUERY):
+    """Return the subset of packages that dpkg reports as installed"""
+    command = list(dpkg_query)
+    if admindir:
+        command.append(f'--admindir={admindir}')
+    command += ['-W', '-f=${Package}\t${Status}\n', *packages]
+
+    # dpkg-query exits non-zero when any name is unknown but still prints the
+    # ones it found, so the return code is not a useful signal here.
+    try:
+        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    except OSError as e:
+        logger.warning(f"Could not query installed packages: {e}")
+        return set()
+    installed = set()
+    for line in result.stdout.splitlines():
+        name, _, status = line.partition('\t')
+        if status.split()[-1:] == ['installed']:
+            installed.add(name)
+    return installed
+
+def install_packages(packages, apt_command=APT_INSTALL):
+    """Install packages in a single apt transaction"""
+    env = os.environ.copy()
+    env.setdefault('DEBIAN_FRONTEND', 'noninteractive')
+    try:
+        result = subprocess.run([*apt_command, *packages], check=True, env=env,
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                universal_newlines=True)
+    except subprocess.CalledProcessError as e:
+        return False, e.stderr
+    except OSError as e:
+        return False, str(e)
+    return True, result.stdout
+
+def reconcile(packages, admindir=None, dpkg_query=DPKG_QUERY, apt_command=APT_INSTALL):
+    """Make sure every package is installed
+
+    Returns ``(success, report)`` where report holds the missing set and the
+    time spent in each phase.
+    """
+    report = {'requested': list(packages), 'missing': [], 'phases': {}}
+
+    start = time.monotonic()
+    installed = installed_packages(packages, admindir, dpkg_query)
+    report['phases']['query'] = time.monotonic() - start
+
+    missing = [package for package in packages if package not in installed]
+    report['missing'] = missing
+    if not missing:
+        logger.info(f"All {len(packages)} system packages are already installed")
+        return True, report
+
+    logger.info(f"Installing {len(missing)} missing packages: {' '.join(missing)}")
+    start = time.monotonic()
+    success, output = install_packages(missing, apt_command)
+    report['phases']['install'] = time.monotonic() - start
+    if not success:
+        logger.error(f"Failed to install packages: {output}")
+        return False, report
+
+    start = time.monotonic()
+    still_missing = [package for package in missing
+                     if package not in installed_packages(missing, admindir, dpkg_query)]
+    report['phases']['verify'] = time.monotonic() - start
+    if still_missing:
+        logger.error(f"Packages still missing after install: {' '.join(still_missing)}")
+        report['missing'] = still_missing
+        return False, report
+
+    return True, report
+
+def log_report(report):
+    """Log the time spent in each reconcile phase"""
+    for phase, elapsed in report['phases'].items():
+        logger.info(f"  packages/{phase:<8} {elapsed:8.2f}s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Install missing system packages in one transaction")
+    parser.add_argument('packages', nargs='+')
+    parser.add_argument('--admindir', help="dpkg database directory (for a fake status file)")
+    parser.add_argument('--apt-command', default=' '.join(APT_INSTALL),
+                        help="Command used to install packages (default: %(default)s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    success, report = reconcile(args.packages, args.admindir, apt_command=args.apt_command.split())
+    log_report(report)
+    sys.exit(0 if success else 1)
+
+if __name__ == "__main__":
+    main()
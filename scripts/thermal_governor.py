@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""Switch the CPU frequency governor by voice session and temperature.
+
+Left on the distribution default, a Pi in an enclosure either idles at full
+clock or ramps up too late for a voice session, and once it heats up the
+firmware throttles and wake word latency quietly degrades. This agent polls
+the thermal zones and cpufreq policies in sysfs every ``interval`` seconds
+and picks a governor per state:
+
+- ``session``: the satellite's ``--detection-command`` touches
+  /dev/shm/wyoming-voice-session and its ``--tts-stop-command`` and
+  ``--error-command`` remove it; while it exists (at most
+  ``session_timeout`` seconds) every policy runs ``session_governor``,
+- ``idle``: ``idle_governor`` (the first of ondemand, schedutil, powersave
+  the kernel offers if that one is missing),
+- ``hot``: from ``hot_temp`` down to ``hot_temp - hysteresis`` sessions are
+  not boosted, so a boost does not push the board into throttling.
+
+Throttling (the firmware's throttled/capped/soft-limit bits, a cooling
+device capping scaling_max_freq, or the hot threshold) is logged when it
+starts and ends, with the temperature, the clock and the latest wake word
+detection latency from the wake link tap (``wake_tap_port``). State and
+recent events are kept in /dev/shm/wyoming-governor.json (``status``).
+Every sysfs path is relative to ``--sysfs-root``.
+"""
+import argparse
+import json
+import logging
+import signal
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+import log_buffer
+import wyoming_commands
+import wyoming_tap
+
+logger = logging.getLogger('wyoming-governor')
+
+STATE_PATH = Path('/dev/shm/wyoming-governor.json')
+THERMAL_DIR = 'sys/class/thermal'
+CPUFREQ_DIR = 'sys/devices/system/cpu/cpufreq'
+# Raspberry Pi firmware throttle flags (vcgencmd get_throttled)
+FIRMWARE_THROTTLED = 'sys/devices/platform/soc/soc:firmware/get_throttled'
+FIRMWARE_FLAGS = {0x1: 'under-voltage', 0x2: 'freq-capped', 0x4: 'throttled', 0x8: 'soft-temp-limit'}
+IDLE_FALLBACK = ['ondemand', 'schedutil', 'powersave']
+DEFAULTS = {'enabled': False, 'interval': 0.5, 'session_governor': 'performance',
+            'idle_governor': 'ondemand', 'hot_temp': 80.0, 'hysteresis': 5.0, 'session_timeout': 30}
+EVENTS_KEPT = 100
+
+def governor_settings(config):
+    """The governor block of satellite.yaml with defaults filled in"""
+    settings = dict(DEFAULTS)
+    settings.update(config.get('governor') or {})
+    return settings
+
+def read(path, default=None):
+    try:
+        return Path(path).read_text().strip()
+    except OSError:
+        return default
+
+class Sysfs:
+    """Thermal zones, cpufreq policies and firmware flags under one root"""
+
+    def __init__(self, root='/'):
+        self.root = Path(root)
+
+    def policies(self):
+        return sorted((self.root / CPUFREQ_DIR).glob('policy*'))
+
+    def temperature(self):
+        """Hottest thermal zone in degrees C, None if there is none"""
+        temps = [int(value) / 1000 for zone in (self.root / THERMAL_DIR).glob('thermal_zone*')
+                 if (value := read(zone / 'temp', '')).lstrip('-').isdigit()]
+        return max(temps) if temps else None
+
+    def frequencies(self):
+        """{policy: (current kHz, capped max kHz, hardware max kHz)}"""
+        result = {}
+        for policy in self.policies():
+            values = [read(policy / name, '0') for name in
+                      ('scaling_cur_freq', 'scaling_max_freq', 'cpuinfo_max_freq')]
+            result[policy.name] = tuple(int(value) if value.isdigit() else 0 for value in values)
+        return result
+
+    def firmware_flags(self):
+        """Names of the firmware's current throttle flags, None off a Pi"""
+        value = read(self.root / FIRMWARE_THROTTLED)
+        if value is None:
+            return None
+        try:
+            flags = int(value, 16)
+        except ValueError:
+            return None
+        return [name for bit, name in FIRMWARE_FLAGS.items() if flags & bit]
+
+    def governors(self):
+        return {policy.name: read(policy / 'scaling_governor') for policy in self.policies()}
+
+    def available(self, policy):
+        return read(self.root / CPUFREQ_DIR / policy / 'scaling_available_governors', '').split()
+
+    def set_governor(self, policy, governor):
+        (self.root / CPUFREQ_DIR / policy / 'scaling_governor').write_text(governor)
+
+def pick_governor(wanted, available, fallback=()):
+    """wanted if the policy offers it, else the first fallback it does, else None"""
+    for governor in [wanted, *fallback]:
+        if governor in available:
+            return governor
+    return None
+
+def throttle_reasons(sysfs, temperature, hot_temp):
+    """Why the CPU is being held back right now ([] if it is not)"""
+    reasons = [flag for flag in (sysfs.firmware_flags() or []) if flag != 'under-voltage']
+    for policy, (_, capped, hardware) in sysfs.frequencies().items():
+        if capped and hardware and capped < hardware:
+            reasons.append(f"{policy}-max-{capped // 1000}MHz")
+    if temperature is not None and temperature >= hot_temp:
+        reasons.append(f"temp>={hot_temp:g}C")
+    return reasons
+
+def detection_latency(tap_path):
+    """p50/p95 ms of the wake link's chunk -> detection latency in the latest window that has any"""
+    try:
+        with open(tap_path) as f:
+            windows = json.load(f)['windows']
+    except (OSError, KeyError, ValueError):
+        return None
+    for window in reversed(windows):
+        histogram = window.get('latency', {}).get('audio-chunk->detection')
+        if histogram and sum(histogram):
+            return {'p50_ms': wyoming_tap.percentile(histogram, 50),
+                    'p95_ms': wyoming_tap.percentile(histogram, 95),
+                    'count': sum(histogram), 'window_end': window['end']}
+    return None
+
+def in_session(session_file, timeout):
+    """True while the session file exists and is younger than timeout"""
+    try:
+        return time.time() - Path(session_file).stat().st_mtime < timeout
+    except OSError:
+        return False
+
+class Governor:
+    """One poll of sysfs and the session file, and the governor it leads to"""
+
+    def __init__(self, settings, sysfs, session_file=wyoming_commands.VOICE_SESSION,
+                 tap_path=wyoming_tap.TAP_DIR / 'wake.json', state_path=STATE_PATH):
+        self.settings = settings
+        self.sysfs = sysfs
+        self.session_file = session_file
+        self.tap_path = tap_path
+        self.state_path = state_path
+        self.original = sysfs.governors()
+        self.state = None
+        self.hot = False
+        self.throttled_since = None
+        self.session_since = None
+        self.counts = {'sessions': 0, 'throttle_events': 0, 'throttled_seconds': 0.0,
+                       'sessions_throttled': 0, 'governor_changes': 0}
+        self.session_throttled = False
+        self.events = deque(maxlen=EVENTS_KEPT)
+        self.snapshot = {}
+
+    def event(self, kind, message, **details):
+        logger.info(message)
+        self.events.append({'time': round(time.time(), 3), 'event': kind, **details})
+
+    def apply(self, state):
+        """Put every policy on the state's governor; returns the policies changed"""
+        wanted = (self.settings['session_governor'] if state == 'session'
+                  else self.settings['idle_governor'])
+        changed = []
+        for policy, current in self.sysfs.governors().items():
+            governor = pick_governor(wanted, self.sysfs.available(policy),
+                                     () if state == 'session' else IDLE_FALLBACK)
+            if governor is None or governor == current:
+                continue
+            try:
+                self.sysfs.set_governor(policy, governor)
+            except OSError as e:
+                logger.warning(f"Cannot set {policy} to {governor}: {e}")
+                continue
+            changed.append(f"{policy}={governor}")
+        if changed:
+            self.counts['governor_changes'] += len(changed)
+        return changed
+
+    def update_throttle(self, now, temperature, reasons):
+        clock = {policy: current // 1000 for policy, (current, _, _) in self.sysfs.frequencies().items()}
+        if reasons and self.throttled_since is None:
+            self.throttled_since = now
+            self.counts['throttle_events'] += 1
+            latency = detection_latency(self.tap_path)
+            self.event('throttle-start',
+                       f"Throttling started: {', '.join(reasons)}; {temperature}C, clock {clock} MHz, "
+                       f"detection latency {latency or 'n/a (no wake_tap_port)'}",
+                       reasons=reasons, temperature=temperature, clock_mhz=clock, detection_latency=latency)
+        elif not reasons and self.throttled_since is not None:
+            duration = now - self.throttled_since
+            self.counts['throttled_seconds'] += duration
+            self.throttled_since = None
+            latency = detection_latency(self.tap_path)
+            self.event('throttle-end',
+                       f"Throttling ended after {duration:.1f}s; {temperature}C, clock {clock} MHz, "
+                       f"detection latency {latency or 'n/a (no wake_tap_port)'}",
+                       seconds=round(duration, 1), temperature=temperature, clock_mhz=clock,
+                       detection_latency=latency)
+        if reasons and self.session_since is not None:
+            self.session_throttled = True
+
+    def update_session(self, now, session):
+        if session and self.session_since is None:
+            self.session_since = now
+            self.session_throttled = self.throttled_since is not None
+            self.counts['sessions'] += 1
+            self.event('session-start', f"Voice session started"
+                       f"{' while throttled' if self.session_throttled else ''}",
+                       throttled=self.session_throttled)
+        elif not session and self.session_since is not None:
+            duration = now - self.session_since
+            if self.session_throttled:
+                self.counts['sessions_throttled'] += 1
+            self.event('session-end', f"Voice session ended after {duration:.1f}s"
+                       f"{' (throttled during it)' if self.session_throttled else ''}",
+                       seconds=round(duration, 1), throttled=self.session_throttled)
+            self.session_since = None
+
+    def poll(self):
+        now = time.monotonic()
+        temperature = self.sysfs.temperature()
+        if temperature is not None:
+            if temperature >= self.settings['hot_temp']:
+                self.hot = True
+            elif temperature < self.settings['hot_temp'] - self.settings['hysteresis']:
+                self.hot = False
+        reasons = throttle_reasons(self.sysfs, temperature, self.settings['hot_temp'])
+        self.update_throttle(now, temperature, reasons)
+        session = in_session(self.session_file, self.settings['session_timeout'])
+        self.update_session(now, session)
+
+        state = 'hot' if self.hot else 'session' if session else 'idle'
+        if state != self.state:
+            changed = self.apply(state)
+            self.event('state', f"State {self.state} -> {state} ({temperature}C): "
+                       f"{', '.join(changed) if changed else 'governors unchanged'}",
+                       state=state, previous=self.state, temperature=temperature, changed=changed)
+            self.state = state
+        self.snapshot = {'state': state, 'temperature': temperature, 'throttle_reasons': reasons,
+                         'governors': self.sysfs.governors(),
+                         'clock_mhz': {policy: current // 1000
+                                       for policy, (current, _, _) in self.sysfs.frequencies().items()}}
+
+    def write_state(self):
+        try:
+            temp_path = self.state_path.with_name(self.state_path.name + '.tmp')
+            temp_path.write_text(json.dumps({**self.snapshot, **self.counts,
+                                             'throttled_seconds': round(self.counts['throttled_seconds'], 1),
+                                             'events': list(self.events)}))
+            temp_path.replace(self.state_path)
+        except OSError as e:
+            logger.warning(f"Cannot write {self.state_path}: {e}")
+
+    def restore(self):
+        """Put every policy back on the governor it had when the agent started"""
+        for policy, governor in self.original.items():
+            if governor and self.sysfs.governors().get(policy) != governor:
+                try:
+                    self.sysfs.set_governor(policy, governor)
+                except OSError as e:
+                    logger.warning(f"Cannot restore {policy} to {governor}: {e}")
+        logger.info(f"Governors restored: {self.original}")
+
+def run(governor, interval, state_interval=5.0):
+    """Poll until SIGTERM/SIGINT, then restore the original governors"""
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    next_state = 0
+    try:
+        while True:
+            governor.poll()
+            if time.monotonic() >= next_state:
+                governor.write_state()
+                next_state = time.monotonic() + state_interval
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        governor.restore()
+        governor.write_state()
+
+def main():
+    parser = argparse.ArgumentParser(description="Thermal- and session-aware CPU governor agent")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    agent = subparsers.add_parser('run', help="Run the agent")
+    agent.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    agent.add_argument('--sysfs-root', type=Path, default=Path('/'), help="Root of sysfs")
+    agent.add_argument('--session-file', type=Path, default=wyoming_commands.VOICE_SESSION)
+    agent.add_argument('--state-file', type=Path, default=STATE_PATH)
+    agent.add_argument('--tap-file', type=Path, default=wyoming_tap.TAP_DIR / 'wake.json',
+                       help="Wake link tap histograms to read detection latency from")
+    status = subparsers.add_parser('status', help="Show the agent's state and recent events")
+    status.add_argument('--state-file', type=Path, default=STATE_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'status':
+        print(json.dumps(json.loads(args.state_file.read_text()), indent=2))
+        return
+
+    try:
+        config = wyoming_commands.load_config(args.config)
+    except Exception as e:
+        logger.error(f"Error loading config: {e}")
+        sys.exit(1)
+    log_buffer.apply(config, 'governor')
+    settings = governor_settings(config)
+    if not settings['enabled']:
+        logger.info("Governor disabled (governor.enabled is false); not governing")
+        sys.exit(0)
+    sysfs = Sysfs(args.sysfs_root)
+    if not sysfs.policies():
+        logger.info(f"No cpufreq policies under {args.sysfs_root / CPUFREQ_DIR}; not governing")
+        sys.exit(0)
+    governor = Governor(settings, sysfs, args.session_file, args.tap_file, args.state_file)
+    logger.info(f"Governing {', '.join(governor.original)} (session {settings['session_governor']}, "
+                f"idle {settings['idle_governor']}, hot from {settings['hot_temp']}C); "
+                f"session file {args.session_file}")
+    run(governor, settings['interval'])
+
+if __name__ == "__main__":
+    main()
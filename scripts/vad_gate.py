@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""Gate mic audio with voice activity detection before the wake word service.
+
+wyoming-satellite only applies its own ``--vad`` when it has no wake word
+service, so with one configured the wake word model runs inference on every
+chunk, silence included. This proxy sits between the satellite and
+wyoming-openwakeword and forwards audio only once speech is detected:
+
+- each chunk is split into ``chunk_size``-byte frames and classified by
+  energy against an adaptive noise floor; ``threshold`` (0-3) sets how far
+  above the floor speech must be, ``trigger_level`` how many consecutive
+  speech frames open the gate,
+- the last ``pre_roll`` seconds before the gate opens are replayed first so
+  the start of the wake word is not clipped,
+- the gate stays open for ``hangover`` seconds of audio after the last
+  speech frame.
+
+All other events (and everything from the wake word service) pass through
+unchanged.
+"""
+import argparse
+import array
+import asyncio
+import logging
+import math
+import signal
+import sys
+from collections import deque
+
+import log_buffer
+import wyoming_commands
+import wyoming_tap
+
+logger = logging.getLogger('wyoming-vad-gate')
+
+RATE = 16000
+WIDTH = 2
+
+# dB above the noise floor a frame needs to count as speech, per threshold 0-3
+THRESHOLD_MARGIN_DB = {0: 6, 1: 9, 2: 12, 3: 15}
+# Frames quieter than this are never speech (digital silence, idle USB mics)
+MIN_SPEECH_DB = 30
+# The noise floor follows quieter audio quickly and louder audio slowly; it
+# also creeps up during "speech" so steady noise (a fan, a TV) is absorbed
+FLOOR_FALL = 0.5
+FLOOR_RISE = 0.02
+FLOOR_SPEECH_RISE = 0.002
+STATS_INTERVAL = 300
+
+DEFAULTS = {'threshold': 2, 'trigger_level': 3, 'chunk_size': 960, 'pre_roll': 1.0, 'hangover': 2.0}
+
+def vad_settings(config):
+    """The vad block of satellite.yaml with defaults filled in"""
+    settings = dict(DEFAULTS)
+    settings.update(config.get('vad') or {})
+    return settings
+
+def frame_db(frame):
+    """Frame energy in dB relative to one LSB of 16-bit audio"""
+    samples = array.array('h', frame)
+    if not samples:
+        return 0.0
+    rms = math.sqrt(sum(sample * sample for sample in samples) / len(samples))
+    return 20 * math.log10(rms + 1)
+
+class EnergyVad:
+    """Frame-level speech detection against an adaptive noise floor"""
+
+    def __init__(self, threshold=2, trigger_level=3, frame_bytes=960):
+        self.margin = THRESHOLD_MARGIN_DB[max(0, min(3, int(threshold)))]
+        self.trigger_level = max(1, int(trigger_level))
+        self.frame_bytes = int(frame_bytes) - int(frame_bytes) % WIDTH
+        self.floor = None
+        self.run = 0
+
+    def frames(self, audio):
+        """Classify each frame of audio, yielding (speech, triggered)"""
+        for offset in range(0, len(audio) - self.frame_bytes + 1, self.frame_bytes):
+            level = frame_db(audio[offset:offset + self.frame_bytes])
+            if self.floor is None:
+                self.floor = level
+            speech = level >= MIN_SPEECH_DB and level > self.floor + self.margin
+            if level < self.floor:
+                rate = FLOOR_FALL
+            else:
+                rate = FLOOR_SPEECH_RISE if speech else FLOOR_RISE
+            self.floor += (level - self.floor) * rate
+            self.run = self.run + 1 if speech else 0
+            yield speech, self.run >= self.trigger_level
+
+class Gate:
+    """Decides which audio chunks reach the wake word service"""
+
+    def __init__(self, settings):
+        self.vad = EnergyVad(settings['threshold'], settings['trigger_level'], settings['chunk_size'])
+        self.pre_roll_bytes = int(settings['pre_roll'] * RATE * WIDTH)
+        self.hangover_bytes = int(settings['hangover'] * RATE * WIDTH)
+        self.reset()
+        self.chunks = 0
+        self.forwarded = 0
+        self.openings = 0
+
+    def reset(self):
+        self.open = False
+        self.buffer = deque()
+        self.buffered = 0
+        self.since_speech = 0
+
+    def chunk(self, frame, audio):
+        """Feed one audio-chunk; return the frames to forward now (possibly none)
+
+        frame is whatever the caller forwards for this chunk (e.g. the raw
+        event bytes); audio is its PCM payload.
+        """
+        self.chunks += 1
+        speech = triggered = False
+        for frame_speech, frame_triggered in self.vad.frames(audio):
+            speech = speech or frame_speech
+            triggered = triggered or frame_triggered
+        if self.open:
+            self.since_speech = 0 if speech else self.since_speech + len(audio)
+            if self.since_speech > self.hangover_bytes:
+                self.open = False
+            else:
+                self.forwarded += 1
+                return [frame]
+        if triggered:
+            self.open = True
+            self.openings += 1
+            self.since_speech = 0
+            pending = [buffered for buffered, _ in self.buffer] + [frame]
+            self.buffer.clear()
+            self.buffered = 0
+            self.forwarded += len(pending)
+            return pending
+        # Keep a rolling pre-roll while closed
+        self.buffer.append((frame, len(audio)))
+        self.buffered += len(audio)
+        while self.buffered - self.buffer[0][1] >= self.pre_roll_bytes:
+            self.buffered -= self.buffer.popleft()[1]
+        return []
+
+    def stats(self):
+        return {'chunks': self.chunks, 'forwarded': self.forwarded, 'openings': self.openings,
+                'forwarded_fraction': round(self.forwarded / self.chunks, 3) if self.chunks else None}
+
+async def gate_client(reader, writer, gate):
+    """Satellite -> wake word direction: hold back audio while the gate is closed"""
+    try:
+        while True:
+            frame = await wyoming_tap.read_frame(reader)
+            if frame is None:
+                break
+            line, header, body = frame
+            event_type = header.get('type')
+            if event_type == 'audio-chunk':
+                payload = body[header.get('data_length') or 0:]
+                for pending in gate.chunk(line + body, payload):
+                    writer.write(pending)
+            else:
+                if event_type == 'audio-start':
+                    gate.reset()
+                writer.write(line + body)
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+async def passthrough(reader, writer):
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            writer.write(data)
+            await writer.drain()
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def report(gate):
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        logger.info(f"Gate stats: {gate.stats()}")
+
+async def serve(listen_port, upstream_port, settings):
+    async def handle(client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection('127.0.0.1', upstream_port)
+        except OSError as e:
+            logger.error(f"Cannot reach wake word service on port {upstream_port}: {e}")
+            client_writer.close()
+            return
+        wyoming_tap.set_nodelay(client_writer)
+        wyoming_tap.set_nodelay(server_writer)
+        gate = Gate(settings)
+        logger.info(f"Gating audio from {client_writer.get_extra_info('peername')}")
+        reporter = asyncio.create_task(report(gate))
+        await asyncio.gather(gate_client(client_reader, server_writer, gate),
+                             passthrough(server_reader, client_writer))
+        reporter.cancel()
+        logger.info(f"Connection closed: {gate.stats()}")
+
+    server = await asyncio.start_server(handle, '127.0.0.1', listen_port)
+    logger.info(f"VAD gate on port {listen_port} -> wake word port {upstream_port} ({settings})")
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="VAD gate between the satellite and the wake word service")
+    parser.add_argument('--config', default=wyoming_commands.SATELLITE_CONFIG_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        config = wyoming_commands.load_config(args.config)
+    except Exception as e:
+        logger.error(f"Error loading config: {e}")
+        sys.exit(1)
+    log_buffer.apply(config, 'vad-gate')
+    gate_port = wyoming_commands.vad_gate_port(config)
+    if gate_port is None:
+        # The satellite dials the wake word service directly
+        logger.info("VAD gate disabled (vad.enabled is false or no wake word); not gating")
+        sys.exit(0)
+    try:
+        asyncio.run(serve(gate_port, config['wake_word_port'], vad_settings(config)))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == "__main__":
+    main()
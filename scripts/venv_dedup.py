@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""Deduplicate byte-identical files across the satellite and wake-word venvs.
+
+Both environments carry their own copies of numpy, pyyaml and friends.
+Hardlinking identical files saves SD space and, because both services then
+map the same inodes, lets them share page cache for the heavy .so files.
+Reflinks save space on filesystems that support them but do not share page
+cache. ``verify`` re-checks every installed file against pip's RECORD hashes,
+and ``measure`` sums RSS/PSS of the running services for before/after
+comparisons.
+"""
+import argparse
+import base64
+import csv
+import errno
+import fcntl
+import filecmp
+import hashlib
+import json
+import logging
+import os
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+logger = logging.getLogger('wyoming-setup.dedup')
+
+VENVS = [Path("/home/admin/.wyoming-satellite"), Path("/home/admin/.wyoming-openwakeword")]
+SERVICES = ['wyoming-satellite.service', 'wyoming-wakeword.service']
+CGROUP_ROOT = Path('/sys/fs/cgroup/system.slice')
+PROC_ROOT = Path('/proc')
+
+FICLONE = 0x40049409
+
+def _regular_files(root):
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = Path(dirpath) / filename
+            try:
+                st = path.lstat()
+            except OSError:
+                continue
+            if path.is_symlink() or not st.st_size:
+                continue
+            yield path, st
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def find_duplicates(venvs=VENVS):
+    """Group byte-identical files that appear in more than one venv
+
+    Only files whose size matches a file in another venv are hashed, and
+    files already sharing an inode are not reported again. Each group is a
+    list of paths whose first entry is the one the others will link to.
+    """
+    by_size = defaultdict(list)
+    for index, venv in enumerate(venvs):
+        lib = Path(venv) / 'lib'
+        if not lib.exists():
+            continue
+        for path, st in _regular_files(lib):
+            by_size[st.st_size].append((index, path, st))
+
+    groups = []
+    for size, entries in by_size.items():
+        if len({index for index, _, _ in entries}) < 2:
+            continue
+        by_hash = defaultdict(list)
+        for index, path, st in entries:
+            by_hash[(st.st_dev, st.st_mode, st.st_uid, st.st_gid, _sha256(path))].append((index, path, st))
+        for matches in by_hash.values():
+            if len({index for index, _, _ in matches}) < 2:
+                continue
+            inodes = {}
+            for index, path, st in matches:
+                inodes.setdefault(st.st_ino, path)
+            if len(inodes) > 1:
+                groups.append((size, list(inodes.values())))
+    return groups
+
+def _link(source, target, mode):
+    tmp = target.with_name(f".{target.name}.dedup")
+    if mode == 'hardlink':
+        os.link(source, tmp)
+    else:
+        with open(source, 'rb') as src, open(tmp, 'wb') as dst:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        os.chmod(tmp, source.stat().st_mode)
+    os.replace(tmp, target)
+
+def deduplicate(venvs=VENVS, mode='hardlink', dry_run=False):
+    """Link duplicate files together, returning a report of bytes reclaimed"""
+    report = {'mode': mode, 'dry_run': dry_run, 'groups': 0, 'files': 0, 'bytes_reclaimed': 0}
+    for size, paths in find_duplicates(venvs):
+        source = paths[0]
+        report['groups'] += 1
+        for target in paths[1:]:
+            # Hashes matched; compare bytes before replacing anything
+            if not filecmp.cmp(source, target, shallow=False):
+                continue
+            if not dry_run:
+                try:
+                    _link(source, target, mode)
+                except OSError as e:
+                    if e.errno in (errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY):
+                        logger.error(f"{mode} not supported for {target}: {e}")
+                        return report
+                    logger.warning(f"Could not link {target}: {e}")
+                    continue
+            report['files'] += 1
+            report['bytes_reclaimed'] += size
+    verb = "Would reclaim" if dry_run else "Reclaimed"
+    logger.info(f"{verb} {report['bytes_reclaimed'] / 1e6:.1f} MB across {report['files']} files "
+                f"({report['groups']} groups, {mode})")
+    return report
+
+def _record_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return 'sha256=' + base64.urlsafe_b64encode(digest.digest()).rstrip(b'=').decode()
+
+def verify(venvs=VENVS):
+    """Check every installed file against the hash in its package's RECORD
+
+    Returns a list of paths that are missing or no longer match.
+    """
+    problems = []
+    checked = 0
+    for venv in venvs:
+        for record in Path(venv).glob('lib/python*/site-packages/*.dist-info/RECORD'):
+            site_packages = record.parent.parent
+            with open(record, newline='') as f:
+                for row in csv.reader(f):
+                    if len(row) < 2 or not row[1].startswith('sha256='):
+                        continue
+                    path = (site_packages / row[0]).resolve()
+                    try:
+                        matches = _record_hash(path) == row[1]
+                    except OSError:
+                        matches = False
+                    checked += 1
+                    if not matches:
+                        problems.append(str(path))
+    logger.info(f"Verified {checked} files, {len(problems)} problems")
+    return problems
+
+def service_pids(service, cgroup_root=CGROUP_ROOT):
+    """Return the PIDs in a service's cgroup"""
+    try:
+        with open(Path(cgroup_root) / service / 'cgroup.procs') as f:
+            return [int(line) for line in f if line.strip()]
+    except OSError:
+        return []
+
+def process_memory(pid, proc_root=PROC_ROOT):
+    """Return {'rss': kB, 'pss': kB} for a process from smaps_rollup"""
+    memory = {'rss': 0, 'pss': 0}
+    try:
+        with open(Path(proc_root) / str(pid) / 'smaps_rollup') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    memory[key.lower()] = int(value.split()[0])
+    except OSError:
+        pass
+    return memory
+
+def measure(services=SERVICES, cgroup_root=CGROUP_ROOT, proc_root=PROC_ROOT):
+    """Sum RSS and PSS (kB) per service and in total"""
+    result = {'services': {}, 'total': {'rss': 0, 'pss': 0}}
+    for service in services:
+        totals = {'rss': 0, 'pss': 0, 'pids': 0}
+        for pid in service_pids(service, cgroup_root):
+            memory = process_memory(pid, proc_root)
+            totals['rss'] += memory['rss']
+            totals['pss'] += memory['pss']
+            totals['pids'] += 1
+        result['services'][service] = totals
+        result['total']['rss'] += totals['rss']
+        result['total']['pss'] += totals['pss']
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Deduplicate files across the Wyoming venvs")
+    parser.add_argument('--venv', action='append', type=Path,
+                        help="Virtual environment to include (repeatable, default: both Wyoming venvs)")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    apply = subparsers.add_parser('apply', help="Link identical files together")
+    apply.add_argument('--mode', choices=['hardlink', 'reflink'], default='hardlink')
+    apply.add_argument('--dry-run', action='store_true')
+    subparsers.add_parser('verify', help="Check installed files against pip RECORD hashes")
+    memory = subparsers.add_parser('measure', help="Report RSS/PSS of the running services")
+    memory.add_argument('--baseline', type=Path, help="Earlier 'measure' output to compare against")
+    memory.add_argument('--output', type=Path, help="Also write the measurement to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    venvs = args.venv or VENVS
+    if args.command == 'apply':
+        print(json.dumps(deduplicate(venvs, args.mode, args.dry_run), indent=2))
+    elif args.command == 'verify':
+        problems = verify(venvs)
+        for path in problems:
+            print(path)
+        sys.exit(1 if problems else 0)
+    else:
+        result = measure()
+        if args.baseline:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+            result['delta'] = {key: result['total'][key] - baseline['total'][key] for key in ('rss', 'pss')}
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(result, f, indent=2)
+        print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
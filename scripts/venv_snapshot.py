@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""Export and restore prebuilt virtual environment snapshots.
+
+A snapshot is a gzip'd tarball holding a finished venv and the repository
+checkout it was built from, plus a JSON sidecar with the archive's sha256
+and the Python ABI/architecture it was built for. Restoring one onto a new
+node skips the pip build entirely; setup.py falls back to the normal pip
+path when no compatible snapshot exists.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import sysconfig
+import tarfile
+import tempfile
+import time
+from pathlib import Path
+
+logger = logging.getLogger('wyoming-setup.snapshot')
+
+SNAPSHOT_DIR = Path('/var/lib/wyoming/snapshots')
+
+def platform_fingerprint():
+    """Describe the interpreter ABI and platform a venv is tied to"""
+    return {
+        'cache_tag': sys.implementation.cache_tag,
+        'soabi': sysconfig.get_config_var('SOABI'),
+        'machine': platform.machine(),
+        'libc': '-'.join(part for part in platform.libc_ver() if part),
+    }
+
+def snapshot_paths(snapshot_dir, name):
+    """Return the archive and metadata paths for an environment's snapshot"""
+    snapshot_dir = Path(snapshot_dir)
+    return snapshot_dir / f"{name}.tar.gz", snapshot_dir / f"{name}.json"
+
+class _HashingReader:
+    """File wrapper that hashes everything read through it"""
+
+    def __init__(self, f):
+        self._f = f
+        self.sha256 = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._f.read(size)
+        self.sha256.update(data)
+        return data
+
+def export_snapshot(name, venv_path, repository_path, snapshot_dir=SNAPSHOT_DIR, build_seconds=None,
+                    ref=None, head=None):
+    """Pack a venv and its repository checkout into a checksummed snapshot"""
+    archive_path, meta_path = snapshot_paths(snapshot_dir, name)
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = archive_path.with_suffix('.tmp')
+
+    start = time.monotonic()
+    sha256 = hashlib.sha256()
+    with open(tmp_path, 'wb') as raw:
+        with tarfile.open(fileobj=raw, mode='w:gz', compresslevel=6) as tar:
+            tar.add(str(venv_path), arcname='venv')
+            tar.add(str(repository_path), arcname='repo')
+    with open(tmp_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha256.update(block)
+    os.replace(tmp_path, archive_path)
+
+    metadata = {
+        'name': name,
+        'platform': platform_fingerprint(),
+        'python': platform.python_version(),
+        'venv_path': os.path.abspath(venv_path),
+        'repository_path': os.path.abspath(repository_path),
+        'ref': ref,
+        'head': head,
+        'sha256': sha256.hexdigest(),
+        'size': archive_path.stat().st_size,
+        'build_seconds': build_seconds,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+    with open(meta_path, 'w') as f:
+        json.dump(metadata, f, indent=2, sort_keys=True)
+    logger.info(f"Exported {name} snapshot to {archive_path} "
+                f"({metadata['size'] / 1e6:.1f} MB in {time.monotonic() - start:.1f}s)")
+    return metadata
+
+def find_snapshot(name, snapshot_dir=SNAPSHOT_DIR):
+    """Return a snapshot's metadata if one exists and matches this platform"""
+    archive_path, meta_path = snapshot_paths(snapshot_dir, name)
+    if not archive_path.exists() or not meta_path.exists():
+        return None
+    try:
+        with open(meta_path) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable snapshot metadata {meta_path}: {e}")
+        return None
+    if metadata.get('platform') != platform_fingerprint():
+        logger.info(f"Snapshot for {name} was built for {metadata.get('platform')}, "
+                    f"not {platform_fingerprint()}; ignoring it")
+        return None
+    return metadata
+
+def relocate_venv(venv_path, old_path, new_path):
+    """Rewrite hard-coded venv paths in scripts after a restore to a new location"""
+    old, new = str(old_path).encode(), str(new_path).encode()
+    if old == new:
+        return
+    for path in (Path(venv_path) / 'bin').iterdir():
+        if path.is_symlink() or not path.is_file():
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Only console-script shebangs and activate scripts carry the path
+        if old in data and (data.startswith(b'#!') or path.name.startswith('activate')):
+            with open(path, 'wb') as f:
+                f.write(data.replace(old, new))
+
+def _extract(tar, destination):
+    if hasattr(tarfile, 'tar_filter'):
+        # venvs contain absolute symlinks to the system interpreter, which
+        # the stricter 'data' filter refuses.
+        tar.extractall(destination, filter='tar')
+    else:
+        tar.extractall(destination)
+
+def restore_snapshot(metadata, venv_path, repository_path, snapshot_dir=SNAPSHOT_DIR):
+    """Unpack a snapshot into place, verifying its checksum on the way
+
+    Both targets must not exist yet. Returns True on success; on any failure
+    nothing is left behind at the target paths.
+    """
+    venv_path, repository_path = Path(os.path.abspath(venv_path)), Path(os.path.abspath(repository_path))
+    if venv_path.exists() or repository_path.exists():
+        logger.error(f"Refusing to restore over existing {venv_path} or {repository_path}")
+        return False
+
+    archive_path, _ = snapshot_paths(snapshot_dir, metadata['name'])
+    start = time.monotonic()
+    venv_path.parent.mkdir(parents=True, exist_ok=True)
+    repository_path.parent.mkdir(parents=True, exist_ok=True)
+    staging = Path(tempfile.mkdtemp(prefix='.snapshot-', dir=venv_path.parent))
+    try:
+        with open(archive_path, 'rb') as raw:
+            reader = _HashingReader(raw)
+            with tarfile.open(fileobj=reader, mode='r|gz') as tar:
+                _extract(tar, staging)
+            # Drain any trailing padding so the digest covers the whole file
+            while reader.read(1 << 20):
+                pass
+        if reader.sha256.hexdigest() != metadata['sha256']:
+            logger.error(f"Checksum mismatch for {archive_path}; not restoring")
+            return False
+
+        relocate_venv(staging / 'venv', metadata['venv_path'], venv_path)
+        os.rename(staging / 'venv', venv_path)
+        shutil.move(str(staging / 'repo'), str(repository_path))
+    except (OSError, tarfile.TarError) as e:
+        logger.error(f"Failed to restore {archive_path}: {e}")
+        shutil.rmtree(venv_path, ignore_errors=True)
+        shutil.rmtree(repository_path, ignore_errors=True)
+        return False
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    elapsed = time.monotonic() - start
+    build = metadata.get('build_seconds')
+    comparison = f" vs {build:.1f}s to build with pip" if build else ""
+    logger.info(f"Restored {metadata['name']} snapshot in {elapsed:.1f}s{comparison}")
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or restore venv snapshots")
+    parser.add_argument('--snapshot-dir', default=str(SNAPSHOT_DIR))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    for command in ('export', 'restore'):
+        sub = subparsers.add_parser(command)
+        sub.add_argument('name')
+        sub.add_argument('venv')
+        sub.add_argument('repository')
+    show = subparsers.add_parser('show', help="Print a snapshot's metadata if it matches this platform")
+    show.add_argument('name')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'export':
+        export_snapshot(args.name, Path(args.venv), Path(args.repository), args.snapshot_dir)
+        return
+
+    metadata = find_snapshot(args.name, args.snapshot_dir)
+    if metadata is None:
+        logger.error(f"No compatible snapshot for {args.name} in {args.snapshot_dir}")
+        sys.exit(1)
+    if args.command == 'show':
+        print(json.dumps(metadata, indent=2, sort_keys=True))
+    elif not restore_snapshot(metadata, args.venv, args.repository, args.snapshot_dir):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
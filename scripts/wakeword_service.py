@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Run wyoming-openwakeword with per-word thresholds and per-model timing.
+
+Runs under the openwakeword venv's interpreter in place of
+``python -m wyoming_openwakeword``. Every configured wake word is preloaded
+into this one process (``--preload-model`` per word), where they share the
+audio -> mel spectrogram -> embedding pipeline and only each word's small
+classifier runs per word. On top of upstream's options it adds:
+
+- ``--word-threshold NAME=VALUE`` and ``--word-trigger-level NAME=VALUE``,
+  which override the global ``--threshold``/``--trigger-level`` per word,
+- per-model inference timing: each TFLite model's invoke() is timed in
+  thread CPU time and logged every ``--stats-interval`` seconds, so the
+  shared pipeline (melspectrogram, embedding_model) and the marginal cost
+  of each extra word can be read off directly,
+- ``--threads N``, the thread count of every TFLite interpreter (upstream
+  fixes it at 1), set from the tuned ``wake_threads``,
+- ``--timing-file PATH``, where the wall time percentiles and CPU time of
+  every model are written at exit (used by ``benchmark.py threads``).
+
+The hooks are written against wyoming-openwakeword v1.8.2, the ref pinned
+under ``repositories`` in config.yaml. If its internals differ, the service
+runs unmodified with the global settings and a warning is logged; once the
+preloaded models are up, overrides that match none of them and models the
+timing hook missed are logged too.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import re
+import signal
+import sys
+import threading
+import time
+import types
+from pathlib import Path
+
+# This scripts directory is sys.path[0]; keep its modules from shadowing the service's
+sys.path = [path for path in sys.path if Path(path or '.').resolve() != Path(__file__).resolve().parent]
+
+logger = logging.getLogger('wyoming-wakeword')
+
+STATS_INTERVAL = 300
+# Seconds the preloaded models have to create their interpreters before the hook check
+LOAD_TIMEOUT = 30
+_VERSION = re.compile(r'_v[0-9.]+$')
+
+def word_key(name):
+    """Comparable wake word name: 'hey_jarvis_v0.1', 'Hey Jarvis' -> 'hey jarvis'"""
+    if name.endswith('.tflite'):
+        name = Path(name).stem
+    return _VERSION.sub('', name).lower().replace('_', ' ').strip()
+
+def parse_overrides(values, convert):
+    """{word key: value} from NAME=VALUE arguments"""
+    overrides = {}
+    for value in values:
+        name, _, setting = value.rpartition('=')
+        if not name:
+            raise ValueError(f"Expected NAME=VALUE, got '{value}'")
+        overrides[word_key(name)] = convert(setting)
+    return overrides
+
+class ModelTimes:
+    """Invocation counts and CPU time per model, shared by the inference threads"""
+
+    def __init__(self, keep_samples=False):
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.since = time.monotonic()
+        # Models whose interpreter was created through the timing hook
+        self.loaded = set()
+        # Every invoke's (wall ns, cpu ns) per model, only kept for --timing-file
+        self.samples = {} if keep_samples else None
+
+    def load(self, name):
+        with self.lock:
+            self.loaded.add(name)
+
+    def add(self, name, cpu_ns, wall_ns):
+        with self.lock:
+            entry = self.totals.setdefault(name, [0, 0])
+            entry[0] += 1
+            entry[1] += cpu_ns
+            if self.samples is not None:
+                self.samples.setdefault(name, []).append((wall_ns, cpu_ns))
+
+    def timing(self):
+        """Wall time p50/p99 and total CPU per model over every invoke"""
+        with self.lock:
+            samples = {name: list(values) for name, values in (self.samples or {}).items()}
+        timing = {}
+        for name, values in sorted(samples.items()):
+            walls = sorted(wall for wall, _ in values)
+            pick = lambda q: round(walls[min(len(walls) - 1, int(q / 100 * len(walls)))] / 1e6, 3)
+            timing[name] = {'invocations': len(values), 'wall_p50_ms': pick(50), 'wall_p99_ms': pick(99),
+                            'cpu_seconds': round(sum(cpu for _, cpu in values) / 1e9, 3)}
+        return timing
+
+    def take(self):
+        """Per-model summary since the last call"""
+        with self.lock:
+            totals, self.totals = self.totals, {}
+            now = time.monotonic()
+            elapsed, self.since = now - self.since, now
+        return {name: {'invocations': count,
+                       'mean_ms': round(cpu_ns / count / 1e6, 3),
+                       'cpu_percent': round(100 * cpu_ns / 1e9 / elapsed, 2) if elapsed else None}
+                for name, (count, cpu_ns) in sorted(totals.items())}
+
+def timed_interpreter(interpreter_class, times, threads=None):
+    """A tflite Interpreter stand-in that times invoke() per model file"""
+    class TimedInterpreter:
+        def __init__(self, *args, model_path=None, **kwargs):
+            if threads:
+                kwargs['num_threads'] = threads
+            self._interpreter = interpreter_class(*args, model_path=model_path, **kwargs)
+            self._name = Path(str(model_path)).stem if model_path else 'model'
+            times.load(self._name)
+
+        def invoke(self):
+            # thread_time only sees this thread; with threads > 1 the
+            # interpreter's workers are in the process total instead
+            start, wall = time.thread_time_ns(), time.perf_counter_ns()
+            self._interpreter.invoke()
+            times.add(self._name, time.thread_time_ns() - start, time.perf_counter_ns() - wall)
+
+        def __getattr__(self, attr):
+            return getattr(self._interpreter, attr)
+
+    return TimedInterpreter
+
+def tune(wake_words, thresholds, trigger_levels):
+    """Apply per-word overrides to one client's {model key: WakeWordData}"""
+    for model_key, data in wake_words.items():
+        key = word_key(model_key)
+        if key in thresholds:
+            data.threshold = thresholds[key]
+        if key in trigger_levels:
+            data.trigger_level = trigger_levels[key]
+
+def check_hooks(model_keys, thresholds, trigger_levels, times, timeout=LOAD_TIMEOUT):
+    """Log overrides no preloaded model matches and models loaded around the timing hook"""
+    loaded = {word_key(key) for key in model_keys}
+    for name in sorted((set(thresholds) | set(trigger_levels)) - loaded):
+        logger.warning(f"No preloaded wake word model matches the override for '{name}' "
+                       f"(loaded: {sorted(model_keys)}); it only applies if a client loads it")
+    expected = {'melspectrogram', 'embedding_model', *model_keys}
+    deadline = time.monotonic() + timeout
+    while True:
+        with times.lock:
+            missing = expected - times.loaded
+        if not missing or time.monotonic() >= deadline:
+            break
+        time.sleep(0.1)
+    if missing:
+        logger.error(f"Models {sorted(missing)} were not loaded through the timing hook within {timeout}s; "
+                     f"their timing and --threads are off (wyoming-openwakeword internals changed?)")
+    else:
+        logger.info(f"Hooks applied to {sorted(expected)}")
+
+def install_hooks(thresholds, trigger_levels, times, threads=None):
+    """Patch the service for per-word settings and timing; False if it can't be"""
+    try:
+        from wyoming_openwakeword import handler, openwakeword
+        interpreter_class = openwakeword.tflite.Interpreter
+        handle_event = handler.OpenWakeWordEventHandler.handle_event
+        ensure_loaded = handler.ensure_loaded
+        missing = {'threshold', 'trigger_level'} - set(handler.WakeWordData.__dataclass_fields__)
+        if missing:
+            raise AttributeError(f"WakeWordData has no {', '.join(sorted(missing))}")
+    except (ImportError, AttributeError) as e:
+        logger.warning(f"Unexpected wyoming-openwakeword internals ({e}); "
+                       f"per-word settings and timing are off")
+        return False
+
+    openwakeword.tflite = types.SimpleNamespace(Interpreter=timed_interpreter(interpreter_class, times, threads))
+
+    async def tuned_handle_event(self, event):
+        fresh = self.data is None
+        result = await handle_event(self, event)
+        # Client data is created on the first event and extended when a detect
+        # loads another model; audio chunks never change it
+        if self.data is not None and (fresh or event.type != 'audio-chunk'):
+            tune(self.data.wake_words, thresholds, trigger_levels)
+        return result
+
+    def checked_ensure_loaded(state, model_names, *args, **kwargs):
+        preload = not state.wake_words
+        result = ensure_loaded(state, model_names, *args, **kwargs)
+        # The first call is upstream's --preload-model; clients load the rest later
+        if preload and state.wake_words:
+            threading.Thread(target=check_hooks, daemon=True,
+                             args=(list(state.wake_words), thresholds, trigger_levels, times)).start()
+        return result
+
+    handler.OpenWakeWordEventHandler.handle_event = tuned_handle_event
+    # Patched before __main__ is imported, which binds ensure_loaded by name
+    handler.ensure_loaded = checked_ensure_loaded
+    return True
+
+def report(times, interval):
+    while True:
+        time.sleep(interval)
+        logger.info(f"Model inference over {interval}s: {times.take()}")
+
+def main():
+    parser = argparse.ArgumentParser(description="wyoming-openwakeword with per-word settings and timing",
+                                     add_help=False)
+    parser.add_argument('--word-threshold', action='append', default=[], metavar='NAME=VALUE')
+    parser.add_argument('--word-trigger-level', action='append', default=[], metavar='NAME=VALUE')
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL)
+    parser.add_argument('--threads', type=int, help="Threads per TFLite interpreter (default: upstream's 1)")
+    parser.add_argument('--timing-file', type=Path, help="Write per-model timing here at exit")
+    args, service_args = parser.parse_known_args()
+    try:
+        thresholds = parse_overrides(args.word_threshold, float)
+        trigger_levels = parse_overrides(args.word_trigger_level, int)
+    except ValueError as e:
+        parser.error(str(e))
+
+    # Configured before the service does, so it also covers the lines logged here
+    logging.basicConfig(level=logging.DEBUG if '--debug' in service_args else logging.INFO,
+                        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    times = ModelTimes(keep_samples=args.timing_file is not None)
+    if install_hooks(thresholds, trigger_levels, times, args.threads) and args.stats_interval > 0:
+        threading.Thread(target=report, args=(times, args.stats_interval), daemon=True).start()
+    if thresholds or trigger_levels:
+        logger.info(f"Per-word thresholds {thresholds}, trigger levels {trigger_levels}")
+
+    if args.threads:
+        logger.info(f"Inference threads: {args.threads}")
+
+    # Everything else is upstream's command line
+    from wyoming_openwakeword.__main__ import main as service_main
+    sys.argv = [sys.argv[0]] + service_args
+    # Stop on SIGTERM the way upstream stops on Ctrl-C (asyncio.run cancels
+    # the service on SIGINT), so its threads are joined and the timing written
+    signal.signal(signal.SIGTERM, lambda signum, frame: signal.raise_signal(signal.SIGINT))
+    try:
+        asyncio.run(service_main())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info(f"Model inference at exit: {times.take()}")
+        if args.timing_file:
+            args.timing_file.write_text(json.dumps(times.timing()))
+
+if __name__ == "__main__":
+    main()
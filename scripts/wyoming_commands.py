@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""Build the wake-word and satellite command lines from satellite.yaml.
+
+Shared by the run-*.py launchers, which exec the service in place of
+themselves (or watch it as a child, see liveness.py), and by supervisor.py,
+which runs both as children.
+"""
+import os
+import socket
+import sys
+import time
+from pathlib import Path
+
+import yaml
+
+SATELLITE_CONFIG_PATH = '/etc/wyoming/satellite.yaml'
+
+SATELLITE_VENV = Path("/home/admin/.wyoming-satellite")
+SATELLITE_REPO = Path("/home/admin/.wyoming/wyoming-satellite")
+OPENWAKEWORD_VENV = Path("/home/admin/.wyoming-openwakeword")
+OPENWAKEWORD_REPO = Path("/home/admin/.wyoming/wyoming-openwakeword")
+# Runs inside the openwakeword venv; adds per-word thresholds and model timing
+WAKEWORD_LAUNCHER = Path(__file__).resolve().with_name('wakeword_service.py')
+LIVENESS = Path(__file__).resolve().with_name('liveness.py')
+# Exists from a wake word detection until the response (thermal_governor.py boosts meanwhile)
+VOICE_SESSION = Path('/dev/shm/wyoming-voice-session')
+
+DEFAULT_WAKE_WORD_PORT = 10400
+DEFAULT_SATELLITE_PORT = 10600
+DEFAULT_VAD_GATE_PORT = 10402
+DEFAULT_PLAYBACK_SINK_PORT = 10403
+
+def load_config(config_path=SATELLITE_CONFIG_PATH):
+    """Load the satellite section of the rendered Wyoming configuration"""
+    with open(config_path, 'r') as f:
+        config = yaml.safe_load(f)['satellite']
+    # Set default port if not present
+    config.setdefault('wake_word_port', DEFAULT_WAKE_WORD_PORT)
+    return config
+
+def service_env(repo_path):
+    """Environment for a service run from a checkout"""
+    env = os.environ.copy()
+    env["PYTHONPATH"] = str(repo_path)  # Add the repository to PYTHONPATH
+    return env
+
+def wake_words(config):
+    """The configured wake words as [{'name': ..., 'threshold'?, 'trigger_level'?}, ...]
+
+    wake_word is one name, or a list of names and/or mappings with a name and
+    optional threshold/trigger_level.
+    """
+    value = config.get('wake_word') or []
+    if not isinstance(value, list):
+        value = [value]
+    return [dict(word) if isinstance(word, dict) else {'name': str(word)} for word in value]
+
+def wakeword_command(config):
+    """Return (args, env, cwd) for wyoming-openwakeword with every wake word preloaded"""
+    args = [
+        str(OPENWAKEWORD_VENV / "bin" / "python"),  # Python interpreter from your venv
+        str(WAKEWORD_LAUNCHER),
+        "--uri", f"tcp://0.0.0.0:{config.get('wake_word_port', DEFAULT_WAKE_WORD_PORT)}",
+    ]
+    # All words share one audio feature pipeline; only their classifiers run per word
+    for word in wake_words(config) or [{'name': 'hey_jarvis'}]:
+        args.extend(["--preload-model", word['name']])
+        if word.get('threshold') is not None:
+            args.extend(["--word-threshold", f"{word['name']}={word['threshold']}"])
+        if word.get('trigger_level') is not None:
+            args.extend(["--word-trigger-level", f"{word['name']}={word['trigger_level']}"])
+    env = service_env(OPENWAKEWORD_REPO)
+    # Tuned by benchmark.py threads; numpy's BLAS pool gets the same budget
+    threads = config.get('wake_threads')
+    if threads:
+        args.extend(["--threads", str(threads)])
+        for name in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+            env[name] = str(threads)
+    return args, env, OPENWAKEWORD_REPO
+
+def vad_gate_port(config):
+    """Port of the VAD gate in front of the wake word service, or None if disabled"""
+    vad = config.get('vad') or {}
+    if not (vad.get('enabled') and config.get('wake_word')):
+        return None
+    return vad.get('gate_port', DEFAULT_VAD_GATE_PORT)
+
+def wake_upstream_port(config):
+    """Port that receives the satellite's wake word audio after the tap (the gate if enabled)"""
+    return vad_gate_port(config) or config.get('wake_word_port', DEFAULT_WAKE_WORD_PORT)
+
+def wake_uri_port(config):
+    """Port the satellite dials for wake word detection (the tap proxy if enabled)"""
+    return config.get('wake_tap_port') or wake_upstream_port(config)
+
+def wake_ports(config):
+    """Every port on the satellite -> wake word path, service first"""
+    ports = [config.get('wake_word_port', DEFAULT_WAKE_WORD_PORT), vad_gate_port(config),
+             config.get('wake_tap_port')]
+    return [port for port in ports if port]
+
+def playback_sink_port(config):
+    """Port of the persistent playback sink, or None if the satellite runs the speaker command"""
+    sink = config.get('playback_sink') or {}
+    if not (sink.get('enabled') and config.get('speaker', {}).get('command')):
+        return None
+    return sink.get('port', DEFAULT_PLAYBACK_SINK_PORT)
+
+def satellite_command(config, mic_heartbeat=None):
+    """Return (args, env, cwd) for wyoming-satellite"""
+    # Get microphone and speaker commands from the configuration
+    mic = config.get('mic', {}).get('command', [])
+    if mic_heartbeat:
+        # Frames are stamped on their way through for the launcher's liveness checks
+        mic = [sys.executable, str(LIVENESS), 'relay', '--heartbeat', str(mic_heartbeat), '--'] + mic
+    mic_command = ' '.join(mic)
+    speaker_command = ' '.join(config.get('speaker', {}).get('command', []))
+
+    # Build the arguments for the satellite module
+    args = [
+        str(SATELLITE_VENV / "bin" / "python"),  # Python interpreter from the virtual environment
+        "-m", "wyoming_satellite",
+        "--name", config['name'],
+        "--uri", f"tcp://0.0.0.0:{config.get('port', DEFAULT_SATELLITE_PORT)}",
+        "--mic-command", mic_command,
+    ]
+
+    # The satellite prefers --snd-command, so it must be left out for the sink
+    sink_port = playback_sink_port(config)
+    if sink_port:
+        args.extend(["--snd-uri", f"tcp://127.0.0.1:{sink_port}"])
+    else:
+        args.extend(["--snd-command", speaker_command])
+
+    # VAD is applied by vad_gate.py in front of the wake word service;
+    # wyoming-satellite's own --vad only works without a wake word service
+
+    # Add wake word settings if configured
+    if config.get('wake_word'):
+        args.extend(["--wake-uri", f"tcp://0.0.0.0:{wake_uri_port(config)}"])
+        for word in wake_words(config):
+            args.extend(["--wake-word-name", word['name']])
+
+    # Mark voice sessions for thermal_governor.py; the satellite waits for these
+    # commands, so they must stay this cheap
+    if (config.get('governor') or {}).get('enabled'):
+        args.extend(["--detection-command", f"touch {VOICE_SESSION}",
+                     "--tts-stop-command", f"rm -f {VOICE_SESSION}",
+                     "--error-command", f"rm -f {VOICE_SESSION}"])
+    return args, service_env(SATELLITE_REPO), SATELLITE_REPO
+
+def port_open(port, host='127.0.0.1', timeout=0.5):
+    """True if something is accepting TCP connections on host:port"""
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+def wait_for_port(port, timeout, host='127.0.0.1', interval=0.1):
+    """Wait until host:port accepts connections; return seconds waited or None"""
+    start = time.monotonic()
+    while True:
+        if port_open(port, host):
+            return time.monotonic() - start
+        if time.monotonic() - start >= timeout:
+            return None
+        time.sleep(interval)
+
+def exec_service(args, env, cwd):
+    """Replace the current process with the service"""
+    os.chdir(cwd)
+    os.execve(args[0], args, env)
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""Transparent Wyoming protocol proxy that measures the events passing through.
+
+Sits on one link (satellite -> wake word service, or Home Assistant ->
+satellite) and forwards every byte unchanged. Each Wyoming event is a JSON
+header line, optionally followed by ``data_length`` bytes of JSON data and
+``payload_length`` bytes of payload; only the header is parsed, data and
+payload are relayed as-is.
+
+Per direction and event type it counts events and bytes and histograms the
+gaps between consecutive events. Request -> response latencies (e.g. the
+last audio-chunk before a detection) are histogrammed too. Histograms are
+kept per window and the last windows are written as one compact JSON file.
+
+The small event read/write helpers here are shared by the other tools that
+speak the protocol (benchmark.py, vad_gate.py).
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+from collections import deque
+from pathlib import Path
+
+import wyoming_commands
+
+logger = logging.getLogger('wyoming-tap')
+
+TAP_DIR = Path('/var/lib/wyoming/tap')
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is open-ended
+BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+# Response type -> the request type it answers, looked up in the other direction
+RESPONSES = {
+    'detection': 'audio-chunk',
+    'not-detected': 'audio-stop',
+    'voice-started': 'audio-chunk',
+    'voice-stopped': 'audio-chunk',
+    'transcript': 'audio-stop',
+    'info': 'describe',
+    'played': 'audio-stop',
+    'audio-start': 'synthesize',
+}
+
+def new_histogram():
+    return [0] * (len(BOUNDS_MS) + 1)
+
+def observe(histogram, seconds):
+    histogram[bisect.bisect_left(BOUNDS_MS, seconds * 1000)] += 1
+
+def percentile(histogram, q):
+    """Upper bound (ms) of the bucket holding the q-th percentile, None if empty"""
+    total = sum(histogram)
+    if not total:
+        return None
+    rank = q / 100 * total
+    seen = 0
+    for index, count in enumerate(histogram):
+        seen += count
+        if seen >= rank:
+            return BOUNDS_MS[index] if index < len(BOUNDS_MS) else float('inf')
+    return float('inf')
+
+class Stats:
+    """Rolling per-window counters for one proxy"""
+
+    def __init__(self, name, output, interval=60, windows=60):
+        self.name = name
+        self.output = Path(output)
+        self.interval = interval
+        self.history = deque(maxlen=windows)
+        self.last_event = {}
+        self.last_request = {}
+        self.reset()
+
+    def reset(self):
+        self.window_start = time.time()
+        self.events = {}
+        self.latency = {}
+
+    def record(self, direction, event_type, size, now):
+        key = f"{direction}:{event_type}"
+        entry = self.events.get(key)
+        if entry is None:
+            entry = self.events[key] = {'count': 0, 'bytes': 0, 'gap': new_histogram()}
+        entry['count'] += 1
+        entry['bytes'] += size
+        previous = self.last_event.get(key)
+        if previous is not None:
+            observe(entry['gap'], now - previous)
+        self.last_event[key] = now
+
+        request = RESPONSES.get(event_type)
+        if request is not None:
+            requested = self.last_request.pop((other(direction), request), None)
+            if requested is not None:
+                pair = f"{request}->{event_type}"
+                histogram = self.latency.get(pair)
+                if histogram is None:
+                    histogram = self.latency[pair] = new_histogram()
+                observe(histogram, now - requested)
+        if event_type in ('audio-chunk', 'audio-stop', 'describe', 'synthesize'):
+            self.last_request[(direction, event_type)] = now
+
+    def roll(self):
+        """Close the current window and rewrite the histogram file"""
+        self.history.append({
+            'start': round(self.window_start, 3),
+            'end': round(time.time(), 3),
+            'events': self.events,
+            'latency': self.latency,
+        })
+        self.reset()
+        self.output.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.output.with_name(self.output.name + '.tmp')
+        with open(temp_path, 'w') as f:
+            json.dump({'name': self.name, 'bounds_ms': BOUNDS_MS, 'windows': list(self.history)},
+                      f, separators=(',', ':'))
+        os.replace(temp_path, self.output)
+
+def other(direction):
+    return 'server' if direction == 'client' else 'client'
+
+async def read_frame(reader):
+    """Read one event without decoding its body: (header line, header, data + payload bytes)
+
+    Returns None at EOF. Callers that only route events can forward the
+    header line and body unchanged.
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    header = json.loads(line)
+    length = (header.get('data_length') or 0) + (header.get('payload_length') or 0)
+    body = await reader.readexactly(length) if length else b''
+    return line, header, body
+
+async def read_event(reader):
+    """Read one Wyoming event, returning (type, data, payload) or None at EOF"""
+    line = await reader.readline()
+    if not line:
+        return None
+    header = json.loads(line)
+    data = header.get('data') or {}
+    if header.get('data_length'):
+        data.update(json.loads(await reader.readexactly(header['data_length'])))
+    payload = b''
+    if header.get('payload_length'):
+        payload = await reader.readexactly(header['payload_length'])
+    return header['type'], data, payload
+
+def write_event(writer, event_type, data=None, payload=b''):
+    header = {'type': event_type, 'version': '1.0.0'}
+    body = b''
+    if data:
+        body = json.dumps(data).encode()
+        header['data_length'] = len(body)
+    if payload:
+        header['payload_length'] = len(payload)
+    writer.write(json.dumps(header).encode() + b'\n' + body + payload)
+
+async def relay(reader, writer, direction, stats):
+    """Forward events from reader to writer, recording each one"""
+    try:
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            now = time.monotonic()
+            size = len(header)
+            event_type = 'unparsed'
+            extra = 0
+            try:
+                event = json.loads(header)
+                event_type = event.get('type', 'unknown')
+                extra = (event.get('data_length') or 0) + (event.get('payload_length') or 0)
+            except ValueError:
+                pass
+            writer.write(header)
+            if extra:
+                body = await reader.readexactly(extra)
+                writer.write(body)
+                size += extra
+            stats.record(direction, event_type, size, now)
+            # Returns immediately unless the peer is behind
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+def set_nodelay(writer):
+    sock = writer.get_extra_info('socket')
+    if sock is not None:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+async def proxy(listen_host, listen_port, upstream_host, upstream_port, stats):
+    async def handle(client_reader, client_writer):
+        try:
+            server_reader, server_writer = await asyncio.open_connection(upstream_host, upstream_port)
+        except OSError as e:
+            logger.error(f"Cannot reach upstream {upstream_host}:{upstream_port}: {e}")
+            client_writer.close()
+            return
+        # Small audio events must not sit in Nagle's buffer
+        set_nodelay(client_writer)
+        set_nodelay(server_writer)
+        peer = client_writer.get_extra_info('peername')
+        logger.info(f"Relaying {peer} -> {upstream_host}:{upstream_port}")
+        await asyncio.gather(relay(client_reader, server_writer, 'client', stats),
+                             relay(server_reader, client_writer, 'server', stats))
+
+    server = await asyncio.start_server(handle, listen_host, listen_port)
+    logger.info(f"Tap '{stats.name}' listening on {listen_host}:{listen_port}, "
+                f"upstream {upstream_host}:{upstream_port}, writing {stats.output}")
+    # Let systemd's SIGTERM unwind through the final roll()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, asyncio.current_task().cancel)
+    async with server:
+        try:
+            while True:
+                await asyncio.sleep(stats.interval)
+                stats.roll()
+        finally:
+            stats.roll()
+
+def summarize(data):
+    """Totals and p50/p95 per event type and latency pair over all windows"""
+    events, latency = {}, {}
+    for window in data['windows']:
+        for key, entry in window['events'].items():
+            total = events.setdefault(key, {'count': 0, 'bytes': 0, 'gap': new_histogram()})
+            total['count'] += entry['count']
+            total['bytes'] += entry['bytes']
+            total['gap'] = [a + b for a, b in zip(total['gap'], entry['gap'])]
+        for pair, histogram in window['latency'].items():
+            total = latency.setdefault(pair, new_histogram())
+            latency[pair] = [a + b for a, b in zip(total, histogram)]
+    span = (data['windows'][-1]['end'] - data['windows'][0]['start']) if data['windows'] else 0
+    return {
+        'name': data['name'],
+        'seconds': round(span, 1),
+        'events': {key: {'count': e['count'], 'bytes': e['bytes'],
+                         'gap_p50_ms': percentile(e['gap'], 50), 'gap_p95_ms': percentile(e['gap'], 95)}
+                   for key, e in sorted(events.items())},
+        'latency': {pair: {'count': sum(h), 'p50_ms': percentile(h, 50), 'p95_ms': percentile(h, 95)}
+                    for pair, h in sorted(latency.items())},
+    }
+
+def parse_address(value):
+    host, _, port = value.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+def wake_link(config):
+    """Listen/upstream addresses for the satellite -> wake word link from satellite.yaml
+
+    The upstream is the VAD gate when it is enabled, so the tap sees what the
+    satellite sends.
+    """
+    if not config.get('wake_tap_port'):
+        return None
+    upstream = wyoming_commands.wake_upstream_port(config)
+    return ('127.0.0.1', int(config['wake_tap_port'])), ('127.0.0.1', int(upstream))
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure Wyoming events on one link")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    run = subparsers.add_parser('proxy', help="Run the tap proxy")
+    run.add_argument('--name', required=True, help="Link name, e.g. wake or ha")
+    run.add_argument('--listen', help="[host:]port to accept connections on")
+    run.add_argument('--upstream', help="[host:]port of the real service")
+    run.add_argument('--wake-link', action='store_true',
+                     help="Take both addresses from wake_tap_port/wake_word_port in satellite.yaml")
+    run.add_argument('--interval', type=float, default=60, help="Seconds per histogram window")
+    run.add_argument('--windows', type=int, default=60, help="Windows kept in the file")
+    run.add_argument('--output', type=Path, help="Histogram file (default: TAP_DIR/<name>.json)")
+    show = subparsers.add_parser('show', help="Summarize a histogram file")
+    show.add_argument('file', type=Path)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.command == 'show':
+        with open(args.file) as f:
+            print(json.dumps(summarize(json.load(f)), indent=2))
+        return
+
+    stats = Stats(args.name, args.output or TAP_DIR / f"{args.name}.json", args.interval, args.windows)
+    if args.wake_link:
+        link = wake_link(wyoming_commands.load_config())
+        if link is None:
+            # The satellite dials the wake word service (or VAD gate) directly
+            logger.info("wake_tap_port is not set in satellite.yaml; not tapping")
+            sys.exit(0)
+        (listen_host, listen_port), (upstream_host, upstream_port) = link
+    elif args.listen and args.upstream:
+        listen_host, listen_port = parse_address(args.listen)
+        upstream_host, upstream_port = parse_address(args.upstream)
+    else:
+        parser.error("--listen and --upstream are required without --wake-link")
+    try:
+        asyncio.run(proxy(listen_host, listen_port, upstream_host, upstream_port, stats))
+    except (KeyboardInterrupt, asyncio.CancelledError):
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import json
+import shutil
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+
+# The scripts are installed as a flat directory, not a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'scripts'))
+
+import thermal_governor  # noqa: E402
+
+def usb_stream(name, capture=None, playback=None):
+    """A USB card's stream0 file; capture/playback are (formats, channels, rates)"""
+    text = f"{name} at usb-3f980000.usb-1.3, full speed : USB Audio\n"
+    for direction, altset in (('Playback', playback), ('Capture', capture)):
+        if altset is None:
+            continue
+        formats, channels, rates = altset
+        text += textwrap.dedent(f"""
+            {direction}:
+              Status: Stop
+              Interface 1
+                Altset 1
+                Format: {formats}
+                Channels: {channels}
+                Endpoint: 0x81 (1 IN) (ASYNC)
+                Rates: {rates}
+                Bits: 16
+            """)
+    return text
+
+# Cards as /proc/asound shows them: id, driver, name, longname, PCM dirs, stream0
+HEADPHONES = ('Headphones', 'bcm2835_headpho', 'bcm2835 Headphones', 'bcm2835 Headphones', ['pcm0p'], None)
+HDMI = ('vc4hdmi', 'vc4-hdmi', 'vc4-hdmi', 'vc4-hdmi', ['pcm0p'], None)
+USB_MIC = ('Device', 'USB-Audio', 'USB PnP Sound Device', 'C-Media USB PnP Sound Device', ['pcm0c'],
+           usb_stream('C-Media USB PnP Sound Device', capture=('S16_LE', 1, '48000')))
+USB_MIC_16K = ('Array', 'USB-Audio', 'ReSpeaker Mic Array', 'SEEED ReSpeaker Mic Array', ['pcm0c'],
+               usb_stream('SEEED ReSpeaker Mic Array', capture=('S16_LE', 1, '16000')))
+USB_SPEAKER = ('UACDemoV10', 'USB-Audio', 'UACDemoV1.0', 'Jieli Technology UACDemoV1.0', ['pcm0p'],
+               usb_stream('Jieli Technology UACDemoV1.0', playback=('S16_LE', 2, '48000')))
+MTRACK = ('MTrack', 'USB-Audio', 'M-Track', 'M-Audio M-Track', ['pcm0c', 'pcm0p'],
+          usb_stream('M-Audio M-Track', capture=('S16_LE S24_3LE', 2, '16000, 44100, 48000'),
+                     playback=('S16_LE S24_3LE', 2, '16000, 44100, 48000')))
+
+class FakeAsound:
+    """A /proc/asound tree that cards can be plugged into and removed from"""
+
+    def __init__(self, root):
+        self.root = root
+        self.cards = {}
+        root.mkdir(parents=True, exist_ok=True)
+        self.write_cards()
+
+    def write_cards(self):
+        (self.root / 'cards').write_text(''.join(
+            f"{number:2d} [{card_id:<15}]: {driver} - {name}\n{'':22}{longname}\n"
+            for number, (card_id, driver, name, longname, _, _) in sorted(self.cards.items())))
+
+    def plug(self, card, number=None):
+        number = len(self.cards) if number is None else number
+        card_id, _, _, _, pcms, stream = card
+        card_dir = self.root / f"card{number}"
+        for pcm in pcms:
+            (card_dir / pcm).mkdir(parents=True)
+            (card_dir / pcm / 'info').write_text(
+                f"card: {number}\ndevice: {pcm[3]}\nsubdevice: 0\n"
+                f"stream: {'CAPTURE' if pcm.endswith('c') else 'PLAYBACK'}\n"
+                f"id: {'USB Audio' if stream else card_id}\nname: {'USB Audio' if stream else card_id}\n")
+        if stream:
+            (card_dir / 'stream0').write_text(stream)
+        self.cards[number] = card
+        self.write_cards()
+        return number
+
+    def unplug(self, number):
+        del self.cards[number]
+        shutil.rmtree(self.root / f"card{number}")
+        self.write_cards()
+
+@pytest.fixture
+def asound(tmp_path):
+    return FakeAsound(tmp_path / 'asound')
+
+# CPUs (one cpufreq policy each) in the sysfs fixture
+SYSFS_CPUS = 4
+
+@pytest.fixture
+def sysfs(tmp_path):
+    """A sysfs tree with one thermal zone at 45 C, one schedutil policy per CPU and Pi firmware flags"""
+    root = tmp_path / 'sysfs'
+    zone = root / thermal_governor.THERMAL_DIR / 'thermal_zone0'
+    zone.mkdir(parents=True)
+    (zone / 'type').write_text('cpu-thermal\n')
+    (zone / 'temp').write_text('45000\n')
+    for cpu in range(SYSFS_CPUS):
+        policy = root / thermal_governor.CPUFREQ_DIR / f"policy{cpu}"
+        policy.mkdir(parents=True)
+        for name, value in (('scaling_available_governors', 'conservative ondemand userspace powersave performance schedutil'),
+                            ('scaling_governor', 'schedutil'), ('scaling_cur_freq', '600000'),
+                            ('scaling_max_freq', '1800000'), ('cpuinfo_max_freq', '1800000')):
+            (policy / name).write_text(f"{value}\n")
+    firmware = root / thermal_governor.FIRMWARE_THROTTLED
+    firmware.parent.mkdir(parents=True, exist_ok=True)
+    firmware.write_text('0x0\n')
+    return root
+
+@pytest.fixture
+def proc_tree(tmp_path):
+    """/proc and cgroup trees with a satellite unit running python and arecord, and setup timings"""
+    root = tmp_path
+    proc, cgroup = root / 'proc', root / 'sys/fs/cgroup'
+    proc.mkdir(parents=True, exist_ok=True)
+    (proc / 'stat').write_text("cpu  1 0 1 100 0 0 0 0 0 0\nbtime 1700000000\n")
+    processes = {101: ('python3', 520, 130, 40 * 1024, 12), 102: ('arecord', 75, 25, 3 * 1024, 5)}
+    for pid, (comm, utime, stime, rss_kb, fds) in processes.items():
+        base = proc / str(pid)
+        (base / 'fd').mkdir(parents=True, exist_ok=True)
+        for fd in range(fds):
+            (base / 'fd' / str(fd)).touch()
+        fields = ['S'] + ['0'] * 10 + [str(utime), str(stime)] + ['0'] * 6 + ['5000'] + ['0'] * 20
+        (base / 'stat').write_text(f"{pid} ({comm}) {' '.join(fields)}\n")
+        (base / 'status').write_text(f"Name:\t{comm}\nVmRSS:\t{rss_kb} kB\n"
+                                     f"voluntary_ctxt_switches:\t900\nnonvoluntary_ctxt_switches:\t12\n")
+        (base / 'smaps_rollup').write_text(f"Rss: {rss_kb} kB\nPss: {rss_kb * 3 // 4} kB\n")
+    unit = cgroup / 'system.slice' / 'wyoming-satellite.service'
+    unit.mkdir(parents=True, exist_ok=True)
+    (unit / 'cgroup.procs').write_text(''.join(f"{pid}\n" for pid in processes))
+    (unit / 'cpu.stat').write_text("usage_usec 7000000\nuser_usec 5200000\nsystem_usec 1800000\n")
+    (unit / 'memory.current').write_text(f"{48 * 1024 * 1024}\n")
+    (unit / 'memory.peak').write_text(f"{52 * 1024 * 1024}\n")
+    (root / 'setup-timings.json').write_text(json.dumps({'finished': 1700000500, 'steps': [
+        {'name': 'packages', 'status': 'skipped', 'seconds': 0.0},
+        {'name': 'config', 'status': 'ran', 'seconds': 1.25}]}))
+    return root
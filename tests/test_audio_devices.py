@@ -0,0 +1,141 @@
+import json
+import os
+import time
+
+import audio_devices
+from conftest import HEADPHONES, MTRACK, USB_MIC
+
+def test_enumerates_usb_and_onboard_cards(asound):
+    asound.plug(HEADPHONES)
+    asound.plug(MTRACK)
+    devices = {(device['hw'], device['direction']): device
+               for device in audio_devices.enumerate_devices(asound.root)}
+    assert sorted(devices) == [('hw:0,0', 'playback'), ('hw:1,0', 'capture'), ('hw:1,0', 'playback')]
+
+    headphones = devices['hw:0,0', 'playback']
+    assert headphones['card_id'] == 'Headphones'
+    assert headphones['driver'] == 'bcm2835_headpho'
+    assert not headphones['usb']
+    assert headphones['capabilities'] == []
+
+    capture = devices['hw:1,0', 'capture']
+    assert capture['usb']
+    assert capture['card_name'] == 'M-Track'
+    assert audio_devices.describe(capture) == 'MTrack [M-Track]: USB Audio [USB Audio]'
+    assert capture['capabilities'] == [{'formats': ['S16_LE', 'S24_3LE'], 'channels': 2,
+                                        'rates': [16000, 44100, 48000], 'rate_range': None, 'bits': 16}]
+
+def test_card_without_capture_pcm(asound):
+    asound.plug(HEADPHONES)
+    devices = audio_devices.enumerate_devices(asound.root)
+    mics, speakers = audio_devices.device_maps(devices)
+    assert mics == {}
+    assert list(speakers) == ['hw:0,0']
+    assert audio_devices.choose_device(devices, 'capture', audio_devices.MIC_TARGET, probe=False) is None
+
+def test_empty_or_missing_tree(tmp_path, asound):
+    assert audio_devices.enumerate_devices(asound.root) == []
+    assert audio_devices.enumerate_devices(tmp_path / 'missing') == []
+
+def test_choose_device_prefers_native_usb(asound):
+    asound.plug(HEADPHONES)
+    asound.plug(USB_MIC)
+    asound.plug(MTRACK)
+    devices = audio_devices.enumerate_devices(asound.root)
+    mic = audio_devices.choose_device(devices, 'capture', audio_devices.MIC_TARGET, probe=False)
+    assert mic['hw'] == 'hw:2,0'
+    # Native 16 kHz, but two channels only, so the plug layer remaps to mono
+    assert mic['device'] == 'plughw:CARD=MTrack,DEV=0'
+    assert not mic['resample']
+
+    speaker = audio_devices.choose_device(devices, 'playback', audio_devices.SPEAKER_TARGET, probe=False)
+    assert speaker['hw'] == 'hw:2,0'
+    assert speaker['resample']
+
+ONBOARD_MIC = ('sndrpii2scard', 'snd_rpi_i2s_car', 'snd_rpi_i2s_card', 'snd_rpi_i2s_card', ['pcm0c'], None)
+
+def dump(rate, channels, formats='S16_LE S32_LE', period='[8 32768]'):
+    """--dump-hw-params output as arecord prints it on stderr"""
+    return (f'HW Params of device "hw:0,0":\n{audio_devices.DUMP_SEPARATOR}\n'
+            f"ACCESS:  MMAP_INTERLEAVED RW_INTERLEAVED\nFORMAT:  {formats}\nSUBFORMAT:  STD\n"
+            f"SAMPLE_BITS: [16 32]\nFRAME_BITS: [16 64]\nCHANNELS: {channels}\nRATE: {rate}\n"
+            f"PERIOD_TIME: (166 4096000]\nPERIOD_SIZE: {period}\nPERIOD_BYTES: [64 131072]\n"
+            f"PERIODS: [2 2048]\nBUFFER_SIZE: [16 65536]\nTICK_TIME: ALL\n{audio_devices.DUMP_SEPARATOR}\n")
+
+def onboard_mic(asound):
+    asound.plug(ONBOARD_MIC)
+    return audio_devices.enumerate_devices(asound.root)[0]
+
+def test_plan_device_opens_native_hw_directly(asound):
+    device = onboard_mic(asound)
+    hw_params = audio_devices.parse_hw_params(dump('[8000 48000]', '[1 2]'))
+    assert hw_params == {'formats': ['S16_LE', 'S32_LE'], 'channels': (1, 2), 'rate': (8000, 48000),
+                         'period_size': (8, 32768)}
+    plan = audio_devices.plan_device(device, audio_devices.MIC_TARGET,
+                                     audio_devices.capabilities(device, hw_params))
+    assert plan['device'] == 'hw:CARD=sndrpii2scard,DEV=0'
+    assert not plan['resample']
+    assert plan['score'] == 100 + 20 + 10 + 1
+    assert plan['rationale'].startswith('opened directly')
+
+def test_plan_device_falls_back_to_plug(asound):
+    device = onboard_mic(asound)
+    hw_params = audio_devices.parse_hw_params(dump('48000', '2', formats='S32_LE', period='[512 8192]'))
+    plan = audio_devices.plan_device(device, audio_devices.MIC_TARGET,
+                                     audio_devices.capabilities(device, hw_params))
+    assert plan['device'] == 'plughw:CARD=sndrpii2scard,DEV=0'
+    assert plan['resample']
+    # Only integer decimation from 48 kHz counts
+    assert plan['score'] == 5
+    assert plan['rationale'] == ('via plug layer, resamples from [48000] Hz, converts to S16_LE, '
+                                 'remaps to 1 channel(s)')
+
+def fake_tool(tmp_path, monkeypatch, script):
+    """arecord/aplay on PATH replaced by a shell script"""
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    for tool in ('arecord', 'aplay'):
+        (bin_dir / tool).write_text(f"#!/bin/sh\n{script}\n")
+        (bin_dir / tool).chmod(0o755)
+    monkeypatch.setenv('PATH', f"{bin_dir}:{os.environ['PATH']}")
+
+def test_probe_stops_after_the_dump(asound, tmp_path, monkeypatch):
+    (tmp_path / 'dump.txt').write_text(dump('[8000 48000]', '[1 2]'))
+    # Like arecord, keeps running (recording) after printing the dump
+    fake_tool(tmp_path, monkeypatch, f"cat {tmp_path / 'dump.txt'} >&2; exec sleep 30")
+    start = time.monotonic()
+    assert audio_devices.probe_hw_params(onboard_mic(asound))['rate'] == (8000, 48000)
+    assert time.monotonic() - start < 5
+
+def test_probe_reports_busy(asound, tmp_path, monkeypatch):
+    fake_tool(tmp_path, monkeypatch, 'echo "arecord: main:834: audio open error: Device or resource busy" >&2; exit 1')
+    assert audio_devices.probe_hw_params(onboard_mic(asound)) is None
+
+def test_busy_device_reuses_last_probe(asound, tmp_path, monkeypatch):
+    asound.plug(ONBOARD_MIC)
+    asound.plug(USB_MIC)
+    devices = audio_devices.enumerate_devices(asound.root)
+    cache = tmp_path / 'hw-params.json'
+    native = audio_devices.parse_hw_params(dump('[8000 48000]', '[1 2]'))
+
+    monkeypatch.setattr(audio_devices, 'probe_hw_params', lambda device, **kwargs: native)
+    first = audio_devices.choose_device(devices, 'capture', audio_devices.MIC_TARGET, probe_cache=cache)
+    assert first['hw'] == 'hw:0,0'
+    assert 'sndrpii2scard,0,capture' in json.loads(cache.read_text())
+
+    # Held open by the satellite now: still chosen on its cached parameters
+    monkeypatch.setattr(audio_devices, 'probe_hw_params',
+                        lambda device, **kwargs: None if device['card'] == 0 else {})
+    again = audio_devices.choose_device(devices, 'capture', audio_devices.MIC_TARGET, probe_cache=cache)
+    assert again == first
+
+def test_busy_device_without_probe_is_kept(asound, tmp_path, monkeypatch):
+    asound.plug(ONBOARD_MIC)
+    asound.plug(USB_MIC)
+    devices = audio_devices.enumerate_devices(asound.root)
+    monkeypatch.setattr(audio_devices, 'probe_hw_params',
+                        lambda device, **kwargs: None if device['card'] == 0 else {})
+    plan = audio_devices.choose_device(devices, 'capture', audio_devices.MIC_TARGET,
+                                       probe_cache=tmp_path / 'hw-params.json')
+    # The USB mic would score higher on paper
+    assert plan['hw'] == 'hw:0,0'
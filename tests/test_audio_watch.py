@@ -0,0 +1,90 @@
+import pytest
+import yaml
+
+import audio_watch
+import setup
+from conftest import HDMI, HEADPHONES, MTRACK, USB_MIC, USB_MIC_16K, USB_SPEAKER
+
+@pytest.fixture
+def restarts(monkeypatch):
+    """systemctl restarts requested through setup.run_command; other commands still run"""
+    calls = []
+    run_command = setup.run_command
+
+    def fake_run_command(command, shell=False):
+        if not shell and command[:2] == ['systemctl', 'restart']:
+            calls.append(command[2])
+            return True, ''
+        return run_command(command, shell)
+
+    monkeypatch.setattr(setup, 'run_command', fake_run_command)
+    # No arecord/aplay here; selection runs on the procfs capabilities alone
+    monkeypatch.setattr(setup.audio_devices, 'probe_hw_params', lambda device, **kwargs: {})
+    return calls
+
+@pytest.fixture
+def satellite(asound, tmp_path):
+    """Headphones and a 48 kHz USB mic, with satellite.yaml written for them"""
+    asound.plug(HEADPHONES)
+    asound.plug(USB_MIC)
+    path = tmp_path / 'satellite.yaml'
+
+    def configure(ring=False, sink=False):
+        mic, speaker = setup.detect_devices(asound.root)
+        path.write_text(yaml.safe_dump({'satellite': {
+            'mic': setup.mic_section(mic, ring), 'speaker': setup.speaker_section(speaker),
+            'playback_sink': {'enabled': sink}}}))
+        return (mic, speaker), path
+
+    return configure
+
+def mic_device(path):
+    mic = yaml.safe_load(path.read_text())['satellite']['mic']
+    return (mic.get('capture_command') or mic['command'])[2]
+
+def rescan(asound, current, path):
+    return audio_watch.rescan(current, asound_root=asound.root, config_path=path)
+
+def test_unchanged_selection_restarts_nothing(asound, satellite, restarts):
+    current, path = satellite()
+    before = path.read_text()
+    asound.plug(HDMI)
+    assert rescan(asound, current, path) is current
+    assert restarts == []
+    assert path.read_text() == before
+
+def test_new_mic_restarts_satellite(asound, satellite, restarts):
+    current, path = satellite()
+    asound.plug(USB_MIC_16K)
+    selection = rescan(asound, current, path)
+    assert audio_watch.selected_hardware(selection) == ('hw:2,0', 'hw:0,0')
+    assert restarts == ['wyoming-satellite']
+    assert mic_device(path) == 'hw:CARD=Array,DEV=0'
+
+def test_new_mic_with_ring_restarts_only_mic(asound, satellite, restarts):
+    current, path = satellite(ring=True)
+    asound.plug(USB_MIC_16K)
+    rescan(asound, current, path)
+    assert restarts == ['wyoming-mic']
+    assert mic_device(path) == 'hw:CARD=Array,DEV=0'
+
+def test_new_speaker_with_sink_restarts_only_sink(asound, satellite, restarts):
+    current, path = satellite(sink=True)
+    asound.plug(USB_SPEAKER)
+    selection = rescan(asound, current, path)
+    assert audio_watch.selected_hardware(selection) == ('hw:1,0', 'hw:2,0')
+    assert restarts == ['wyoming-snd']
+
+def test_mic_and_speaker_with_ring_and_sink(asound, satellite, restarts):
+    current, path = satellite(ring=True, sink=True)
+    asound.plug(MTRACK)
+    rescan(asound, current, path)
+    assert restarts == ['wyoming-mic', 'wyoming-snd']
+
+def test_mic_removed_keeps_configuration(asound, satellite, restarts):
+    current, path = satellite()
+    before = path.read_text()
+    asound.unplug(1)
+    assert rescan(asound, current, path) is current
+    assert restarts == []
+    assert path.read_text() == before
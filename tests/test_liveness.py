@@ -0,0 +1,177 @@
+import asyncio
+import socket
+
+import pytest
+
+import liveness
+from liveness import Check, Monitor
+
+SETTINGS = dict(liveness.DEFAULTS, stall_seconds=10, recover_seconds=15, interval=0.001)
+
+class Clock:
+    """Stands in for the time module in liveness"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch, tmp_path):
+    clock = Clock()
+    monkeypatch.setattr(liveness, 'time', clock)
+    monkeypatch.setattr(liveness, 'METRICS_DIR', tmp_path)
+    return clock
+
+class Source:
+    """A check's last sign of life: now while flowing, frozen once it stalls"""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.flowing = True
+        self.last = clock.now
+
+    async def __call__(self):
+        if self.flowing:
+            self.last = self.clock.now
+        return self.last
+
+class Service:
+    started = 0.0
+
+def recorder(actions, name):
+    async def action():
+        actions.append(name)
+    return action
+
+@pytest.fixture
+def checks(clock):
+    """A mic check (respawn capture, then restart the satellite) and a healthy link check"""
+    actions = []
+    mic, link = Source(clock), Source(clock)
+    checks = [Check('mic', mic, [('restart the mic capture', recorder(actions, 'respawn-capture')),
+                                 ('restart the satellite', recorder(actions, 'restart-satellite'))]),
+              Check('wake-link', link, [('restart the satellite', recorder(actions, 'restart-satellite'))])]
+    return checks, mic, actions
+
+async def poll_all(monitor, checks):
+    return [await monitor.poll(check, Service()) for check in checks]
+
+def test_stall_runs_only_the_targeted_recovery(clock, checks):
+    checks, mic, actions = checks
+    monitor = Monitor('test', SETTINGS)
+    asyncio.run(poll_all(monitor, checks))
+
+    mic.flowing = False
+    clock.advance(9)
+    asyncio.run(poll_all(monitor, checks))
+    assert actions == []
+
+    clock.advance(1)
+    asyncio.run(poll_all(monitor, checks))
+    assert actions == ['respawn-capture']
+    assert checks[0].detected == clock.now
+    assert checks[1].detected is None
+
+    # Back within recover_seconds: no escalation, and the recovery is timed
+    clock.advance(3)
+    mic.flowing = True
+    asyncio.run(poll_all(monitor, checks))
+    assert checks[0].detected is None
+    clock.advance(30)
+    asyncio.run(poll_all(monitor, checks))
+    assert actions == ['respawn-capture']
+    summary = monitor.metrics.summary()['checks']
+    assert summary['mic']['stalls'] == summary['mic']['recovered'] == 1
+    assert summary['mic']['mttd_seconds'] == 10
+    assert summary['mic']['mttr_seconds'] == 3
+    assert 'wake-link' not in summary
+
+def test_unrecovered_stall_climbs_the_ladder(clock, checks):
+    checks, mic, actions = checks
+    monitor = Monitor('test', SETTINGS)
+    mic.flowing = False
+    clock.advance(10)
+    assert asyncio.run(poll_all(monitor, checks)) == [True, True]
+    assert actions == ['respawn-capture']
+    clock.advance(15)
+    assert asyncio.run(poll_all(monitor, checks)) == [True, True]
+    assert actions == ['respawn-capture', 'restart-satellite']
+    clock.advance(15)
+    # Past the last step the launcher gives up so systemd restarts the unit
+    assert asyncio.run(poll_all(monitor, checks)) == [False, True]
+
+def test_service_start_resets_the_stall_timer(clock, checks):
+    checks, mic, actions = checks
+    monitor = Monitor('test', SETTINGS)
+    mic.flowing = False
+    clock.advance(10)
+    service = Service()
+    service.started = clock.now
+    asyncio.run(monitor.poll(checks[0], service))
+    assert actions == []
+
+@pytest.fixture
+def notify_socket(tmp_path, monkeypatch):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(str(tmp_path / 'notify'))
+    sock.setblocking(False)
+    monkeypatch.setenv('NOTIFY_SOCKET', str(tmp_path / 'notify'))
+    yield sock
+    sock.close()
+
+def received(sock):
+    messages = []
+    while True:
+        try:
+            messages.append(sock.recv(256).decode())
+        except BlockingIOError:
+            return messages
+
+class RunningService(Service):
+    process = None
+
+    def exited(self):
+        return False
+
+def run_monitor(clock, checks, rounds, notify_socket):
+    """Monitor.run with the clock advancing a second per round; (exit code, sd_notify messages)"""
+    messages = []
+
+    async def main():
+        stopping = asyncio.Event()
+        monitor = Monitor('test', SETTINGS)
+        count = 0
+
+        async def tick():
+            nonlocal count
+            # Drained each round like systemd would, so sd_notify never blocks
+            messages.extend(received(notify_socket))
+            clock.advance(1)
+            count += 1
+            if count >= rounds:
+                stopping.set()
+            return clock.now
+
+        checks.append(Check('tick', tick, []))
+        return await monitor.run(RunningService(), checks, stopping)
+    code = asyncio.run(main())
+    return code, messages + received(notify_socket)
+
+def test_healthy_traffic_feeds_the_watchdog(clock, checks, notify_socket):
+    checks, _, actions = checks
+    assert run_monitor(clock, checks, 20, notify_socket) == (0, ['WATCHDOG=1'] * 20)
+    assert actions == []
+
+def test_watchdog_fed_until_the_ladder_runs_out(clock, checks, notify_socket):
+    checks, mic, actions = checks
+    mic.flowing = False
+    code, messages = run_monitor(clock, checks, 1000, notify_socket)
+    assert code == 1
+    assert actions == ['respawn-capture', 'restart-satellite']
+    # Fed every second until the exit, 10 + 15 + 15 s after the last frame
+    assert messages == ['WATCHDOG=1'] * 40
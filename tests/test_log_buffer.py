@@ -0,0 +1,117 @@
+import io
+import json
+import logging
+
+import pytest
+
+import log_buffer
+from log_buffer import LowWriteLogging, RateLimit, RotatingFile, WriteStats, clip
+
+class Clock:
+    """Stands in for the time module in log_buffer"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(log_buffer, 'time', clock)
+    return clock
+
+def record(message, *args, level=logging.INFO, name='wyoming-test'):
+    return logging.LogRecord(name, level, __file__, 0, message, args, None)
+
+def test_burst_then_window(clock):
+    limit = RateLimit(burst=3, window=60, stats=WriteStats())
+    # Numbers are masked, so these are all the same message
+    assert [limit.allow(record("Retry %d failed", n)) for n in range(5)] == [True] * 3 + [False] * 2
+    assert limit.allow(record("Something else"))
+    assert limit.stats.totals['suppressed'] == 2
+
+    clock.now += 59
+    assert not limit.allow(record("Retry 9 failed"))
+    clock.now += 1
+    annotated = record("Retry %d failed", 10)
+    assert limit.allow(annotated)
+    assert annotated.getMessage() == "Retry 10 failed (3 similar suppressed)"
+    assert limit.take_suppressed() == []
+
+def test_levels_and_loggers_are_separate(clock):
+    limit = RateLimit(burst=1, window=60, stats=WriteStats())
+    assert limit.allow(record("Stall"))
+    assert limit.allow(record("Stall", level=logging.WARNING))
+    assert limit.allow(record("Stall", name='wyoming-other'))
+    assert not limit.allow(record("Stall"))
+
+def test_take_suppressed_reports_once(clock):
+    limit = RateLimit(burst=1, window=60, stats=WriteStats())
+    for n in range(4):
+        limit.allow(record("Chunk %d dropped", n, level=logging.WARNING))
+    assert limit.take_suppressed() == [('wyoming-test', logging.WARNING, "Chunk # dropped", 3)]
+    assert limit.take_suppressed() == []
+    # Already reported, so the next allowed one carries no count
+    clock.now += 60
+    allowed = record("Chunk 9 dropped", level=logging.WARNING)
+    assert limit.allow(allowed)
+    assert allowed.getMessage() == "Chunk 9 dropped"
+
+def test_clip_keeps_head_and_tail():
+    text = 'pip install output ' * 300 + 'ERROR: No matching distribution found for tflite'
+    clipped, removed = clip(text, 2000)
+    assert removed == len(text) - 2000
+    assert clipped.startswith(text[:500])
+    assert clipped.endswith(text[-1500:])
+    assert f"[... {removed} bytes clipped ...]" in clipped
+    assert clip('short', 2000) == ('short', 0)
+
+def test_rotating_file(tmp_path):
+    path = tmp_path / 'logs' / 'setup.log'
+    rotating = RotatingFile(path, max_bytes=100)
+    rotating.append(b'a' * 60)
+    assert path.read_bytes() == b'a' * 60
+    rotating.append(b'b' * 60)
+    # The append that crosses max_bytes is kept whole in the rotated file
+    assert not path.exists()
+    assert (tmp_path / 'logs' / 'setup.log.1').read_bytes() == b'a' * 60 + b'b' * 60
+    rotating.append(b'c' * 10)
+    assert path.read_bytes() == b'c' * 10
+
+@pytest.fixture
+def low_write(tmp_path, monkeypatch, clock):
+    monkeypatch.setattr(log_buffer, 'RAM_DIR', tmp_path / 'ram')
+    settings = dict(log_buffer.DEFAULTS, mode='low-write', burst=2, max_message_bytes=200)
+    return LowWriteLogging('test', settings, persistent=tmp_path / 'setup.log', stream=io.StringIO())
+
+def test_write_accounting_and_pending_suppressions(low_write, tmp_path):
+    for n in range(5):
+        low_write.handle(record("Probe %d timed out", n, level=logging.WARNING))
+    low_write.handle(record("x" * 1000))
+    assert low_write.stats.totals['suppressed'] == 3
+    assert low_write.stats.totals['clipped_bytes'] == 800
+    # Nothing on disk until a flush
+    assert not (tmp_path / 'setup.log').exists()
+
+    low_write.report()
+    ram = (tmp_path / 'ram' / 'test.log').read_text()
+    disk = (tmp_path / 'setup.log').read_text()
+    assert ram == disk
+    assert ram.count("timed out") == 3
+    assert "wyoming-test - WARNING - 3 similar suppressed: Probe # timed out" in ram
+    assert "[... 800 bytes clipped ...]" in ram
+
+    totals = low_write.stats.totals
+    assert totals['disk_bytes'] == len(disk.encode())
+    assert totals['ram_bytes'] == len(ram.encode())
+    assert totals['disk_writes'] == 2
+    # journald: the warnings and the report, not the INFO line
+    journal = low_write.stream.getvalue()
+    assert journal.count("WARNING") == 3
+    assert "Log writes:" in journal
+    assert totals['journal_bytes'] == len(journal.encode())
+    stats = json.loads((tmp_path / 'ram' / 'test.stats.json').read_text())
+    assert stats['offered_bytes'] == totals['offered_bytes']
+    assert stats['offered_bytes'] > 5 * len("Probe 0 timed out") + 1000
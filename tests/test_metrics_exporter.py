@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+import metrics_exporter
+from metrics_exporter import Sampler, Tree
+
+def sampler(root):
+    return Sampler(dict(metrics_exporter.DEFAULTS), Tree(root / 'proc', root / 'sys/fs/cgroup'),
+                   None, root / 'setup-timings.json')
+
+def series(text):
+    """{series with labels: value} from the exposition text"""
+    return dict(line.rsplit(' ', 1) for line in text.splitlines() if line and not line.startswith('#'))
+
+def test_fake_tree_series(proc_tree):
+    exporter = sampler(proc_tree)
+    exporter.update()
+    values = series(exporter.text)
+    unit = '{unit="wyoming-satellite"}'
+    arecord = '{unit="wyoming-satellite",command="arecord"}'
+    assert values[f'wyoming_unit_cpu_seconds_total{unit}'] == '7'
+    assert values[f'wyoming_unit_memory_bytes{unit}'] == str(48 * 1024 * 1024)
+    assert values[f'wyoming_unit_processes{unit}'] == '2'
+    assert values[f'wyoming_unit_rss_bytes{unit}'] == str(43 * 1024 * 1024)
+    assert values[f'wyoming_unit_open_fds{unit}'] == '17'
+    assert values[f'wyoming_unit_pss_bytes{unit}'] == str((30 + 2) * 1024 * 1024 + 256 * 1024)
+    assert values[f'wyoming_audio_processes{arecord}'] == '1'
+    assert values[f'wyoming_audio_process_cpu_seconds_total{arecord}'] == '1'
+    assert values[f'wyoming_audio_process_open_fds{arecord}'] == '5'
+    assert values[f'wyoming_audio_process_start_time_seconds{arecord}'] == '1700000050'
+    assert values['wyoming_setup_step_seconds{step="config",status="ran"}'] == '1.25'
+    assert values['wyoming_setup_step_seconds{step="packages",status="skipped"}'] == '0'
+    assert values['wyoming_setup_last_run_timestamp_seconds'] == '1700000500'
+    assert values['wyoming_exporter_samples_total'] == '1'
+    # Audio children are keyed on unit and command only
+    assert 'pid=' not in exporter.text
+    assert 'python3' not in exporter.text
+
+def test_setup_step_without_seconds(proc_tree):
+    (proc_tree / 'setup-timings.json').write_text(json.dumps({'finished': 1700000500, 'steps': [
+        {'name': 'packages', 'status': 'failed', 'seconds': None},
+        {'name': 'config', 'status': 'ran', 'seconds': 1.25}]}))
+    exporter = sampler(proc_tree)
+    exporter.update()
+    values = series(exporter.text)
+    assert 'step="packages"' not in exporter.text
+    assert values['wyoming_setup_step_seconds{step="config",status="ran"}'] == '1.25'
+    assert values['wyoming_unit_processes{unit="wyoming-satellite"}'] == '2'
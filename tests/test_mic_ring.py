@@ -0,0 +1,133 @@
+import array
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import mic_ring
+from mic_ring import CHUNK_BYTES, PacedFile, Reader, Ring, Writer
+
+# Two chunks of slack over the overrun window keep the tests short
+CAPACITY = CHUNK_BYTES * 4
+# Three chunks: the source loops on chunk boundaries, so fills are whole chunks
+SAMPLES = CHUNK_BYTES * 3 // 2
+
+@pytest.fixture
+def source(tmp_path):
+    """A raw file of consecutive 16-bit samples, so order and tearing show in the values"""
+    path = tmp_path / 'counter.raw'
+    path.write_bytes(array.array('h', range(SAMPLES)).tobytes())
+    return path
+
+def expected(source, start, count):
+    """count bytes of the looped source from byte offset start"""
+    audio = source.read_bytes()
+    looped = audio * ((start + count) // len(audio) + 1)
+    return looped[start:start + count]
+
+def drain(reader):
+    data = b''.join(bytes(view) for view in reader.available())
+    assert reader.consumed(len(data))
+    return data
+
+@pytest.fixture
+def ring(tmp_path):
+    return Ring(tmp_path / 'ring', create=True, capacity=CAPACITY)
+
+def test_readers_see_the_same_ordered_frames(ring, source):
+    writer = Writer(ring)
+    readers = [Reader(Ring(ring.path)), Reader(Ring(ring.path))]
+    assert [reader.slot for reader in readers] == [0, 1]
+    paced = PacedFile(source)
+    received = [b'', b'']
+    views = []
+    # Past the end of the source and around the ring several times; the
+    # second reader lags three chunks, so its reads wrap around the ring end
+    for fill in range(12):
+        assert writer.fill(paced)
+        received[0] += drain(readers[0])
+        if fill % 3 == 2:
+            views.append(len(readers[1].available()))
+            received[1] += drain(readers[1])
+    assert ring.write_pos() == 12 * CHUNK_BYTES
+    # Chunks 3-5 and 6-8 cross the end of the four-chunk ring
+    assert views == [1, 2, 2, 1]
+    assert received[0] == received[1] == expected(source, 0, 12 * CHUNK_BYTES)
+    assert all(reader.overruns == 0 for reader in readers)
+
+def test_slow_reader_is_resynced(ring, source):
+    writer = Writer(ring)
+    slow = Reader(Ring(ring.path))
+    paced = PacedFile(source)
+    for _ in range(6):
+        writer.fill(paced)
+
+    # A whole ring behind: skipped to live audio, nothing stale handed out
+    assert slow.available() == []
+    assert (slow.overruns, slow.overrun_bytes, slow.cursor) == (1, 6 * CHUNK_BYTES, 6 * CHUNK_BYTES)
+    assert ring.slot(slow.slot)[1:] == (6 * CHUNK_BYTES, 6 * CHUNK_BYTES, 1)
+    writer.fill(paced)
+    assert drain(slow) == expected(source, 6 * CHUNK_BYTES, CHUNK_BYTES)
+
+    # Lapped while holding views: the read is reported, and the next one is live and aligned
+    assert slow.available() == []
+    writer.fill(paced)
+    views = slow.available()
+    for _ in range(4):
+        writer.fill(paced)
+    assert not slow.consumed(sum(len(view) for view in views))
+    assert slow.overruns == 2
+    writer.fill(paced)
+    assert drain(slow) == expected(source, 12 * CHUNK_BYTES, CHUNK_BYTES)
+
+def test_reader_close_releases_slot(ring):
+    reader = Reader(Ring(ring.path))
+    assert [entry['slot'] for entry in ring.status()['readers']] == [0]
+    reader.close()
+    assert ring.status()['readers'] == []
+    assert Reader(Ring(ring.path)).slot == 0
+
+def run_capture(ring_path, source):
+    script = Path(mic_ring.__file__)
+    process = subprocess.Popen([sys.executable, str(script), '--path', str(ring_path), 'capture',
+                                '--file', str(source), '--config', str(ring_path.parent / 'missing.yaml')])
+    deadline = time.monotonic() + 10
+    while True:
+        assert time.monotonic() < deadline and process.poll() is None
+        try:
+            if Ring(ring_path).status()['writer_pid'] == process.pid:
+                return process
+        except (FileNotFoundError, ValueError):
+            pass  # not created or not sized yet, as open_ring allows for
+        time.sleep(0.05)
+
+def stop(process):
+    process.send_signal(signal.SIGTERM)
+    assert process.wait(timeout=10) == 0
+
+def test_capture_removes_ring_on_exit(tmp_path, source):
+    ring_path = tmp_path / 'ring'
+    stop(run_capture(ring_path, source))
+    assert not ring_path.exists()
+
+def test_capture_keeps_ring_for_attached_reader(tmp_path, source):
+    ring_path = tmp_path / 'ring'
+    process = run_capture(ring_path, source)
+    reader = Reader(Ring(ring_path))
+    stop(process)
+    assert ring_path.exists()
+    status = reader.ring.status()
+    assert status['writer_pid'] is None
+    reader.close()
+    assert Ring(ring_path).remove_if_unused()
+    assert not ring_path.exists()
+
+def test_reader_refuses_removed_ring(ring):
+    opened = Ring(ring.path)
+    assert ring.remove_if_unused()
+    with pytest.raises(FileNotFoundError):
+        Reader(opened)
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+import playback_sink
+import wyoming_tap
+from playback_sink import FileSink, NullSink, Playback
+
+SETTINGS = dict(playback_sink.DEFAULTS, period_ms=5)
+
+class CountingFileSink(FileSink):
+    """A FileSink that records each open and close"""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.opened = []
+        self.closes = 0
+
+    async def open(self, fmt):
+        await super().open(fmt)
+        self.opened.append(fmt)
+
+    async def close(self):
+        self.closes += 1
+        await super().close()
+
+def chunk(index, size=882):
+    """20 ms of 22.05 kHz S16_LE mono, every byte set to index"""
+    return bytes([index]) * size
+
+async def play(playback, *streams):
+    """Send each stream ([(event type, data, payload)]) over its own connection; the played reports"""
+    server = await asyncio.start_server(playback.handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    reports = []
+    async with server:
+        for events in streams:
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            for event_type, data, payload in events:
+                wyoming_tap.write_event(writer, event_type, data, payload)
+            await writer.drain()
+            event_type, data, _ = await asyncio.wait_for(wyoming_tap.read_event(reader), 5)
+            assert event_type == 'played'
+            reports.append(data)
+            writer.close()
+            await writer.wait_closed()
+    return reports
+
+def stream(*chunks, **fmt):
+    return ([('audio-start', fmt, b'')] + [('audio-chunk', fmt, payload) for payload in chunks]
+            + [('audio-stop', {}, b'')])
+
+def test_streams_written_in_order_without_closing(tmp_path):
+    sink = CountingFileSink(tmp_path / 'out.raw')
+    playback = Playback(sink, SETTINGS)
+    fmt = {'rate': 22050, 'width': 2, 'channels': 1}
+    reports = asyncio.run(play(playback, stream(chunk(1), chunk(2), chunk(3), **fmt),
+                               stream(chunk(4), chunk(5), **fmt)))
+    assert (tmp_path / 'out.raw').read_bytes() == b''.join(chunk(index) for index in range(1, 6))
+    assert sink.opened == [(22050, 2, 1)]
+    assert sink.closes == 0
+    assert [report['reopened'] for report in reports] == [True, False]
+    assert [report['audio_seconds'] for report in reports] == [0.06, 0.04]
+    assert all(report['ttfa_ms'] is not None for report in reports)
+    assert playback.stats()['responses'] == 2
+
+def test_format_change_reopens(tmp_path):
+    sink = CountingFileSink(tmp_path / 'out.raw')
+    playback = Playback(sink, SETTINGS)
+    reports = asyncio.run(play(playback, stream(chunk(1), rate=22050, width=2, channels=1),
+                               stream(chunk(2, 640), rate=16000, width=2, channels=1),
+                               # Fields left out are the open format's
+                               stream(chunk(3, 640))))
+    assert sink.opened == [(22050, 2, 1), (16000, 2, 1)]
+    assert sink.closes == 1
+    assert [report['reopened'] for report in reports] == [True, True, False]
+    assert playback.reopens == 2
+    assert (tmp_path / 'out.raw').read_bytes() == chunk(1) + chunk(2, 640) + chunk(3, 640)
+
+def test_unsupported_format_is_rejected(caplog):
+    sink = NullSink()
+    playback = Playback(sink, SETTINGS)
+    with caplog.at_level(logging.WARNING, logger=playback_sink.logger.name):
+        reports = asyncio.run(play(playback, stream(chunk(1), rate=22050, width=7, channels=1),
+                                   stream(chunk(2), rate=0),
+                                   stream(chunk(3))))
+    assert 'unsupported format rate=22050 width=7 channels=1' in caplog.text
+    assert 'unsupported format rate=0' in caplog.text
+    # Rejected streams never open the sink; the valid one opens the initial format
+    assert [report['audio_seconds'] for report in reports] == [0.0, 0.0, 0.02]
+    assert [report['ttfa_ms'] is None for report in reports] == [True, True, False]
+    assert sink.format == playback_sink.DEFAULT_FORMAT
@@ -0,0 +1,84 @@
+import logging
+
+import pytest
+import yaml
+
+import reload_config
+import service_profile
+import setup
+
+CONFIG = {'name': 'kitchen', 'area': 'Kitchen', 'ha_port': 10700, 'wake_word': 'ok_nabu'}
+
+@pytest.fixture
+def node(tmp_path, monkeypatch):
+    """A configured node: config.yaml, the live satellite.yaml and a setup manifest that matches"""
+    systemctl = []
+
+    def fake_run_command(command, shell=False):
+        if not shell and command[0] == 'systemctl':
+            systemctl.append(command[1:])
+            return command[1] != 'is-active', ''
+        return True, ''
+
+    monkeypatch.setattr(setup, 'run_command', fake_run_command)
+    monkeypatch.setattr(reload_config.wyoming_commands, 'wait_for_port', lambda port, timeout: 0.0)
+
+    config_path = tmp_path / 'config.yaml'
+    wyoming_path = tmp_path / 'satellite.yaml'
+    manifest_path = tmp_path / 'setup-manifest.json'
+    wyoming_path.write_text(yaml.safe_dump(setup.render_wyoming_config(CONFIG)))
+    setup.save_manifest({'steps': {name: {'fingerprint': setup.fingerprint(setup.step_inputs(name, CONFIG))}
+                                   for name in setup.ENVIRONMENTS}}, manifest_path)
+
+    def reload(dry_run=False, **changes):
+        config_path.write_text(yaml.safe_dump({'satellite': dict(CONFIG, **changes)}))
+        systemctl.clear()
+        return reload_config.reload(config_path, wyoming_path, dry_run=dry_run,
+                                    unit_dir=tmp_path / 'system', manifest_path=manifest_path)
+
+    return reload, systemctl, tmp_path / 'system'
+
+def restarted(systemctl):
+    return [args[1] for args in systemctl if args[0] == 'restart']
+
+def test_unchanged(node):
+    reload, systemctl, _ = node
+    report = reload()
+    assert report == {'changed': [], 'profile': [], 'setup': [], 'units': [], 'downtime': {}}
+    assert restarted(systemctl) == []
+
+def test_service_profile_writes_dropins_and_restarts(node):
+    reload, systemctl, unit_dir = node
+    report = reload(dry_run=True, service_profile='balanced')
+    assert report['changed'] == []
+    assert set(report['profile']) == set(service_profile.UNITS)
+    assert not unit_dir.exists()
+
+    report = reload(service_profile='balanced')
+    assert service_profile.dropin_path('wyoming-mic', unit_dir).exists()
+    assert ['daemon-reload'] in systemctl
+    # The supervisor and setup are not running, so only the split units restart
+    expected = ['wyoming-mic', 'wyoming-wakeword', 'wyoming-vad-gate', 'wyoming-snd', 'wyoming-satellite']
+    assert report['units'] == expected
+    assert restarted(systemctl) == expected
+    assert systemctl.index(['daemon-reload']) < systemctl.index(['restart', 'wyoming-mic'])
+
+    assert reload(service_profile='balanced')['units'] == []
+    report = reload()
+    assert report['units'] == expected
+    assert not service_profile.dropin_path('wyoming-mic', unit_dir).exists()
+
+def test_setup_inputs_warn(node, caplog):
+    reload, systemctl, _ = node
+    with caplog.at_level(logging.WARNING):
+        report = reload(pyc_invalidation='checked-hash',
+                        repositories={'openwakeword': 'v1.8.2', 'satellite': 'v1.4.1'})
+    assert report['setup'] == list(setup.ENVIRONMENTS)
+    assert report['units'] == []
+    assert restarted(systemctl) == []
+    assert "re-run setup.py" in caplog.text
+
+    with caplog.at_level(logging.WARNING):
+        caplog.clear()
+        report = reload(repositories={'satellite': 'v1.4.1'})
+    assert report['setup'] == ['satellite']
@@ -0,0 +1,88 @@
+import shutil
+import subprocess
+
+import pytest
+
+import repo_fetch
+
+pytestmark = pytest.mark.skipif(shutil.which('git') is None, reason="needs git")
+
+def run_git(*args, cwd):
+    return subprocess.run(['git', '-C', str(cwd), '-c', 'user.name=Test', '-c', 'user.email=test@example.com',
+                           *args], check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout.strip()
+
+def commit(repository, message):
+    (repository / 'version.txt').write_text(f"{message}\n")
+    run_git('add', 'version.txt', cwd=repository)
+    run_git('commit', '-q', '-m', message, cwd=repository)
+    return run_git('rev-parse', 'HEAD', cwd=repository)
+
+@pytest.fixture
+def upstream(tmp_path):
+    """A wyoming-satellite repository with v1 tagged and master two commits ahead, and their commits"""
+    repository = tmp_path / 'upstream' / 'wyoming-satellite'
+    repository.mkdir(parents=True)
+    run_git('init', '-q', '-b', 'master', cwd=repository)
+    commits = {'v1': commit(repository, 'one')}
+    run_git('tag', 'v1', cwd=repository)
+    commit(repository, 'two')
+    commits['master'] = commit(repository, 'three')
+    return repository, commits
+
+def head(checkout):
+    return run_git('rev-parse', 'HEAD', cwd=checkout)
+
+def assert_shallow_detached(checkout):
+    assert run_git('rev-list', '--count', 'HEAD', cwd=checkout) == '1'
+    assert (checkout / '.git' / 'shallow').exists()
+    assert subprocess.run(['git', '-C', str(checkout), 'symbolic-ref', '-q', 'HEAD']).returncode != 0
+
+def test_pinned_shallow_fetch(upstream, tmp_path):
+    upstream, commits = upstream
+    checkout = tmp_path / 'checkout'
+    assert repo_fetch.fetch_checkout(upstream.as_uri(), checkout, 'v1') == commits['v1']
+    assert head(checkout) == commits['v1']
+    assert (checkout / 'version.txt').read_text() == "one\n"
+    assert_shallow_detached(checkout)
+
+def test_changed_ref_refetches(upstream, tmp_path):
+    upstream, commits = upstream
+    checkout = tmp_path / 'checkout'
+    repo_fetch.fetch_checkout(upstream.as_uri(), checkout, 'v1')
+    assert repo_fetch.fetch_checkout(upstream.as_uri(), checkout, 'master') == commits['master']
+    assert (checkout / 'version.txt').read_text() == "three\n"
+    assert_shallow_detached(checkout)
+
+    # A branch ref follows upstream on the next run
+    latest = commit(upstream, 'four')
+    assert repo_fetch.fetch_checkout(upstream.as_uri(), checkout, 'master') == latest
+    assert head(checkout) == latest
+
+def test_same_ref_keeps_checkout(upstream, tmp_path, caplog):
+    upstream, commits = upstream
+    checkout = tmp_path / 'checkout'
+    repo_fetch.fetch_checkout(upstream.as_uri(), checkout, 'v1')
+    with caplog.at_level('INFO', logger=repo_fetch.logger.name):
+        assert repo_fetch.fetch_checkout(upstream.as_uri(), checkout, 'v1') == commits['v1']
+    assert 'already at v1' in caplog.text
+
+def test_mirror_is_used_instead_of_upstream(upstream, tmp_path):
+    upstream, commits = upstream
+    mirrors = tmp_path / 'mirrors'
+    assert repo_fetch.update_mirror(upstream.as_uri(), mirrors)
+    assert (mirrors / 'wyoming-satellite.git' / 'HEAD').exists()
+
+    # The URL is unreachable, so only the mirror can serve it
+    unreachable = (tmp_path / 'offline' / 'wyoming-satellite.git').as_uri()
+    checkout = tmp_path / 'checkout'
+    assert repo_fetch.fetch_checkout(unreachable, checkout, 'v1', mirrors) == commits['v1']
+    assert run_git('remote', 'get-url', 'origin', cwd=checkout) == (mirrors / 'wyoming-satellite.git').as_uri()
+    assert_shallow_detached(checkout)
+
+    latest = commit(upstream, 'four')
+    assert repo_fetch.update_mirror(upstream.as_uri(), mirrors)
+    assert repo_fetch.fetch_checkout(unreachable, checkout, 'master', mirrors) == latest
+
+def test_unreachable_without_mirror_fails(tmp_path):
+    unreachable = (tmp_path / 'offline' / 'wyoming-satellite.git').as_uri()
+    assert repo_fetch.fetch_checkout(unreachable, tmp_path / 'checkout', 'v1', tmp_path / 'mirrors') is None
@@ -0,0 +1,80 @@
+import shutil
+import sys
+import textwrap
+
+import pytest
+
+import system_packages
+
+pytestmark = pytest.mark.skipif(shutil.which('dpkg-query') is None, reason="needs dpkg-query")
+
+STATUS_ENTRY = ("Package: {package}\nStatus: install ok installed\nVersion: 1.0\n"
+                "Architecture: all\nMaintainer: Test <test@example.com>\nDescription: {package}\n\n")
+
+def status_entry(package):
+    return STATUS_ENTRY.format(package=package)
+
+@pytest.fixture
+def admindir(tmp_path):
+    admindir = tmp_path / 'dpkg'
+    admindir.mkdir()
+    (admindir / 'status').write_text(status_entry('python3') + status_entry('sox'))
+    return admindir
+
+@pytest.fixture
+def apt(tmp_path, admindir):
+    """A stub apt command that logs each call and marks its packages installed
+
+    Exits 100 (apt's failure status) for a package named 'broken'.
+    """
+    script = tmp_path / 'apt-stub.py'
+    script.write_text(textwrap.dedent(f"""\
+        import sys
+        packages = sys.argv[1:]
+        with open({str(tmp_path / 'apt.log')!r}, 'a') as log:
+            log.write(' '.join(packages) + '\\n')
+        if 'broken' in packages:
+            sys.stderr.write('E: Unable to locate package broken\\n')
+            sys.exit(100)
+        with open({str(admindir / 'status')!r}, 'a') as status:
+            status.write(''.join({STATUS_ENTRY!r}.format(package=package) for package in packages))
+    """))
+
+    class Apt:
+        command = [sys.executable, str(script)]
+
+        @staticmethod
+        def calls():
+            log = tmp_path / 'apt.log'
+            return log.read_text().splitlines() if log.exists() else []
+
+    return Apt
+
+def test_installed_packages(admindir):
+    assert system_packages.installed_packages(['python3', 'sox', 'alsa-utils'], admindir) == {'python3', 'sox'}
+
+def test_installs_only_missing_in_one_transaction(admindir, apt):
+    success, report = system_packages.reconcile(['python3', 'alsa-utils', 'sox', 'git'], admindir,
+                                                apt_command=apt.command)
+    assert success
+    assert apt.calls() == ['alsa-utils git']
+    assert report['missing'] == ['alsa-utils', 'git']
+    assert set(report['phases']) == {'query', 'install', 'verify'}
+
+def test_nothing_to_install(admindir, apt):
+    success, report = system_packages.reconcile(['python3', 'sox'], admindir, apt_command=apt.command)
+    assert success
+    assert apt.calls() == []
+    assert report['missing'] == []
+    assert set(report['phases']) == {'query'}
+
+def test_install_failure_propagates(admindir, apt):
+    success, report = system_packages.reconcile(['sox', 'broken'], admindir, apt_command=apt.command)
+    assert not success
+    assert apt.calls() == ['broken']
+    assert report['missing'] == ['broken']
+    assert 'verify' not in report['phases']
+
+def test_missing_apt_command_fails(admindir, tmp_path):
+    success, _ = system_packages.reconcile(['git'], admindir, apt_command=[str(tmp_path / 'no-such-apt')])
+    assert not success
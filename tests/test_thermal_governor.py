@@ -0,0 +1,71 @@
+import json
+
+import pytest
+
+import thermal_governor
+from conftest import SYSFS_CPUS as CPUS
+from thermal_governor import Governor, Sysfs
+
+def set_temperature(root, celsius):
+    (root / thermal_governor.THERMAL_DIR / 'thermal_zone0' / 'temp').write_text(f"{int(celsius * 1000)}\n")
+
+@pytest.fixture
+def governor(sysfs, tmp_path):
+    settings = dict(thermal_governor.DEFAULTS, enabled=True)
+    return Governor(settings, Sysfs(sysfs), session_file=tmp_path / 'session',
+                    tap_path=tmp_path / 'wake.json', state_path=tmp_path / 'state.json')
+
+def governors(root):
+    return {(root / thermal_governor.CPUFREQ_DIR / f"policy{cpu}" / 'scaling_governor').read_text().strip()
+            for cpu in range(CPUS)}
+
+def test_idle_session_hot_hysteresis_restore(sysfs, governor):
+    governor.poll()
+    assert governor.state == 'idle'
+    assert governors(sysfs) == {'ondemand'}
+
+    governor.session_file.touch()
+    governor.poll()
+    assert governor.state == 'session'
+    assert governors(sysfs) == {'performance'}
+
+    set_temperature(sysfs, 83)
+    governor.poll()
+    assert governor.state == 'hot'
+    assert governors(sysfs) == {'ondemand'}
+    assert governor.snapshot['throttle_reasons'] == ['temp>=80C']
+
+    # Still inside the hysteresis band (80 - 5), so the session is not boosted
+    set_temperature(sysfs, 77)
+    governor.poll()
+    assert governor.state == 'hot'
+    assert governors(sysfs) == {'ondemand'}
+
+    set_temperature(sysfs, 74)
+    governor.poll()
+    assert governor.state == 'session'
+    assert governors(sysfs) == {'performance'}
+
+    governor.session_file.unlink()
+    governor.poll()
+    assert governor.state == 'idle'
+    assert governor.counts['sessions'] == 1
+    assert governor.counts['sessions_throttled'] == 1
+
+    governor.restore()
+    assert governors(sysfs) == {'schedutil'}
+
+def test_stale_session_file_is_idle(sysfs, governor):
+    governor.session_file.touch()
+    governor.settings['session_timeout'] = 0
+    governor.poll()
+    assert governor.state == 'idle'
+    assert governors(sysfs) == {'ondemand'}
+
+def test_write_state(sysfs, governor):
+    governor.poll()
+    governor.write_state()
+    state = json.loads(governor.state_path.read_text())
+    assert state['state'] == 'idle'
+    assert state['governor_changes'] == CPUS
+    assert [event['event'] for event in state['events']] == ['state']
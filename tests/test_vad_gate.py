@@ -0,0 +1,74 @@
+import array
+import math
+
+from vad_gate import RATE, EnergyVad, Gate
+
+FRAME_BYTES = 960
+
+def tone(amplitude, frequency=440):
+    samples = FRAME_BYTES // 2
+    return array.array('h', (int(amplitude * math.sin(2 * math.pi * frequency * n / RATE))
+                             for n in range(samples))).tobytes()
+
+SILENCE = bytes(FRAME_BYTES)
+SPEECH = tone(8000)
+
+def classify(vad, frames):
+    return [result for frame in frames for result in vad.frames(frame)]
+
+def test_silence_is_never_speech():
+    vad = EnergyVad(threshold=0, trigger_level=1, frame_bytes=FRAME_BYTES)
+    assert classify(vad, [SILENCE] * 20) == [(False, False)] * 20
+
+def test_trigger_level_needs_consecutive_speech():
+    vad = EnergyVad(threshold=2, trigger_level=3, frame_bytes=FRAME_BYTES)
+    results = classify(vad, [SILENCE] * 5 + [SPEECH] * 2 + [SILENCE] + [SPEECH] * 3)
+    assert [speech for speech, _ in results] == [False] * 5 + [True] * 2 + [False] + [True] * 3
+    assert [triggered for _, triggered in results] == [False] * 10 + [True]
+
+def test_threshold_sets_margin_over_noise_floor():
+    # About 10 dB over a steady noise floor: speech at threshold 0 (6 dB), not at 3 (15 dB)
+    noise, louder = tone(100, 3000), tone(316)
+    for threshold, expected in ((0, True), (3, False)):
+        vad = EnergyVad(threshold=threshold, trigger_level=1, frame_bytes=FRAME_BYTES)
+        classify(vad, [noise] * 50)
+        assert classify(vad, [louder]) == [(expected, expected)]
+
+def make_gate(**settings):
+    # 3 frames of pre-roll, 2 frames of hangover
+    return Gate(dict({'threshold': 2, 'trigger_level': 3, 'chunk_size': FRAME_BYTES,
+                      'pre_roll': 3 * FRAME_BYTES / 2 / RATE, 'hangover': 2 * FRAME_BYTES / 2 / RATE},
+                     **settings))
+
+def feed(gate, audio, label):
+    return gate.chunk(label, audio)
+
+def test_gate_replays_pre_roll_then_passes_through_until_hangover():
+    gate = make_gate()
+    for n in range(5):
+        assert feed(gate, SILENCE, f"silence{n}") == []
+    assert feed(gate, SPEECH, 'speech0') == []
+    assert feed(gate, SPEECH, 'speech1') == []
+    # The trigger releases the pre-roll (the chunks before it) in order
+    assert feed(gate, SPEECH, 'speech2') == ['silence4', 'speech0', 'speech1', 'speech2']
+    assert gate.open
+
+    # Open: every chunk passes through unchanged, silence too until the hangover runs out
+    assert feed(gate, SPEECH, 'speech3') == ['speech3']
+    assert feed(gate, SILENCE, 'hang0') == ['hang0']
+    assert feed(gate, SILENCE, 'hang1') == ['hang1']
+    assert feed(gate, SILENCE, 'closed0') == []
+    assert not gate.open
+
+    assert gate.stats() == {'chunks': 12, 'forwarded': 7, 'openings': 1,
+                            'forwarded_fraction': round(7 / 12, 3)}
+
+def test_gate_speech_resets_hangover():
+    gate = make_gate(trigger_level=1)
+    # The first frame sets the noise floor
+    assert feed(gate, SILENCE, 'silence0') == []
+    assert feed(gate, SPEECH, 'speech0') == ['silence0', 'speech0']
+    for n in range(5):
+        assert feed(gate, SILENCE, f"hang{n}a") == [f"hang{n}a"]
+        assert feed(gate, SPEECH, f"speech{n + 1}") == [f"speech{n + 1}"]
+    assert gate.openings == 1